@@ -1,12 +1,14 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 from dcat_service.provenance import provenance_blueprint
 from dcat_service.datasets import datasets_blueprint
 from dcat_service.variables import variables_blueprint
 from dcat_service.knowledge_graph import knowledge_graph_blueprint
 from dcat_service.resources import resources_blueprint
 from dcat_service.standard_variables import standard_variables_blueprint
-from dcat_service.handler import request_handler, _parse_json, find_datasets_handler
+from dcat_service.flask_adapter import handle_flask_request, handle_flask_tile_request
+from dcat_service.misc.metrics import registry, PROMETHEUS_CONTENT_TYPE
 from dcat_service.misc.exception import UnauthorizedException, BadRequestException, InternalServerException
+import os
 import uuid
 import traceback
 
@@ -27,6 +29,16 @@ def render_logo():
     return app.send_static_file('mint_logo.png')
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), status=200, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route("/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def tiles(z, x, y):
+    return handle_flask_tile_request(z, x, y)
+
+
 @app.route("/", defaults={'path': ''})
 @app.route("/<path:path>", methods=["GET"])
 def catch_all(path):
@@ -41,17 +53,9 @@ def get_session_token():
 
 @app.route('/<path:api_endpoint>', methods=['POST'])
 def handle_api_request(api_endpoint):
-    event = {
-        'httpMethod': 'POST',
-        'path': '/' + api_endpoint,
-        'body': request.get_json()
-    }
-    #return event
-    result = request_handler(event, context=None)
-    return result['body'], result['statusCode'], result['headers']
-    #return request_handler(event, context=None)
-    #return request_handler(event, None)
+    return handle_flask_request('/' + api_endpoint)
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=7000, debug=True)
\ No newline at end of file
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=7000, debug=os.environ.get("FLASK_DEBUG", "true").lower() in ("1", "true", "yes"))
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Async entry point: `gunicorn --config gunicorn.conf.py --worker-class aiohttp.GunicornWebWorker async_app:app`
+
+Search and lookup routes that have an async handler are served on the event loop over an asyncpg pool, so one
+worker multiplexes many concurrent queries. All other API routes, and vector tiles, run on a thread pool.
+The web frontend is served by the Flask app (app.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+
+from aiohttp import web
+
+from dcat_service.async_db import close_pool
+from dcat_service.handler import request_handler_async, tile_request_handler
+from dcat_service.misc.exception import BadRequestException
+from dcat_service.misc.metrics import registry, PROMETHEUS_CONTENT_TYPE
+from dcat_service.misc.response import build_post_event, encoded_body, bad_request
+
+SYNC_THREADS = int(os.environ.get("ASYNC_APP_SYNC_THREADS", "8"))
+
+
+def to_aiohttp_response(result: dict) -> web.Response:
+    headers = dict(result['headers'])
+    content_type = headers.pop('Content-Type', None)
+    response = web.Response(body=encoded_body(result), status=result['statusCode'], headers=headers)
+    if content_type is not None:
+        response.headers['Content-Type'] = content_type
+
+    return response
+
+
+async def handle_api_request(request: web.Request) -> web.Response:
+    try:
+        event = build_post_event(request.path, await request.read(), request.headers)
+    except BadRequestException as e:
+        return to_aiohttp_response(bad_request(str(e)))
+
+    return to_aiohttp_response(await request_handler_async(event, request.app['sync_executor']))
+
+
+async def tiles(request: web.Request) -> web.Response:
+    z, x, y = (int(request.match_info[name]) for name in ('z', 'x', 'y'))
+    result = await asyncio.get_event_loop().run_in_executor(
+        request.app['sync_executor'], tile_request_handler, z, x, y, request.query.get('dataset_id'))
+    return to_aiohttp_response(result)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode("utf-8"), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+
+async def on_cleanup(app: web.Application):
+    await close_pool()
+    app['sync_executor'].shutdown(wait=True)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app['sync_executor'] = ThreadPoolExecutor(max_workers=SYNC_THREADS)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get(r'/tiles/{z:\d+}/{x:\d+}/{y:\d+}', tiles)
+    app.router.add_post('/{path:.*}', handle_api_request)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    web.run_app(app, host='0.0.0.0', port=7000)
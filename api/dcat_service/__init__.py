@@ -1,30 +1,11 @@
-from contextlib import contextmanager
-from dcat_service.settings import Settings
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import os
+# The engine and session helpers live in dcat_service.database and are imported on first access, so importing any
+# dcat_service module (the router, the handler) does not pull in SQLAlchemy or read the settings
+_DATABASE_ATTRIBUTES = ("Session", "session_scope", "get_engine", "dispose_engine")
 
-db = Settings.get_instance().database
-db_host = os.environ.get("DB_HOST"),
-db_port = os.environ.get("DB_PORT")
-db_username = os.environ.get("DB_USERNAME")
-db_password = os.environ.get("DB_PASSWORD")
-db_name = os.environ.get("DB_NAME")
 
-connection_string = f"postgresql+psycopg2://{db.user}:{db.password}@{db.host}:{db.port}/{db.db_name}"
-engine = create_engine(connection_string, echo=False)
-Session = sessionmaker(bind=engine, expire_on_commit=False)
+def __getattr__(name):
+    if name in _DATABASE_ATTRIBUTES:
+        from dcat_service import database
+        return getattr(database, name)
 
-
-@contextmanager
-def session_scope():
-    """Provide a transactional scope around a series of operations"""
-    session = Session()
-    try:
-        yield session
-        session.commit()
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
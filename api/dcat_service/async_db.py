@@ -0,0 +1,88 @@
+from typing import *
+import asyncio
+import contextvars
+import functools
+import time
+
+import ujson
+from sqlalchemy.sql import ClauseElement
+
+from dcat_service.misc.sql_profiler import SQL_DURATION, SQL_ROWS
+from dcat_service.prepared_statements import compile_statement
+from dcat_service.router import current_route, current_statement_timeout
+from dcat_service.settings import Settings
+
+# asyncpg is only needed by the async entry point; it is imported when the first pool is created
+_pool = None
+_pool_loop = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+async def _init_connection(connection):
+    # Decode json/jsonb in C, as the synchronous engine does
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(type_name, encoder=ujson.dumps, decoder=ujson.loads, schema="pg_catalog")
+
+
+async def _create_pool():
+    import asyncpg
+
+    db = Settings.get_instance().database
+    # asyncpg prepares every statement server side; behind a transaction pooler the next statement may run on a
+    # server connection that never saw the PREPARE, so the statement cache is disabled there
+    options = {"statement_cache_size": 0} if db.pool.external_pooler else {}
+    return await asyncpg.create_pool(host=db.host, port=int(db.port), user=db.user, password=db.password,
+                                     database=db.db_name, min_size=db.async_pool_min_size,
+                                     max_size=db.async_pool_max_size, init=_init_connection, **options)
+
+
+async def get_pool():
+    """asyncpg pool of the running event loop, created on first use"""
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_event_loop()
+    if _pool is not None and _pool_loop is loop:
+        return _pool
+
+    if _pool_lock is None or _pool_loop is not loop:
+        _pool_lock = asyncio.Lock()
+        _pool_loop = loop
+        _pool = None
+
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await _create_pool()
+
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def fetch(statement: Union[str, ClauseElement], params: Dict[str, Any]=None) -> list:
+    """Run a read-only statement on the pool, honouring the statement timeout of the route being served. asyncpg
+    prepares each distinct SQL text once per connection, so statements of stable shape skip parsing and planning."""
+    sql, args = compile_statement(statement, params)
+    statement_timeout = current_statement_timeout()
+    route = current_route()
+    endpoint = route.path if route is not None else "none"
+
+    pool = await get_pool()
+    start = time.perf_counter()
+    async with pool.acquire() as connection:
+        rows = await connection.fetch(sql, *args,
+                                      timeout=statement_timeout / 1000 if statement_timeout is not None else None)
+
+    SQL_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+    SQL_ROWS.observe(len(rows), endpoint=endpoint)
+    return rows
+
+
+async def run_blocking(function: Callable[..., Any], *args) -> Any:
+    """Run a function making blocking calls (psycopg2 sessions) on the loop's default executor rather than on the
+    event loop, in a copy of the caller's context so it still sees the route being served"""
+    context = contextvars.copy_context()
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(context.run, function, *args))
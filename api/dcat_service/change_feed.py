@@ -0,0 +1,185 @@
+from typing import *
+from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session as OrmSession
+
+from dcat_service.db_models import EventDB
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.metrics import registry
+from dcat_service.settings import Settings
+
+logger = get_logger(__name__)
+
+# Catalog change feed. Controllers that modify the catalog record a change in the events table, in the transaction
+# making the modification. Subscribers (caches, derived indexes) hear about changes committed in this process right
+# after the commit, and about changes committed by other processes when they poll the table.
+
+CATALOG_CHANGE = "catalog_change"
+
+# Changes recorded in a session, published once it commits
+_PENDING_CHANGES_KEY = "catalog_changes"
+
+CHANGES_RECEIVED = registry.counter(
+    "dcat_catalog_changes_total", "Catalog changes delivered to subscribers, by origin: local or remote",
+    ("origin",))
+
+_POLL_QUERY = text("""
+    SELECT id, timestamp, event_value FROM events
+    WHERE event_type = :event_type
+      AND timestamp > COALESCE(CAST(:since AS timestamp), LOCALTIMESTAMP - make_interval(secs => :overlap))
+    ORDER BY timestamp
+""")
+
+
+class CatalogChange:
+    """dataset_ids is None when every dataset may have changed. membership is True when the change can alter which
+    records a query matches (new records, renamed ones, different search text), rather than only the content of
+    records already returned."""
+
+    def __init__(self, change_id: str, dataset_ids: Optional[FrozenSet[str]], membership: bool):
+        self.change_id = change_id
+        self.dataset_ids = dataset_ids
+        self.membership = membership
+
+    @staticmethod
+    def from_event_value(change_id: str, value: dict) -> 'CatalogChange':
+        dataset_ids = value.get("dataset_ids")
+        return CatalogChange(change_id, frozenset(dataset_ids) if dataset_ids is not None else None,
+                             bool(value.get("membership", True)))
+
+    def to_event_value(self) -> dict:
+        return {"dataset_ids": sorted(self.dataset_ids) if self.dataset_ids is not None else None,
+                "membership": self.membership}
+
+    def __repr__(self):
+        return f"CatalogChange({self.change_id}, dataset_ids={self.dataset_ids}, membership={self.membership})"
+
+
+_subscribers: List[Callable[[CatalogChange], None]] = []
+
+
+def subscribe(callback: Callable[[CatalogChange], None]):
+    _subscribers.append(callback)
+
+
+def _publish(change: CatalogChange, origin: str):
+    CHANGES_RECEIVED.inc(origin=origin)
+    for callback in list(_subscribers):
+        try:
+            callback(change)
+        except Exception:
+            logger.exception("Catalog change subscriber failed")
+
+
+def record_change(session, dataset_ids: Optional[Iterable[Any]]=None, membership: bool=True):
+    """Record a catalog change in the session's transaction. dataset_ids=None means the whole catalog."""
+    if dataset_ids is not None:
+        dataset_ids = frozenset(str(dataset_id) for dataset_id in dataset_ids)
+    change = CatalogChange(str(uuid.uuid4()), dataset_ids, membership)
+
+    session.add(EventDB(id=change.change_id, event_type=CATALOG_CHANGE, event_value=change.to_event_value(),
+                        timestamp=func.clock_timestamp()))
+    session.info.setdefault(_PENDING_CHANGES_KEY, []).append(change)
+    _prune(session)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_committed_changes(session):
+    changes = session.info.pop(_PENDING_CHANGES_KEY, [])
+    for change in changes:
+        _feed.mark_seen(change.change_id)
+        _publish(change, "local")
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop(_PENDING_CHANGES_KEY, None)
+
+
+class _ChangeFeedReader:
+    """Reads changes committed by other processes. The timestamp of a change is taken before its transaction
+    commits, so changes are re-read for an overlap window after the newest one seen and de-duplicated by id."""
+
+    def __init__(self):
+        self._poll_lock = threading.Lock()
+        self._seen_lock = threading.Lock()
+        self._polled_at = None
+        self._watermark: Optional[datetime] = None
+        # change id -> timestamp of the changes inside the overlap window; None for changes published locally and
+        # not read back yet
+        self._seen: Dict[str, Optional[datetime]] = {}
+
+    def mark_seen(self, change_id: str):
+        with self._seen_lock:
+            self._seen.setdefault(change_id, None)
+
+    def poll_due(self) -> bool:
+        """Whether poll() would read the events table, rather than return within the poll interval"""
+        interval = Settings.get_instance().cache.change_poll_interval
+        return self._polled_at is None or time.monotonic() - self._polled_at >= interval
+
+    def poll(self, force: bool=False):
+        """Publish changes committed since the last poll; a no-op when called again within the poll interval"""
+        settings = Settings.get_instance().cache
+        now = time.monotonic()
+        if not force and not self.poll_due():
+            return
+
+        # One poll at a time; other threads go on with the changes applied so far
+        if not self._poll_lock.acquire(blocking=force):
+            return
+
+        try:
+            self._polled_at = now
+            self._poll(settings.change_overlap_seconds)
+        finally:
+            self._poll_lock.release()
+
+    def _poll(self, overlap_seconds: float):
+        from dcat_service import session_scope
+
+        since = self._watermark - timedelta(seconds=overlap_seconds) if self._watermark is not None else None
+        with session_scope() as session:
+            rows = session.execute(_POLL_QUERY, {"event_type": CATALOG_CHANGE, "since": since,
+                                                 "overlap": overlap_seconds}).fetchall()
+
+        for change_id, timestamp, value in rows:
+            change_id = str(change_id)
+            self._watermark = max(self._watermark, timestamp) if self._watermark is not None else timestamp
+            with self._seen_lock:
+                is_new = change_id not in self._seen
+                self._seen[change_id] = timestamp
+
+            if is_new:
+                _publish(CatalogChange.from_event_value(change_id, value or {}), "remote")
+
+        if self._watermark is not None:
+            horizon = self._watermark - timedelta(seconds=overlap_seconds)
+            with self._seen_lock:
+                self._seen = {change_id: timestamp for change_id, timestamp in self._seen.items()
+                              if timestamp is None or timestamp > horizon}
+
+
+_feed = _ChangeFeedReader()
+
+
+def poll(force: bool=False):
+    _feed.poll(force)
+
+
+def poll_due() -> bool:
+    """Whether poll() would query the database; callers on an event loop then run it on a thread"""
+    return _feed.poll_due()
+
+
+def _prune(session):
+    """Delete changes older than the retention period"""
+    retention_hours = Settings.get_instance().cache.change_retention_hours
+    session.query(EventDB) \
+        .filter(EventDB.event_type == CATALOG_CHANGE,
+                EventDB.timestamp < func.localtimestamp() - timedelta(hours=retention_hours)) \
+        .delete(synchronize_session=False)
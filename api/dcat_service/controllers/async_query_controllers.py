@@ -0,0 +1,73 @@
+from typing import *
+
+from dcat_service.async_db import fetch, run_blocking
+from dcat_service.controllers.query_controllers import build_find_datasets_query, format_find_datasets, \
+    build_dataset_resources_query, format_dataset_resources, build_search_datasets_query, format_search_datasets
+from dcat_service.controllers.query_controllers_v2 import build_search_datasets_v2_query, format_search_datasets_v2, \
+    search_datasets_v2_page, search_datasets_v2_facets
+from dcat_service.misc.cursor import Page
+from dcat_service.misc.exception import InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.settings import Settings
+
+logger = get_logger(__name__)
+
+# Coroutine versions of the read-only controllers. Validation, query building and result formatting are shared with
+# the synchronous controllers; only statement execution differs.
+
+
+async def _build_search_query(build: Callable[[dict, Page], Any], query_definition: dict, page: Page) -> Any:
+    """With SEARCH_ENGINE=memory, building a keyword search brings the search index up to date: it reads the change
+    feed and may load the whole catalog with psycopg2, so it runs on a thread rather than stall the event loop"""
+    if query_definition.get("search_query") is not None and Settings.get_instance().search.engine == "memory":
+        return await run_blocking(build, query_definition, page)
+
+    return build(query_definition, page)
+
+
+async def find_datasets_async(query_definition: Dict) -> Dict:
+    page = Page.from_query_definition("find_datasets", query_definition, 20, 2)
+    statement = build_find_datasets_query(query_definition, page)
+
+    try:
+        return format_find_datasets(await fetch(statement), page)
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+async def dataset_resources_async(query_definition: dict) -> dict:
+    statement = build_dataset_resources_query(query_definition)
+
+    try:
+        return format_dataset_resources(query_definition['dataset_id'], await fetch(statement))
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+async def search_datasets_async(query_definition: dict) -> dict:
+    page = Page.from_query_definition("search_datasets", query_definition, 500, 3)
+    datasets_query = await _build_search_query(build_search_datasets_query, query_definition, page)
+
+    try:
+        return format_search_datasets(await fetch(*datasets_query), page)
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+async def search_datasets_v2_async(query_definition: dict) -> Union[list, dict]:
+    page = search_datasets_v2_page(query_definition)
+    datasets_query = await _build_search_query(build_search_datasets_v2_query, query_definition, page)
+
+    try:
+        return format_search_datasets_v2(await fetch(*datasets_query), page,
+                                         search_datasets_v2_facets(query_definition))
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
@@ -5,6 +5,7 @@ import sys
 import traceback
 
 from dcat_service import session_scope
+from dcat_service.change_feed import record_change
 from dcat_service.models.dataset import Dataset
 from dcat_service.models.resource import Resource
 
@@ -51,6 +52,7 @@ def delete_resource(delete_definition: Dict) -> Dict:
             session.execute(f"DELETE FROM temporal_coverage_index WHERE indexed_id = '{str(resource_id)}'")
             session.execute( f"DELETE FROM resources_variables WHERE resource_id = '{str(resource_id)}'")
             session.execute(f"DELETE FROM resources WHERE id = '{str(resource_id)}'")
+            record_change(session, dataset_ids=[resource.dataset_id], membership=False)
 
             return {"result": "success"}
 
@@ -122,5 +124,6 @@ def delete_dataset(delete_definition: Dict) -> Dict:
 
             # Delete dataset
             session.execute(f"DELETE FROM datasets WHERE id = '{str(dataset_id)}'")
+            record_change(session, dataset_ids=[dataset_id])
 
             return {"result": "success"}
@@ -0,0 +1,136 @@
+from typing import *
+from datetime import date, datetime
+import time
+import ujson
+
+from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.cursor import Page
+from dcat_service import session_scope
+from dcat_service.controllers.query_controllers import build_find_datasets_old_query, format_find_datasets_old
+from dcat_service.controllers.query_controllers_v2 import search_datasets_v2_page, search_datasets_v2_facets, \
+    build_search_datasets_v2_query, format_search_datasets_v2
+from dcat_service.prepared_statements import compile_statement, execute_prepared
+
+logger = get_logger(__name__)
+
+
+def _build_search_datasets_v2(query_definition: dict):
+    page = search_datasets_v2_page(query_definition)
+    statement, params = build_search_datasets_v2_query(query_definition, page)
+    facets = search_datasets_v2_facets(query_definition)
+
+    return statement, params, lambda session: execute_prepared(session, statement, params).fetchall(), \
+        lambda rows: format_search_datasets_v2(rows, page, facets)
+
+
+def _build_find_datasets_old(query_definition: dict):
+    page = Page.from_query_definition("find_datasets_old", query_definition, 20, 2)
+    statement = build_find_datasets_old_query(query_definition, page)
+
+    return statement, None, lambda session: session.execute(statement).fetchall(), \
+        lambda rows: format_find_datasets_old(rows, page)
+
+
+# Endpoint -> function building (statement, params, execute(session) -> rows, format(rows) -> response) of a query
+# definition, the way the endpoint's controller does
+EXPLAINABLE_ENDPOINTS = {
+    "search_v2": _build_search_datasets_v2,
+    "find_datasets_old": _build_find_datasets_old
+}
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    return str(value)
+
+
+def _explain_analyze(session, statement, params: Optional[Dict[str, Any]]) -> Any:
+    """EXPLAIN (ANALYZE, BUFFERS) of the statement, run on the session's connection inside a savepoint"""
+    compiled = statement.compile(dialect=session.bind.dialect)
+    parameters = compiled.construct_params(params)
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT explain_query")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled.string}", parameters)
+            plan = cursor.fetchone()[0]
+            cursor.execute("RELEASE SAVEPOINT explain_query")
+            return plan
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_query")
+            raise
+    finally:
+        cursor.close()
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def explain_query(definition: dict) -> dict:
+    """Run a query definition of an explainable endpoint and return its SQL, bound parameters, plan and where its time
+    went: parsing (validation and statement building), the database, post-processing of the rows and serialization"""
+    endpoint = definition.get("endpoint")
+    query_definition = definition.get("query")
+
+    if endpoint not in EXPLAINABLE_ENDPOINTS:
+        raise BadRequestException({'InvalidQueryDefinition': f"Invalid value for 'endpoint': {endpoint}; must be "
+                                                             f"either of {sorted(EXPLAINABLE_ENDPOINTS)}"})
+    if not isinstance(query_definition, dict):
+        raise BadRequestException({'InvalidQueryDefinition': f"'query' must be an object; received {query_definition}"})
+
+    start = time.perf_counter()
+    # Paging fields are popped from the query definition
+    statement, params, execute, format_rows = EXPLAINABLE_ENDPOINTS[endpoint](dict(query_definition))
+    parse_ms = _elapsed_ms(start)
+
+    try:
+        with session_scope(read_only=True) as session:
+            start = time.perf_counter()
+            rows = execute(session)
+            db_ms = _elapsed_ms(start)
+
+            plan = _explain_analyze(session, statement, params)
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+    start = time.perf_counter()
+    response = format_rows(rows)
+    post_processing_ms = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    serialized = ujson.dumps(response)
+    serialization_ms = _elapsed_ms(start)
+
+    sql, parameters = compile_statement(statement, params)
+    plan_root = plan[0] if isinstance(plan, list) and len(plan) > 0 else {}
+
+    return {
+        "result": "success",
+        "endpoint": endpoint,
+        "sql": sql,
+        "parameters": _json_value(parameters),
+        "plan": plan,
+        "rows": len(rows),
+        "response_bytes": len(serialized),
+        "timing_ms": {
+            "parse": parse_ms,
+            "db": db_ms,
+            "planning": plan_root.get("Planning Time"),
+            "execution": plan_root.get("Execution Time"),
+            "post_processing": post_processing_ms,
+            "serialization": serialization_ms,
+            "total": round(parse_ms + db_ms + post_processing_ms + serialization_ms, 3)
+        }
+    }
@@ -0,0 +1,44 @@
+from typing import *
+import re
+
+from sqlalchemy import and_, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+# Name filters ("dataset_names__in", "standard_variable_names__in", "name__in") match a name as a word: the pattern
+# must be delimited by the start or end of the name, whitespace, '_' or '-', and '*' matches any run of characters.
+#
+# The word boundaries need a regex, which a btree index cannot serve. Every pattern is therefore also translated into
+# an ILIKE '%...%' predicate, which the pg_trgm GIN indexes on datasets.name and standard_variables.name
+# (postgres/migrations/001_name_trigram_indexes.sql) answer; the regex then only rechecks the candidate rows.
+
+_WORD_START = r"(^|\s|_|\-)"
+_WORD_END = r"($|\s|_|\-)"
+
+# pg_trgm extracts trigrams from alphanumeric runs: a pattern without a run of 3 cannot narrow the index scan
+_TRIGRAM_RUN = re.compile(r"[^\W_]{3}")
+
+
+def name_regex(names: Iterable[Any]) -> str:
+    """One case-insensitive alternative per name, delimited as a word, with '*' as '.*'"""
+    return "|".join(_WORD_START + re.escape(str(name)).replace(r"\*", ".*") + _WORD_END for name in names)
+
+
+def like_pattern(name: Any) -> str:
+    """'air*temp' => '%air%temp%'; LIKE wildcards and the escape character in names are literal"""
+    parts = [part.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for part in str(name).split("*")]
+    return "%" + "%".join(part for part in parts if part) + "%"
+
+
+def is_trigram_indexable(name: Any) -> bool:
+    return any(_TRIGRAM_RUN.search(part) for part in str(name).split("*"))
+
+
+def name_match_clause(column: ColumnElement, names: Sequence[Any]) -> ColumnElement:
+    """Filter on column matching any of the name patterns. The ILIKE prefilter is only added when every pattern can
+    use the trigram index; a single unindexable alternative would turn the OR into a sequential scan anyway."""
+    regex_match = column.op("~*")(name_regex(names))
+
+    if not names or not all(is_trigram_indexable(name) for name in names):
+        return regex_match
+
+    return and_(or_(*[column.ilike(like_pattern(name)) for name in names]), regex_match)
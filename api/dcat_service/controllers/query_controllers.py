@@ -1,17 +1,20 @@
 from typing import *
-import sys
-import traceback
 from datetime import datetime
 import uuid
 import ujson
 
-from sqlalchemy import func
+from sqlalchemy import func, cast
 from sqlalchemy import and_
-from sqlalchemy.sql.expression import case, literal
+from sqlalchemy.sql.expression import case, literal, tuple_
 from sqlalchemy import desc
 from sqlalchemy import JSON, TIMESTAMP, DateTime
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
 
 from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.cursor import Page
 from dcat_service.db_models import DatasetDB, StandardVariableDB, TemporalCoverageIndexDB, SpatialCoverageIndexDB, \
     VariableDB, ResourceDB
 from dcat_service.models.dataset import Dataset
@@ -20,7 +23,13 @@ from dcat_service.models.variable import Variable
 from dcat_service.models.standard_variable import StandardVariable
 
 from dcat_service import session_scope
-import re
+from dcat_service.controllers.search_queries import build_select_datasets_statement, DATASET_COLUMNS, \
+    search_sort_key, parse_candidate_budget, build_temporal_histogram_statement, MAX_TEMPORAL_HISTOGRAM_BUCKETS
+from dcat_service.controllers.name_matching import name_match_clause
+from dcat_service.prepared_statements import execute_prepared
+from dcat_service.query_geometry import query_geometry, spatial_filter
+
+logger = get_logger(__name__)
 
 
 def _validate_uuid(input_string: str) -> bool:
@@ -31,16 +40,83 @@ def _validate_uuid(input_string: str) -> bool:
         return False
 
 
+def _page_offset(query_definition: Dict, page: Page) -> int:
+    offset = int(query_definition.pop("offset", 0))
+    if offset and page.after is not None:
+        raise BadRequestException({'InvalidQueryDefinition': "'offset' cannot be combined with 'cursor'"})
+
+    return offset
+
+
+def _source_url_after(page: Page) -> Optional[Tuple[int, str]]:
+    """Validated keyset of a cursor issued by _order_by_source_url"""
+    if page.after is None:
+        return None
+
+    has_source_url, dataset_id = page.after
+    if has_source_url not in (0, 1) or not _validate_uuid(dataset_id):
+        raise BadRequestException({'InvalidQueryDefinition': f"Invalid cursor position: {page.after}"})
+
+    return has_source_url, str(dataset_id)
+
+
+def _order_by_source_url(query: Query, after: Optional[Tuple[int, str]]) -> Query:
+    """Datasets that have a 'source_url' first, then by id; (has_source_url, id) is the keyset of a page, and is
+    selected as the last column so the cursor can be built from the last row"""
+    has_source_url = case([(DatasetDB.json_metadata.has_key('source_url'), 1)], else_=0)
+    if after is not None:
+        query = query.filter(tuple_(has_source_url, DatasetDB.id) < tuple_(*after))
+
+    has_source_url_column = has_source_url.label("has_source_url")
+    return query.add_columns(has_source_url_column).order_by(has_source_url_column.desc(), DatasetDB.id.desc())
+
+
+def _temporal_range_filter(coverage, field_name: str, op: str, value: datetime):
+    """Comparison of the start or end of a temporal coverage range [start, end] with a time, as a containment or
+    overlap test against an open-ended range, which GiST indexes on the range answer: e.g. start >= t when the
+    coverage is contained in [t, infinity), end >= t when it overlaps it"""
+    if op in ("gte", "gt"):
+        period = func.tsrange(cast(value, TIMESTAMP), None, "[)" if op == "gte" else "()")
+    else:
+        period = func.tsrange(None, cast(value, TIMESTAMP), "(]" if op == "lte" else "()")
+
+    # start >= t and end <= t hold for every time of the coverage; start <= t and end >= t for some
+    contained = (field_name == "start_time") == (op in ("gte", "gt"))
+    return coverage.op("<@" if contained else "&&")(period)
+
+
+def _source_url_sort_key(row) -> tuple:
+    return row[-1], row[0]
+
+
 def find_datasets_old(query_definition: Dict) -> Dict:
+    page = Page.from_query_definition("find_datasets_old", query_definition, 20, 2)
+    statement = build_find_datasets_old_query(query_definition, page)
+
+    # execute the query
+    try:
+        with session_scope(read_only=True) as session:
+            logger.debug("%s", statement)
+            results = session.execute(statement).fetchall()
+
+        return format_find_datasets_old(results, page)
 
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+def build_find_datasets_old_query(query_definition: Dict, page: Page) -> Select:
+    """Validate a /datasets/find query definition and build the statement of the requested page"""
     if len(query_definition) == 0:
         raise BadRequestException({'InvalidQueryDefinition': f"Query definition must not be empty; received {query_definition}"})
     # parse query operators
     # search_ops = body.pop('search_operators', "and").lower()
     # sort_by = body.pop("sort_by", None)
     # assert search_ops == "or" or search_ops == "and"
-    limit = int(query_definition.pop("limit", 20))
-    offset = int(query_definition.pop("offset", 0))
+    limit = page.limit
+    offset = _page_offset(query_definition, page)
+    after = _source_url_after(page)
     fields: Dict[str, dict] = {}
     for field_w_op, value in query_definition.items():
         if field_w_op.rfind("__") == -1:
@@ -147,145 +223,113 @@ def find_datasets_old(query_definition: Dict) -> Dict:
             help_msg = "must be formatted according to ISO8601: '%Y-%m-%dT%H:%M:%S'"
             raise BadRequestException({'InvalidQueryDefinition': f"Invalid datetime format for 'end_time': {fields['end_time']['value']}; {help_msg}"})
 
+    query = Query([DatasetDB.id, DatasetDB.name, DatasetDB.description, DatasetDB.json_metadata, func.ST_AsGeoJSON(DatasetDB.spatial_coverage)])
+
+    query = query.filter(DatasetDB.provenance_id != 'e8287ea4-e6f2-47aa-8bfc-0c22852735c8')
+
+    # query = query.filter(ResourceDB.is_queryable.is_(True))
+    if "dataset_names" in fields:
+        query = query.filter(name_match_clause(DatasetDB.name, fields['dataset_names']['value']))
+
+    if "dataset_ids" in fields:
+        query = query.filter(DatasetDB.id.in_(fields['dataset_ids']['value']))
+
+    if "standard_variable_ids" in fields or "standard_variable_names" in fields:
+
+        query = query.join(VariableDB, DatasetDB.id == VariableDB.dataset_id) \
+            .join(StandardVariableDB, VariableDB.standard_variables)
+
+        if "standard_variable_ids" in fields:
+            query = query.filter(StandardVariableDB.id.in_(fields['standard_variable_ids']['value']))
+
+        if "standard_variable_names" in fields:
+            query = query.filter(name_match_clause(StandardVariableDB.name,
+                                                   fields['standard_variable_names']['value']))
+
+    if "start_time" in fields or "end_time" in fields:
+        # filter out datasets that have too many resources (based on provenance_id)
+        for field_name in ("start_time", "end_time"):
+            if field_name in fields:
+                query = query.filter(_temporal_range_filter(DatasetDB.temporal_coverage, field_name,
+                                                            fields[field_name]["op"], fields[field_name]["value"]))
+
+    if "spatial_coverage" in fields:
+        # how do we represent global ? null or generate a value..?
+        # filter out datasets with too many resources (based on provenance_id)
+        query = query.filter(spatial_filter(DatasetDB.spatial_coverage, fields["spatial_coverage"]["op"],
+                                            query_geometry(fields["spatial_coverage"]["value"]),
+                                            DatasetDB.LOCATION_SRID))
+    query = _order_by_source_url(query, after)
+    query = query.limit(limit).offset(offset)
+    return query.statement
+
+
+def format_find_datasets_old(results, page: Page) -> Dict:
+    results_json = []
+    datasets_summary = {}
+    for row in results:
+        if row[4] is None:
+            dataset_spatial_coverage = {}
+        else:
+            dataset_spatial_coverage = ujson.loads(row[4])
+
+        dataset_id = str(row[0])
+        dataset_name = str(row[1])
+        dataset_description = str(row[2])
+        dataset_metadata = row[3]
+        combined_metadata = {
+            "dataset_description": dataset_description,
+            "dataset_spatial_coverage": dataset_spatial_coverage,
+            **dataset_metadata
+        }
+        if dataset_id not in datasets_summary:
+            datasets_summary[dataset_id] = {"dataset_id": dataset_id, "dataset_name": dataset_name, "dataset_metadata": combined_metadata}
+
+        #
+        # record = {
+        #     "dataset_id": dataset_id,
+        #     "dataset_name": dataset_name,
+        #     "dataset_description": dataset_description,
+        #     "dataset_metadata": row[3],
+        #     "dataset_spatial_coverage": dataset_spatial_coverage,
+        #     "resource_id": str(row[5]),
+        #     "resource_name": str(row[6]),
+        #     "resource_data_url": str(row[7]),
+        #     "resource_metadata": row[8]
+        # }
+        # results_json.append(record)
+
+    return {"result": "success", "datasets": list(datasets_summary.values()),
+            "next_cursor": page.next_cursor(results, _source_url_sort_key)}
+
+
+def find_datasets(query_definition: Dict) -> Dict:
+    page = Page.from_query_definition("find_datasets", query_definition, 20, 2)
+    statement = build_find_datasets_query(query_definition, page)
+
     # execute the query
     try:
-        with session_scope() as session:
-            query = session.query(DatasetDB.id, DatasetDB.name, DatasetDB.description, DatasetDB.json_metadata, func.ST_AsGeoJSON(DatasetDB.spatial_coverage))
-
-            query = query.filter(DatasetDB.provenance_id != 'e8287ea4-e6f2-47aa-8bfc-0c22852735c8')
-
-            # query = query.filter(ResourceDB.is_queryable.is_(True))
-            if "dataset_names" in fields:
-                dataset_names = ['(^|\s|_|\-)' + re.escape(dataset_name).replace(r"\*", ".*") + '($|\s|_|\-)' for dataset_name in fields['dataset_names']['value']]
-
-                query = query.filter(DatasetDB.name.op("~*")("|".join(dataset_names)))
-
-            if "dataset_ids" in fields:
-                query = query.filter(DatasetDB.id.in_(fields['dataset_ids']['value']))
-
-            if "standard_variable_ids" in fields or "standard_variable_names" in fields:
-
-                query = query.join(VariableDB, DatasetDB.id == VariableDB.dataset_id) \
-                    .join(StandardVariableDB, VariableDB.standard_variables)
-
-                if "standard_variable_ids" in fields:
-                    query = query.filter(StandardVariableDB.id.in_(fields['standard_variable_ids']['value']))
-
-                if "standard_variable_names" in fields:
-                    standard_variable_names = ['(^|\s|_|\-)' + re.escape(sv_name).replace(r"\*", ".*") + '($|\s|_|\-)' for sv_name in fields['standard_variable_names']['value']]
-                    query = query.filter(StandardVariableDB.name.op("~*")("|".join(standard_variable_names)))
-
-            if "start_time" in fields or "end_time" in fields:
-                # filter out datasets that have too many resources (based on provenance_id)
-
-                if "start_time" in fields:
-                    if fields["start_time"]["op"] == "gte":
-                        query = query.filter(DatasetDB.temporal_coverage_start >= fields["start_time"]['value'])
-                    elif fields["start_time"]["op"] == "gt":
-                        query = query.filter(DatasetDB.temporal_coverage_start > fields["start_time"]['value'])
-                    elif fields["start_time"]["op"] == "lte":
-                        query = query.filter(DatasetDB.temporal_coverage_start <= fields["start_time"]['value'])
-                    elif fields["start_time"]["op"] == "lt":
-                        query = query.filter(DatasetDB.temporal_coverage_start < fields["start_time"]['value'])
-                    # if in json metadata, but hard to index this way value
-                    # elif fields["start_time"]["op"] == "lt":
-                    #     query = query.filter(DatasetDB.json_metadata['temporal_coverage', 'start_time'].astext.cast(TIMESTAMP) < fields["start_time"]['value'])
-                    else:
-                        raise Exception("Invalid operator")
-                if "end_time" in fields:
-                    if fields["end_time"]["op"] == "gte":
-                        query = query.filter(DatasetDB.temporal_coverage_end >= fields["end_time"]['value'])
-                    elif fields["end_time"]["op"] == "gt":
-                        query = query.filter(DatasetDB.temporal_coverage_end > fields["end_time"]['value'])
-                    elif fields["end_time"]["op"] == "lte":
-                        query = query.filter(DatasetDB.temporal_coverage_end <= fields["end_time"]['value'])
-                    elif fields["end_time"]["op"] == "lt":
-                        query = query.filter(DatasetDB.temporal_coverage_end < fields["end_time"]['value'])
-                    else:
-                        raise Exception("Invalid operator")
-
-            if "spatial_coverage" in fields:
-                # how do we represent global ? null or generate a value..?
-                # filter out datasets with too many resources (based on provenance_id)
-
-                if fields["spatial_coverage"]["op"] == "within" and isinstance(fields['spatial_coverage']['value'], list):
-                    query = query.filter(DatasetDB.spatial_coverage.ST_Within(
-                        func.ST_Makeenvelope(*fields['spatial_coverage']['value'],
-                                             DatasetDB.LOCATION_SRID)))
-
-                elif fields["spatial_coverage"]["op"] == "within" and isinstance(fields['spatial_coverage']['value'], dict):
-                    query = query.filter(DatasetDB.spatial_coverage.ST_Within(
-                            func.st_setsrid(
-                                func.ST_geomfromgeojson(ujson.dumps(fields['spatial_coverage']['value'])),
-                                DatasetDB.LOCATION_SRID))
-                    )
-
-                elif fields["spatial_coverage"]["op"] == "intersects" and isinstance(fields['spatial_coverage']['value'], list):
-                    query = query.filter(DatasetDB.spatial_coverage.ST_Intersects(
-                        func.ST_Makeenvelope(*fields['spatial_coverage']['value'],
-                                             DatasetDB.LOCATION_SRID)))
-
-                elif fields["spatial_coverage"]["op"] == "intersects" and isinstance(fields['spatial_coverage']['value'], dict):
-                    query = query.filter(DatasetDB.spatial_coverage.ST_Intersects(
-                        func.st_setsrid(
-                            func.ST_geomfromgeojson(ujson.dumps(fields['spatial_coverage']['value'])),
-                            DatasetDB.LOCATION_SRID))
-                    )
-            query = query.order_by(case([(DatasetDB.json_metadata.has_key('source_url'), 1)], else_=0).desc())
-            query = query.limit(limit).offset(offset)
-            print(query)
-            results = query.all()
+        with session_scope(read_only=True) as session:
+            logger.debug("%s", statement)
+            results = session.execute(statement).fetchall()
 
-        results_json = []
-        datasets_summary = {}
-        for row in results:
-            if row[4] is None:
-                dataset_spatial_coverage = {}
-            else:
-                dataset_spatial_coverage = ujson.loads(row[4])
-
-            dataset_id = str(row[0])
-            dataset_name = str(row[1])
-            dataset_description = str(row[2])
-            dataset_metadata = row[3]
-            combined_metadata = {
-                "dataset_description": dataset_description,
-                "dataset_spatial_coverage": dataset_spatial_coverage,
-                **dataset_metadata
-            }
-            if dataset_id not in datasets_summary:
-                datasets_summary[dataset_id] = {"dataset_id": dataset_id, "dataset_name": dataset_name, "dataset_metadata": combined_metadata}
-
-            #
-            # record = {
-            #     "dataset_id": dataset_id,
-            #     "dataset_name": dataset_name,
-            #     "dataset_description": dataset_description,
-            #     "dataset_metadata": row[3],
-            #     "dataset_spatial_coverage": dataset_spatial_coverage,
-            #     "resource_id": str(row[5]),
-            #     "resource_name": str(row[6]),
-            #     "resource_data_url": str(row[7]),
-            #     "resource_metadata": row[8]
-            # }
-            # results_json.append(record)
-
-        return {"result": "success", "datasets": list(datasets_summary.values())}
+        return format_find_datasets(results, page)
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
-def find_datasets(query_definition: Dict) -> Dict:
+def build_find_datasets_query(query_definition: Dict, page: Page) -> Select:
+    """Validate a find_datasets query definition and build the statement of the requested page"""
     if len(query_definition) == 0:
         raise BadRequestException({'InvalidQueryDefinition': f"Query definition must not be empty; received {query_definition}"})
     # parse query operators
     # search_ops = body.pop('search_operators', "and").lower()
     # sort_by = body.pop("sort_by", None)
     # assert search_ops == "or" or search_ops == "and"
-    limit = int(query_definition.pop("limit", 20))
-    offset = int(query_definition.pop("offset", 0))
+    offset = _page_offset(query_definition, page)
+    after = _source_url_after(page)
     fields: Dict[str, dict] = {}
     for field_w_op, value in query_definition.items():
         if field_w_op.rfind("__") == -1:
@@ -349,51 +393,42 @@ def find_datasets(query_definition: Dict) -> Dict:
             raise BadRequestException({'InvalidQueryDefinition':
                 f"Invalid filter value type for 'standard_variable_names': {standard_variable_names_value}; must be an array of values"})
 
-    # execute the query
-    try:
-        with session_scope() as session:
-            query = session.query(DatasetDB.id, DatasetDB.name, DatasetDB.description, DatasetDB.json_metadata).distinct()
-            if "dataset_names" in fields:
-                dataset_names = ['(^|\s|_|\-)' + re.escape(dataset_name).replace(r"\*", ".*") + '($|\s|_|\-)' for dataset_name in fields['dataset_names']['value']]
-
-                query = query.filter(DatasetDB.name.op("~*")("|".join(dataset_names)))
+    query = Query([DatasetDB.id, DatasetDB.name, DatasetDB.description, DatasetDB.json_metadata]).distinct()
+    if "dataset_names" in fields:
+        query = query.filter(name_match_clause(DatasetDB.name, fields['dataset_names']['value']))
 
-            if "dataset_ids" in fields:
-                query = query.filter(DatasetDB.id.in_(fields['dataset_ids']['value']))
+    if "dataset_ids" in fields:
+        query = query.filter(DatasetDB.id.in_(fields['dataset_ids']['value']))
 
-            if "standard_variable_ids" in fields or "standard_variable_names" in fields:
+    if "standard_variable_ids" in fields or "standard_variable_names" in fields:
 
-                query = query.join(DatasetDB, VariableDB.dataset) \
-                    .join(StandardVariableDB, VariableDB.standard_variables)
+        query = query.join(DatasetDB, VariableDB.dataset) \
+            .join(StandardVariableDB, VariableDB.standard_variables)
 
-                if "standard_variable_ids" in fields:
-                    query = query.filter(StandardVariableDB.id.in_(fields['standard_variable_ids']['value']))
+        if "standard_variable_ids" in fields:
+            query = query.filter(StandardVariableDB.id.in_(fields['standard_variable_ids']['value']))
 
-                if "standard_variable_names" in fields:
-                    standard_variable_names = ['(^|\s|_|\-)' + re.escape(sv_name).replace(r"\*", ".*") + '($|\s|_|\-)' for sv_name in fields['standard_variable_names']['value']]
-                    query = query.filter(StandardVariableDB.name.op("~*")("|".join(standard_variable_names)))
+        if "standard_variable_names" in fields:
+            query = query.filter(name_match_clause(StandardVariableDB.name, fields['standard_variable_names']['value']))
 
-            query = query.order_by(case([(DatasetDB.json_metadata.has_key('source_url'), 1)], else_=0).desc())
+    query = _order_by_source_url(query, after)
 
-            query = query.limit(limit).offset(offset)
-            print(query)
-            results = query.all()
+    query = query.limit(page.limit).offset(offset)
+    return query.statement
 
-        results_json = []
-        for row in results:
-            record = {
-                "dataset_id": str(row[0]),
-                "dataset_name": str(row[1]),
-                "dataset_description": str(row[2]),
-                "dataset_metadata": row[3],
-            }
-            results_json.append(record)
 
-        return {"result": "success", "datasets": results_json}
+def format_find_datasets(results, page: Page) -> Dict:
+    results_json = []
+    for row in results:
+        record = {
+            "dataset_id": str(row[0]),
+            "dataset_name": str(row[1]),
+            "dataset_description": str(row[2]),
+            "dataset_metadata": row[3],
+        }
+        results_json.append(record)
 
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-        raise InternalServerException(e)
+    return {"result": "success", "datasets": results_json, "next_cursor": page.next_cursor(results, _source_url_sort_key)}
 
 
 def find_standard_variables(query_definition: dict) -> dict:
@@ -466,12 +501,10 @@ def find_standard_variables(query_definition: dict) -> dict:
         #             f"Invalid filter value type for 'resource_variables': {resource_variables_value}; must be an array of values"})
 
         try:
-            with session_scope() as session:
+            with session_scope(read_only=True) as session:
                 query = session.query(StandardVariableDB).distinct()
                 if "name" in fields:
-                    standard_variable_names = ['(^|\s|_|\-)' + re.escape(name).replace(r"\*", ".*") + '($|\s|_|\-)' for name in fields['name']['value']]
-
-                    query = query.filter(StandardVariableDB.name.op("~*")("|".join(standard_variable_names)))
+                    query = query.filter(name_match_clause(StandardVariableDB.name, fields['name']['value']))
                 if "ontology" in fields:
                     query = query.filter(StandardVariableDB.ontology.in_(fields["ontology"]["value"]))
                 if "uri" in fields:
@@ -480,14 +513,14 @@ def find_standard_variables(query_definition: dict) -> dict:
                 #     query
 
                 query = query.limit(limit)
-                print(query)
+                logger.debug("%s", query)
                 results = query.all()
 
             results_json = [standard_variable.to_dict() for standard_variable in results]
             return {"result": "success", "standard_variables": results_json}
 
         except Exception as e:
-            traceback.print_exc(file=sys.stdout)
+            logger.exception("Query failed")
             raise InternalServerException(e)
 
 
@@ -507,14 +540,14 @@ def dataset_standard_variables(query_definition: dict) -> dict:
         raise BadRequestException({'InvalidQueryDefinition': f"'dataset_id' value must be a valid UUID v4; received {dataset_record_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             query = session.query(DatasetDB.id, DatasetDB.name, StandardVariableDB.id, StandardVariableDB.name,
                                   StandardVariableDB.uri).distinct() \
                 .join(VariableDB, DatasetDB.variables) \
                 .join(StandardVariableDB, VariableDB.standard_variables) \
                 .filter(DatasetDB.id == dataset_record_id)
 
-            print(query)
+            logger.debug("%s", query)
             results = query.all()
             results_json = {
                 "dataset_id": None,
@@ -537,7 +570,7 @@ def dataset_standard_variables(query_definition: dict) -> dict:
             return {"result": "success", "dataset": results_json}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
@@ -557,7 +590,7 @@ def dataset_variables(query_definition: dict) -> dict:
             {'InvalidQueryDefinition': f"'dataset_id' value must be a valid UUID v4; received {dataset_record_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             query = session.query(VariableDB.id, VariableDB.name, VariableDB.json_metadata,
                                   StandardVariableDB.id, StandardVariableDB.name, StandardVariableDB.ontology,
                                   StandardVariableDB.uri, StandardVariableDB.description) \
@@ -565,7 +598,7 @@ def dataset_variables(query_definition: dict) -> dict:
                 .outerjoin(StandardVariableDB, VariableDB.standard_variables) \
                 .filter(VariableDB.dataset_id == dataset_record_id)
 
-            print(query)
+            logger.debug("%s", query)
             results = query.all()
 
             variable_ids_results = {}
@@ -599,7 +632,7 @@ def dataset_variables(query_definition: dict) -> dict:
             return {"result": "success", "dataset": {"variables": variables}}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
@@ -611,8 +644,10 @@ def variables_standard_variables(query_definition: dict) -> dict:
     # search_ops = body.pop('search_operators', "and").lower()
     # sort_by = body.pop("sort_by", None)
     # assert search_ops == "or" or search_ops == "and"
-    limit = int(query_definition.pop("limit", 20))
-    offset = int(query_definition.pop("offset", 0))
+    page = Page.from_query_definition("variables_standard_variables", query_definition, 20, 1)
+    offset = _page_offset(query_definition, page)
+    if page.after is not None and not _validate_uuid(page.after[0]):
+        raise BadRequestException({'InvalidQueryDefinition': f"Invalid cursor position: {page.after}"})
     fields: Dict[str, dict] = {}
     for field_w_op, value in query_definition.items():
         if field_w_op.rfind("__") == -1:
@@ -643,16 +678,24 @@ def variables_standard_variables(query_definition: dict) -> dict:
                 f"Invalid values for 'variable_ids': {variable_ids_value}; must be an array of uuid strings"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
+            # The page is a page of variables, each returned with all of its standard variables
+            variables_page = session.query(VariableDB.id) \
+                .filter(VariableDB.id.in_(fields['variable_ids']['value']))
+            if page.after is not None:
+                variables_page = variables_page.filter(VariableDB.id > str(page.after[0]))
+            variables_page = variables_page.order_by(VariableDB.id).limit(page.limit).offset(offset).subquery()
+
             query = session.query(VariableDB.id, VariableDB.name, VariableDB.dataset_id, VariableDB.json_metadata,
                                   StandardVariableDB.id, StandardVariableDB.name, StandardVariableDB.ontology,
                                   StandardVariableDB.uri, StandardVariableDB.description)\
                 .distinct() \
                 .outerjoin(StandardVariableDB, VariableDB.standard_variables) \
-                .filter(VariableDB.id.in_(fields['variable_ids']['value']))
+                .filter(VariableDB.id.in_(variables_page)) \
+                .order_by(VariableDB.id)
 
-            print(query)
-            results = query.limit(limit).all()
+            logger.debug("%s", query)
+            results = query.all()
 
             variable_ids_results = {}
 
@@ -681,10 +724,12 @@ def variables_standard_variables(query_definition: dict) -> dict:
 
                 variable_ids_results[variable_id] = record_json
 
-            return {"result": "success", "variables": list(variable_ids_results.values())}
+            variables = list(variable_ids_results.values())
+            return {"result": "success", "variables": variables,
+                    "next_cursor": page.next_cursor(variables, lambda record: (record["variable_id"],))}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
@@ -706,7 +751,7 @@ def dataset_temporal_coverage(query_definition: dict) -> dict:
     query +=  " ".join(where_query_part) + " "
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             results = session.execute(query)
 
             for row in results:
@@ -716,12 +761,95 @@ def dataset_temporal_coverage(query_definition: dict) -> dict:
             return {"result": "success", "dataset": {"dataset_id": dataset_record_id, "temporal_coverage_start": min_date, "temporal_coverage_end": max_date}}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
+def temporal_histogram(query_definition: dict) -> dict:
+    """Resource counts per day, month or year, for the resources of a dataset ('dataset_id') or of the datasets
+    matched by search filters ('search_query', 'provenance_id', 'spatial_coverage'). 'temporal_coverage' restricts
+    the histogram to a period; 'bucket' overrides the automatic choice of bucket."""
+    allowed_query_words = frozenset(["dataset_id", "search_query", "provenance_id", "spatial_coverage",
+                                     "temporal_coverage", "bucket"])
+    if not all(field_name in allowed_query_words for field_name in query_definition.keys()):
+        raise BadRequestException(
+            {'InvalidQueryDefinition': f"Invalid field(s); must be either of {sorted(allowed_query_words)}"})
+
+    search_fields = [field_name for field_name in ("search_query", "provenance_id", "spatial_coverage")
+                     if query_definition.get(field_name) is not None]
+    dataset_record_id = query_definition.get("dataset_id")
+    if dataset_record_id is None and len(search_fields) == 0:
+        raise BadRequestException({'InvalidQueryDefinition': "Either 'dataset_id' or at least one of 'search_query', "
+                                                             "'provenance_id' or 'spatial_coverage' is required"})
+    if dataset_record_id is not None:
+        if len(search_fields) > 0:
+            raise BadRequestException({'InvalidQueryDefinition': f"'dataset_id' cannot be combined with "
+                                                                 f"{search_fields}"})
+        try:
+            dataset_record_id = str(uuid.UUID(str(dataset_record_id)))
+        except ValueError:
+            raise BadRequestException({'InvalidQueryDefinition': f"'dataset_id' value must be a valid UUID v4; "
+                                                                 f"received {dataset_record_id}"})
+
+    search_query = query_definition.get("search_query")
+    if search_query is not None and not isinstance(search_query, list):
+        raise BadRequestException({'InvalidQueryDefinition':
+                                   f"Invalid value type for 'search_query': {search_query}; must be an array"})
+    provenance_id = query_definition.get("provenance_id")
+    if provenance_id is not None and not _validate_uuid(provenance_id):
+        raise BadRequestException(
+            {'InvalidQueryDefinition': f"'provenance_id' value must be a valid UUID v4; received {provenance_id}"})
+
+    bucket = query_definition.get("bucket")
+    statement, params = build_temporal_histogram_statement(
+        dataset_id=dataset_record_id, provenance_id=provenance_id, search_query=search_query,
+        spatial_coverage=query_definition.get("spatial_coverage"),
+        temporal_coverage=query_definition.get("temporal_coverage"), bucket=bucket)
+
+    try:
+        with session_scope(read_only=True) as session:
+            logger.debug("%s %s", statement, params)
+            results = execute_prepared(session, statement, params).fetchall()
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+    if len(results) > MAX_TEMPORAL_HISTOGRAM_BUCKETS:
+        raise BadRequestException({'InvalidQueryDefinition': f"The histogram would have more than "
+                                                             f"{MAX_TEMPORAL_HISTOGRAM_BUCKETS} buckets of a "
+                                                             f"{results[0]['bucket']}; request a coarser 'bucket' "
+                                                             f"or a shorter 'temporal_coverage'"})
+
+    histogram = {
+        "result": "success",
+        "bucket": results[0]["bucket"] if len(results) > 0 else bucket,
+        "histogram": [{"bucket_start": row["bucket_start"].date().isoformat(), "count": row["count"]}
+                      for row in results]
+    }
+    if dataset_record_id is not None:
+        histogram["dataset_id"] = dataset_record_id
+
+    return histogram
+
+
 
 def dataset_resources(query_definition: dict) -> dict:
+    statement = build_dataset_resources_query(query_definition)
+
+    try:
+        with session_scope(read_only=True) as session:
+            logger.debug("%s", statement)
+            results = session.execute(statement).fetchall()
+
+        return format_dataset_resources(query_definition['dataset_id'], results)
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+def build_dataset_resources_query(query_definition: dict) -> Select:
+    """Validate a dataset_resources query definition and build its statement"""
     if len(query_definition) == 0:
         raise BadRequestException({'InvalidQueryDefinition': query_definition})
     elif "dataset_id" not in query_definition:
@@ -739,172 +867,125 @@ def dataset_resources(query_definition: dict) -> dict:
         raise BadRequestException(
             {'InvalidQueryDefinition': f"'dataset_id' value must be a valid UUID v4; received {dataset_record_id}"})
 
-    try:
-        with session_scope() as session:
-            query = session.query(ResourceDB.id, ResourceDB.name, ResourceDB.data_url, ResourceDB.created_at,
-                                  ResourceDB.resource_type, ResourceDB.json_metadata)
-                # .join(ResourceDB, DatasetDB.resources)
-
-            filter_definition = query_definition.get('filter')
-            # assert search_ops == "or" or search_ops == "and"
-
-            if filter_definition is not None:
-                fields: Dict[str, dict] = {}
-                for field_w_op, value in filter_definition.items():
-                    if field_w_op.rfind("__") == -1:
-                        field, op = field_w_op, None
-                    else:
-                        field, op = field_w_op.split("__")
-                    fields[field] = {"op": op, "value": value}
-
-                allowed_filter_words = ["spatial_coverage", "start_time", "end_time"]
-
-                if not all([field_name in allowed_filter_words for field_name in list(fields.keys())]):
-                    raise BadRequestException(
-                        {
-                            'InvalidQueryDefinition': f"Invalid search field(s); must be either of {allowed_filter_words}"})
-
-                if "spatial_coverage" in fields:
-                    spatial_coverage_op = fields["spatial_coverage"]["op"]
-                    spatial_coverage_value = fields["spatial_coverage"]["value"]
-
-                    allowed_filter_keywords = ["within", "intersects"]
-
-                    if spatial_coverage_op not in allowed_filter_keywords:
-                        raise BadRequestException({
-                            'InvalidQueryDefinition': f"Invalid filter operation for 'spatial_coverage': {spatial_coverage_op}"})
-                    if not spatial_coverage_value:
-                        raise BadRequestException(
-                            {
-                                'InvalidQueryDefinition': f"Invalid filter value for 'spatial_coverage': {spatial_coverage_op}"})
-                    # if not isinstance(spatial_coverage_value, list):
-                    #     raise BadRequestException({'InvalidQueryDefinition':
-                    #         f"Invalid filter value type for 'spatial_coverage': {spatial_coverage_op}; must be an numeric array with [x_min, y_min, x_max, y_max]"})
-
-                if "start_time" in fields:
-                    if fields["start_time"]['op'] is None:
-                        fields["start_time"]["op"] = "gte"
-
-                    if fields["start_time"]["op"] not in {"gte", "gt", "lte", "lt"}:
-                        raise BadRequestException({'InvalidQueryDefinition':
-                                                       f"Invalid filter operation: {fields['start_time']['op']}; must be on of 'gte', 'gt', 'lte', 'lt'"})
-
-                    try:
-                        fields['start_time']['value'] = datetime.strptime(fields['start_time']['value'],
-                                                                          "%Y-%m-%dT%H:%M:%S")
-                    except ValueError:
-                        help_msg = "must be formatted according to ISO8601: '%Y-%m-%dT%H:%M:%S'"
-                        raise BadRequestException({'InvalidQueryDefinition':
-                                                       f"Invalid datetime format for 'start_time': {fields['start_time']['value']}; {help_msg}"})
-
-                if "end_time" in fields:
-                    if fields["end_time"]['op'] is None:
-                        fields["end_time"]["op"] = "gte"
-
-                    if fields["end_time"]["op"] not in {"gte", "gt", "lte", "lt"}:
-                        raise BadRequestException({'InvalidQueryDefinition':
-                                                       f"Invalid filter operation: {fields['end_time']['op']}; must be on of 'gte', 'gt', 'lte', 'lt'"})
-                    try:
-                        fields['end_time']['value'] = datetime.strptime(fields['end_time']['value'],
-                                                                        "%Y-%m-%dT%H:%M:%S")
-                    except ValueError:
-                        help_msg = "must be formatted according to ISO8601: '%Y-%m-%dT%H:%M:%S'"
-                        raise BadRequestException({'InvalidQueryDefinition': f"Invalid datetime format for 'end_time': {fields['end_time']['value']}; {help_msg}"})
-
-                if "start_time" in fields or "end_time" in fields:
-                    # filter out datasets that have too many resources (based on provenance_id)
-                    query = query.join(TemporalCoverageIndexDB, TemporalCoverageIndexDB.indexed_id == ResourceDB.id)
-
-                    if "start_time" in fields:
-                        if fields["start_time"]["op"] == "gte":
-                            query = query.filter(TemporalCoverageIndexDB.start_time >= fields["start_time"]['value'])
-                        elif fields["start_time"]["op"] == "gt":
-                            query = query.filter(TemporalCoverageIndexDB.start_time > fields["start_time"]['value'])
-                        elif fields["start_time"]["op"] == "lte":
-                            query = query.filter(TemporalCoverageIndexDB.start_time <= fields["start_time"]['value'])
-                        elif fields["start_time"]["op"] == "lt":
-                            query = query.filter(TemporalCoverageIndexDB.start_time < fields["start_time"]['value'])
-                        # if in json metadata, but hard to index this way value
-                        # elif fields["start_time"]["op"] == "lt":
-                        #     query = query.filter(DatasetDB.json_metadata['temporal_coverage', 'start_time'].astext.cast(TIMESTAMP) < fields["start_time"]['value'])
-                        else:
-                            raise Exception("Invalid operator")
-                    if "end_time" in fields:
-                        if fields["end_time"]["op"] == "gte":
-                            query = query.filter(TemporalCoverageIndexDB.end_time >= fields["end_time"]['value'])
-                        elif fields["end_time"]["op"] == "gt":
-                            query = query.filter(TemporalCoverageIndexDB.end_time > fields["end_time"]['value'])
-                        elif fields["end_time"]["op"] == "lte":
-                            query = query.filter(TemporalCoverageIndexDB.end_time <= fields["end_time"]['value'])
-                        elif fields["end_time"]["op"] == "lt":
-                            query = query.filter(TemporalCoverageIndexDB.end_time < fields["end_time"]['value'])
-                        else:
-                            raise Exception("Invalid operator")
-
-                if "spatial_coverage" in fields:
-                    # how do we represent global ? null or generate a value..?
-                    # filter out datasets with too many resources (based on provenance_id)
-                    query = query.join(SpatialCoverageIndexDB, SpatialCoverageIndexDB.indexed_id == ResourceDB.id)
-
-                    if fields["spatial_coverage"]["op"] == "within" and isinstance(fields['spatial_coverage']['value'], list):
-                        query = query.filter(SpatialCoverageIndexDB.spatial_coverage.ST_Within(
-                            func.ST_Makeenvelope(*fields['spatial_coverage']['value'],
-                                                 SpatialCoverageIndexDB.LOCATION_SRID)))
-
-                    elif fields["spatial_coverage"]["op"] == "within" and isinstance(fields['spatial_coverage']['value'], dict):
-                        query = query.filter(SpatialCoverageIndexDB.spatial_coverage.ST_Within(
-                                func.st_setsrid(
-                                    func.ST_geomfromgeojson(ujson.dumps(fields['spatial_coverage']['value'])),
-                                    SpatialCoverageIndexDB.LOCATION_SRID))
-                        )
-
-                    elif fields["spatial_coverage"]["op"] == "intersects" and isinstance(fields['spatial_coverage']['value'], list):
-                        query = query.filter(SpatialCoverageIndexDB.spatial_coverage.ST_Intersects(
-                            func.ST_Makeenvelope(*fields['spatial_coverage']['value'],
-                                                 SpatialCoverageIndexDB.LOCATION_SRID)))
-
-                    elif fields["spatial_coverage"]["op"] == "intersects" and isinstance(fields['spatial_coverage']['value'], dict):
-                        query = query.filter(SpatialCoverageIndexDB.spatial_coverage.ST_Intersects(
-                            func.st_setsrid(
-                                func.ST_geomfromgeojson(ujson.dumps(fields['spatial_coverage']['value'])),
-                                SpatialCoverageIndexDB.LOCATION_SRID))
-                        )
-
-
-            ###################################3
-            query = query.filter(ResourceDB.dataset_id == dataset_record_id)
-
-            if filter_definition is not None and "end_time" in filter_definition:
-                query = query.order_by(TemporalCoverageIndexDB.end_time.desc())
-
-            query = query.limit(limit)
-
-            print(query)
-            results = query.all()
-            results_json = {
-                "dataset_id": dataset_record_id,
-                "resources": []
-            }
+    query = Query([ResourceDB.id, ResourceDB.name, ResourceDB.data_url, ResourceDB.created_at,
+                   ResourceDB.resource_type, ResourceDB.json_metadata])
+        # .join(ResourceDB, DatasetDB.resources)
 
-            for row in results:
-                # This is overwriting dataset_id and dataset_name but it's ok since those should be unique anyways
-                results_json["dataset_id"] = dataset_record_id
-                results_json["resources"].append(
+    filter_definition = query_definition.get('filter')
+    # assert search_ops == "or" or search_ops == "and"
+
+    if filter_definition is not None:
+        fields: Dict[str, dict] = {}
+        for field_w_op, value in filter_definition.items():
+            if field_w_op.rfind("__") == -1:
+                field, op = field_w_op, None
+            else:
+                field, op = field_w_op.split("__")
+            fields[field] = {"op": op, "value": value}
+
+        allowed_filter_words = ["spatial_coverage", "start_time", "end_time"]
+
+        if not all([field_name in allowed_filter_words for field_name in list(fields.keys())]):
+            raise BadRequestException(
+                {
+                    'InvalidQueryDefinition': f"Invalid search field(s); must be either of {allowed_filter_words}"})
+
+        if "spatial_coverage" in fields:
+            spatial_coverage_op = fields["spatial_coverage"]["op"]
+            spatial_coverage_value = fields["spatial_coverage"]["value"]
+
+            allowed_filter_keywords = ["within", "intersects"]
+
+            if spatial_coverage_op not in allowed_filter_keywords:
+                raise BadRequestException({
+                    'InvalidQueryDefinition': f"Invalid filter operation for 'spatial_coverage': {spatial_coverage_op}"})
+            if not spatial_coverage_value:
+                raise BadRequestException(
                     {
-                        "resource_id": str(row[0]),
-                        "resource_name": str(row[1]),
-                        "resource_data_url": str(row[2]),
-                        "resource_created_at": str(row[3]).split(".")[0],
-                        "resource_type": str(row[4]),
-                        "resource_metadata": row[5]
-                    }
-                )
+                        'InvalidQueryDefinition': f"Invalid filter value for 'spatial_coverage': {spatial_coverage_op}"})
+            # if not isinstance(spatial_coverage_value, list):
+            #     raise BadRequestException({'InvalidQueryDefinition':
+            #         f"Invalid filter value type for 'spatial_coverage': {spatial_coverage_op}; must be an numeric array with [x_min, y_min, x_max, y_max]"})
 
-            return {"result": "success", "dataset": results_json, "dataset_id": dataset_record_id, "resources": results_json["resources"]}
+        if "start_time" in fields:
+            if fields["start_time"]['op'] is None:
+                fields["start_time"]["op"] = "gte"
 
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-        raise InternalServerException(e)
+            if fields["start_time"]["op"] not in {"gte", "gt", "lte", "lt"}:
+                raise BadRequestException({'InvalidQueryDefinition':
+                                               f"Invalid filter operation: {fields['start_time']['op']}; must be on of 'gte', 'gt', 'lte', 'lt'"})
+
+            try:
+                fields['start_time']['value'] = datetime.strptime(fields['start_time']['value'],
+                                                                  "%Y-%m-%dT%H:%M:%S")
+            except ValueError:
+                help_msg = "must be formatted according to ISO8601: '%Y-%m-%dT%H:%M:%S'"
+                raise BadRequestException({'InvalidQueryDefinition':
+                                               f"Invalid datetime format for 'start_time': {fields['start_time']['value']}; {help_msg}"})
+
+        if "end_time" in fields:
+            if fields["end_time"]['op'] is None:
+                fields["end_time"]["op"] = "gte"
+
+            if fields["end_time"]["op"] not in {"gte", "gt", "lte", "lt"}:
+                raise BadRequestException({'InvalidQueryDefinition':
+                                               f"Invalid filter operation: {fields['end_time']['op']}; must be on of 'gte', 'gt', 'lte', 'lt'"})
+            try:
+                fields['end_time']['value'] = datetime.strptime(fields['end_time']['value'],
+                                                                "%Y-%m-%dT%H:%M:%S")
+            except ValueError:
+                help_msg = "must be formatted according to ISO8601: '%Y-%m-%dT%H:%M:%S'"
+                raise BadRequestException({'InvalidQueryDefinition': f"Invalid datetime format for 'end_time': {fields['end_time']['value']}; {help_msg}"})
+
+        if "start_time" in fields or "end_time" in fields:
+            # filter out datasets that have too many resources (based on provenance_id)
+            query = query.join(TemporalCoverageIndexDB, TemporalCoverageIndexDB.indexed_id == ResourceDB.id)
+            for field_name in ("start_time", "end_time"):
+                if field_name in fields:
+                    query = query.filter(_temporal_range_filter(TemporalCoverageIndexDB.temporal_coverage, field_name,
+                                                                fields[field_name]["op"],
+                                                                fields[field_name]["value"]))
+
+        if "spatial_coverage" in fields:
+            # how do we represent global ? null or generate a value..?
+            # filter out datasets with too many resources (based on provenance_id)
+            query = query.join(SpatialCoverageIndexDB, SpatialCoverageIndexDB.indexed_id == ResourceDB.id)
+            query = query.filter(spatial_filter(SpatialCoverageIndexDB.spatial_coverage,
+                                                fields["spatial_coverage"]["op"],
+                                                query_geometry(fields["spatial_coverage"]["value"]),
+                                                SpatialCoverageIndexDB.LOCATION_SRID))
+
+    ###################################3
+    query = query.filter(ResourceDB.dataset_id == dataset_record_id)
+
+    if filter_definition is not None and "end_time" in filter_definition:
+        query = query.order_by(TemporalCoverageIndexDB.end_time.desc())
+
+    query = query.limit(limit)
+    return query.statement
+
+
+def format_dataset_resources(dataset_record_id: str, results) -> dict:
+    results_json = {
+        "dataset_id": dataset_record_id,
+        "resources": []
+    }
+
+    for row in results:
+        # This is overwriting dataset_id and dataset_name but it's ok since those should be unique anyways
+        results_json["dataset_id"] = dataset_record_id
+        results_json["resources"].append(
+            {
+                "resource_id": str(row[0]),
+                "resource_name": str(row[1]),
+                "resource_data_url": str(row[2]),
+                "resource_created_at": str(row[3]).split(".")[0],
+                "resource_type": str(row[4]),
+                "resource_metadata": row[5]
+            }
+        )
+
+    return {"result": "success", "dataset": results_json, "dataset_id": dataset_record_id, "resources": results_json["resources"]}
 
 
 def get_dataset_info(query_definition: dict) -> dict:
@@ -923,7 +1004,7 @@ def get_dataset_info(query_definition: dict) -> dict:
             {'InvalidQueryDefinition': f"'dataset_id' value must be a valid UUID v4; received {dataset_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             record = {}
             dataset_db_record = Dataset.find_by_record_id(dataset_id, session)
             if dataset_db_record is not None:
@@ -940,7 +1021,7 @@ def get_dataset_info(query_definition: dict) -> dict:
             return record
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
     
 
@@ -960,7 +1041,7 @@ def get_resource_info(query_definition: dict) -> dict:
             {'InvalidQueryDefinition': f"'resource_id' value must be a valid UUID v4; received {resource_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             record = {}
             resource_db_record = Resource.find_by_record_id(resource_id, session)
 
@@ -976,7 +1057,7 @@ def get_resource_info(query_definition: dict) -> dict:
             return record
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
@@ -996,7 +1077,7 @@ def get_variable_info(query_definition: dict) -> dict:
             {'InvalidQueryDefinition': f"'variable_id' value must be a valid UUID v4; received {variable_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             record = {}
 
             query = VariableDB
@@ -1011,7 +1092,7 @@ def get_variable_info(query_definition: dict) -> dict:
             return record
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
@@ -1031,7 +1112,7 @@ def get_standard_variable_info(query_definition: dict) -> dict:
             {'InvalidQueryDefinition': f"'standard_variable_id' value must be a valid UUID v4; received {standard_variable_id}"})
 
     try:
-        with session_scope() as session:
+        with session_scope(read_only=True) as session:
             record = {}
             standard_variable_db_record = StandardVariable.find_by_record_id(standard_variable_id, session)
 
@@ -1045,11 +1126,28 @@ def get_standard_variable_info(query_definition: dict) -> dict:
             return record
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Query failed")
         raise InternalServerException(e)
 
 
 def search_datasets(query_definition: dict) -> dict:
+    page = Page.from_query_definition("search_datasets", query_definition, 500, 3)
+    datasets_query = build_search_datasets_query(query_definition, page)
+
+    # execute the query
+    try:
+        with session_scope(read_only=True) as session:
+            logger.debug("%s %s", *datasets_query)
+            return format_search_datasets(execute_prepared(session, *datasets_query).fetchall(), page)
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+def build_search_datasets_query(query_definition: dict, page: Page) -> Tuple[TextClause, Dict[str, Any]]:
+    """Validate a search query definition and build the statement (and its parameters) selecting the requested page
+    of matching datasets together with their variables and standard variables, aggregated by PostgreSQL"""
     if len(query_definition) == 0:
         raise BadRequestException(
             {'InvalidQueryDefinition': f"Query definition must not be empty; received {query_definition}"})
@@ -1057,10 +1155,9 @@ def search_datasets(query_definition: dict) -> dict:
         # search_ops = body.pop('search_operators', "and").lower()
         # sort_by = body.pop("sort_by", None)
         # assert search_ops == "or" or search_ops == "and"
-    limit = int(query_definition.pop("limit", 500))
     field_names = query_definition.keys()
 
-    allowed_query_words = frozenset(["search_query", "provenance_id"])
+    allowed_query_words = frozenset(["search_query", "provenance_id", "candidate_budget"])
 
     if not all([field_name in allowed_query_words for field_name in list(query_definition.keys())]):
         raise BadRequestException(
@@ -1081,139 +1178,27 @@ def search_datasets(query_definition: dict) -> dict:
             raise BadRequestException(
                 {'InvalidQueryDefinition': f"'provenance_id' value must be a valid UUID v4; received {provenance_id}"})
 
-        # execute the query
-    try:
-        with session_scope() as session:
+    return build_select_datasets_statement(DATASET_COLUMNS, provenance_id=provenance_id, search_query=search_query,
+                                           limit=page.limit, with_variables=True, after=page.after,
+                                           candidate_budget=parse_candidate_budget(
+                                               query_definition.get("candidate_budget"), page.requested),
+                                           page=page)
 
-            # Get Dataset
 
-            datasets_query = _generate_select_datasets_query(provenance_id=provenance_id, search_query=search_query, limit=limit)
-            print(datasets_query)
-
-
-            # query = query.limit(limit)
-            # results = query.all()
-            datasets_results = session.execute(datasets_query)
-
-            datasets_dict = {}
-            for row in datasets_results:
-                dataset_id = str(row[0])
-                dataset_metadata = {}
-                if row[3] is not None:
-                    dataset_metadata = row[3]
-
-                dataset_record = {
-                    "dataset_id": dataset_id,
-                    "dataset_name": str(row[1]),
-                    "dataset_description": str(row[2]),
-                    "dataset_metadata": dataset_metadata,
-                    "variables": {}
-                }
-
-                if dataset_id not in datasets_dict:
-                    datasets_dict[dataset_id] = dataset_record
-
-            dataset_ids = list(datasets_dict.keys())
-            if len(dataset_ids) > 0:
-                variables_query = _generate_variable_query(dataset_ids=dataset_ids)
-                print(variables_query)
-                variables_results = session.execute(variables_query)
-
-                for row in variables_results:
-                    dataset_id = str(row[0])
-                    variable_id = str(row[1])
-
-                    variable_record = {
-                        "variable_id": variable_id,
-                        "variable_name": str(row[2]),
-                        "variable_metadata": row[3],
-                        "standard_variables": []
-                    }
-
-                    if variable_id not in datasets_dict[dataset_id]["variables"]:
-                        datasets_dict[dataset_id]["variables"][variable_id] = variable_record
-
-                    standard_variable_record = {
-                        "standard_variable_id": str(row[4]),
-                        "standard_variable_name": str(row[5]),
-                        "standard_variable_uri": str(row[6]),
-                    }
-
-                    datasets_dict[dataset_id]["variables"][variable_id]["standard_variables"].append(standard_variable_record)
-
-            results_json = []
-            for dataset_id, dataset_record in datasets_dict.items():
-                dataset_record["variables"] = list(dataset_record["variables"].values())
-                results_json.append(dataset_record)
-
-            return {"result": "success", "datasets": results_json}
-
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-        raise InternalServerException(e)
-
-
-def _generate_select_datasets_query(provenance_id=None, search_query=[], limit=20):
-    select_datasets_query_part = [
-        "datasets.id as dataset_id",
-        "datasets.name as dataset_name",
-        "datasets.description as description",
-        "datasets.json_metadata as dataset_metadata"
-    ]
-
-    where_query_part = []
-    order_by_query_part = []
-
-    if provenance_id is not None:
-        where_query_part.append(f"datasets.provenance_id = '{provenance_id}'")
-
-    if search_query is not None:
-        # ["a b", "c"] => "'a b' & 'c'"
-        search_string = " & ".join([f"''{str(keyword)}''" for keyword in search_query])
-        where_query_part.append(f"datasets.tsv @@ to_tsquery('english', '{search_string}')")
-        order_by_query_part.append(f"ts_rank_cd(datasets.tsv, to_tsquery('english', '{search_string}')) DESC")
-
-        # datasets that have 'source' field set should be displayed first
-        order_by_query_part.append("(case when datasets.json_metadata -> 'source' IS NOT NULL then 1 else 0 end) DESC")
-
-    query = "SELECT " + ", ".join(select_datasets_query_part) + " "
-    query += "FROM datasets "
-
-    if len(where_query_part) > 0:
-        query += "WHERE " + " AND ".join(where_query_part) + " "
-
-    if len(order_by_query_part) > 0:
-        query += "ORDER BY " + ", ".join(order_by_query_part) + " "
-
-    query += f"LIMIT {limit}"
-
-    return query
-
-
-def _generate_variable_query(dataset_ids=[]):
-    select_variables_query_part = [
-        "variables.dataset_id as dataset_id",
-        "variables.id as variable_id",
-        "variables.name as variable_name",
-        "variables.json_metadata as variable_metadata",
-        "standard_variables.id as standard_variable_id",
-        "standard_variables.name as standard_variable_name",
-        "standard_variables.uri as standard_variable_uri",
-    ]
-
-    join_query_part = [
-        "LEFT JOIN variables_standard_variables ON variables.id = variables_standard_variables.variable_id",
-        "LEFT JOIN standard_variables ON variables_standard_variables.standard_variable_id = standard_variables.id"
-    ]
-
-    query = "SELECT " + ", ".join(select_variables_query_part) + " "
-    query += "FROM variables "
-    query += " ".join(join_query_part) + " "
+def format_search_datasets(datasets_results, page: Page) -> dict:
+    results_json = []
+    for row in datasets_results:
+        dataset_metadata = {}
+        if row[3] is not None:
+            dataset_metadata = row[3]
 
-    dataset_ids_str = ", ".join([f"'{dataset_id}'" for dataset_id in dataset_ids])
-    if dataset_ids_str == '':
-        query += f"WHERE variables.dataset_id in (NULL)"
-    else:
-        query += f"WHERE variables.dataset_id in ({dataset_ids_str})"
+        results_json.append({
+            "dataset_id": str(row[0]),
+            "dataset_name": str(row[1]),
+            "dataset_description": str(row[2]),
+            "dataset_metadata": dataset_metadata,
+            "variables": row["variables"]
+        })
 
-    return query
\ No newline at end of file
+    return {"result": "success", "datasets": results_json,
+            "next_cursor": page.next_cursor(datasets_results, search_sort_key)}
@@ -1,18 +1,61 @@
 from typing import *
-import sys
-import traceback
 from datetime import datetime
 import uuid
 import ujson
 
 from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.cursor import Page
 from dcat_service import session_scope
+from dcat_service.controllers.search_queries import build_select_datasets_statement, DATASET_COLUMNS, \
+    SPATIAL_COVERAGE_COLUMN, SEARCH_FACETS, search_sort_key, parse_candidate_budget
+from dcat_service.prepared_statements import execute_prepared
 
-from dcat_service.db_models import DatasetDB
-from sqlalchemy import func
+from sqlalchemy.sql.elements import TextClause
 
+logger = get_logger(__name__)
 
-def search_datasets_v2(query_definition: dict) -> list:
+
+def search_datasets_v2(query_definition: dict) -> Union[list, dict]:
+    page = search_datasets_v2_page(query_definition)
+    datasets_query = build_search_datasets_v2_query(query_definition, page)
+
+    # execute the query
+    try:
+        with session_scope(read_only=True) as session:
+            logger.debug("%s %s", *datasets_query)
+            return format_search_datasets_v2(execute_prepared(session, *datasets_query).fetchall(), page,
+                                             search_datasets_v2_facets(query_definition))
+
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+
+def search_datasets_v2_page(query_definition: dict) -> Page:
+    # Keyword searches are ranked, so their keyset is (search_rank, has_source, dataset_id)
+    key_length = 3 if query_definition.get("search_query") is not None else 1
+    return Page.from_query_definition("search_datasets_v2", query_definition, 500, key_length,
+                                      presentation_fields=("facets", "facet_limit"))
+
+
+def search_datasets_v2_facets(query_definition: dict) -> Tuple[str, ...]:
+    """Facets requested by the 'facets' field: true for all of them, or a list of their names"""
+    facets = query_definition.get("facets")
+    if facets is None or facets is False:
+        return ()
+    if facets is True:
+        return SEARCH_FACETS
+
+    if not isinstance(facets, list) or not all(facet in SEARCH_FACETS for facet in facets):
+        raise BadRequestException({'InvalidQueryDefinition': f"Invalid value for 'facets': {facets}; must be true or "
+                                                             f"an array of {list(SEARCH_FACETS)}"})
+
+    return tuple(facet for facet in SEARCH_FACETS if facet in facets)
+
+
+def build_search_datasets_v2_query(query_definition: dict, page: Page) -> Tuple[TextClause, Dict[str, Any]]:
+    """Validate a search_v2 query definition and build the statement and parameters of the requested page"""
     if len(query_definition) == 0:
         raise BadRequestException(
             {'InvalidQueryDefinition': f"Query definition must not be empty; received {query_definition}"})
@@ -20,10 +63,10 @@ def search_datasets_v2(query_definition: dict) -> list:
         # search_ops = body.pop('search_operators', "and").lower()
         # sort_by = body.pop("sort_by", None)
         # assert search_ops == "or" or search_ops == "and"
-    limit = int(query_definition.pop("limit", 500))
     field_names = query_definition.keys()
 
-    allowed_query_words = frozenset(["search_query", "spatial_coverage", "temporal_coverage", "provenance_id"])
+    allowed_query_words = frozenset(["search_query", "spatial_coverage", "temporal_coverage", "provenance_id",
+                                     "facets", "facet_limit", "candidate_budget"])
 
     if query_definition == {}:
         raise BadRequestException({'InvalidQueryDefinition': f"Query definition must not be empty"})
@@ -53,98 +96,54 @@ def search_datasets_v2(query_definition: dict) -> list:
     # if spatial_coverage is not None:
     temporal_coverage = query_definition.get("temporal_coverage")
 
-
-        # execute the query
-    try:
-        with session_scope() as session:
-
-            # Get Dataset
-
-            datasets_query = _generate_select_datasets_query(provenance_id=provenance_id, search_query=search_query, spatial_coverage=spatial_coverage, temporal_coverage=temporal_coverage, limit=limit)
-            print(datasets_query)
-
-            # query = query.limit(limit)
-            # results = query.all()
-            datasets_results = session.execute(datasets_query)
-
-            datasets_dict = {}
-            for row in datasets_results:
-                dataset_id = str(row[0])
-                dataset_metadata = {}
-                if row[3] is not None:
-                    dataset_metadata = row[3]
-
-                dataset_record = {
-                    "dataset_id": dataset_id,
-                    "dataset_name": str(row[1]),
-                    "dataset_description": str(row[2]),
-                    "dataset_metadata": dataset_metadata,
-                    "dataset_spatial_coverage": ujson.loads(row[4])
-                }
-
-                if dataset_id not in datasets_dict:
-                    datasets_dict[dataset_id] = dataset_record
-
-            # dataset_ids = list(datasets_dict.keys())
-
-            results_json = []
-            for dataset_id, dataset_record in datasets_dict.items():
-                # dataset_record["variables"] = list(dataset_record["variables"].values())
-                results_json.append(dataset_record)
-
-            return results_json
-
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-        raise InternalServerException(e)
-
-
-def _generate_select_datasets_query(provenance_id=None, search_query=[], spatial_coverage=None, temporal_coverage=None, limit=20):
-    select_datasets_query_part = [
-        "datasets.id as dataset_id",
-        "datasets.name as dataset_name",
-        "datasets.description as description",
-        "datasets.json_metadata as dataset_metadata",
-        "COALESCE(ST_AsGeoJSON(datasets.spatial_coverage), '{}') as dataset_spatial_coverage"
-    ]
-
-    where_query_part = []
-    order_by_query_part = []
-
-    if provenance_id is not None:
-        where_query_part.append(f"datasets.provenance_id = '{provenance_id}'")
-
-    if search_query is not None:
-        # ["a b", "c"] => "'a b' & 'c'"
-        search_string = " & ".join([f"''{str(keyword)}''" for keyword in search_query])
-        where_query_part.append(f"datasets.tsv @@ to_tsquery('english', '{search_string}')")
-        order_by_query_part.append(f"ts_rank_cd(datasets.tsv, to_tsquery('english', '{search_string}')) DESC")
-
-        # datasets that have 'source' field set should be displayed first
-        order_by_query_part.append("(case when datasets.json_metadata -> 'source' IS NOT NULL then 1 else 0 end) DESC")
-
-    if spatial_coverage is not None:
-        where_query_part.append(f"ST_Intersects(datasets.spatial_coverage, ST_SetSRID(ST_GeomFromGeoJSON('{ujson.dumps(spatial_coverage)}'), {DatasetDB.LOCATION_SRID}))")
-
-    if temporal_coverage is not None:
-        requested_coverage_start_time = temporal_coverage.get('start_time')
-        requested_coverage_end_time = temporal_coverage.get('end_time')
-
-        if requested_coverage_start_time is not None:
-            where_query_part.append(f"datasets.temporal_coverage_end >= '{requested_coverage_start_time}'")
-        if requested_coverage_end_time is not None:
-            where_query_part.append(f"datasets.temporal_coverage_start <= '{requested_coverage_end_time}'")
-
-
-    query = "SELECT " + ", ".join(select_datasets_query_part) + " "
-    query += "FROM datasets "
-
-    if len(where_query_part) > 0:
-        query += "WHERE " + " AND ".join(where_query_part) + " "
-
-    if len(order_by_query_part) > 0:
-        query += "ORDER BY " + ", ".join(order_by_query_part) + " "
-
-    query += f"LIMIT {limit}"
-
-    return query
\ No newline at end of file
+    facet_limit = query_definition.get("facet_limit", 50)
+    if not isinstance(facet_limit, int) or isinstance(facet_limit, bool) or facet_limit < 1:
+        raise BadRequestException({'InvalidQueryDefinition':
+                                   f"'facet_limit' must be a positive integer; received {facet_limit}"})
+
+    return build_select_datasets_statement(DATASET_COLUMNS + (SPATIAL_COVERAGE_COLUMN,), provenance_id=provenance_id,
+                                           search_query=search_query, spatial_coverage=spatial_coverage,
+                                           temporal_coverage=temporal_coverage, limit=page.limit, after=page.after,
+                                           facets=search_datasets_v2_facets(query_definition),
+                                           facet_limit=facet_limit,
+                                           candidate_budget=parse_candidate_budget(
+                                               query_definition.get("candidate_budget"), page.requested),
+                                           page=page)
+
+
+def format_search_datasets_v2(datasets_results, page: Page, facets: Tuple[str, ...]=()) -> Union[list, dict]:
+    """A plain list of datasets, unless the request paginates with 'cursor' or asks for facets: then the datasets
+    come with the cursor of the next page and the facets, if any"""
+    facet_counts = None
+    if len(facets) > 0:
+        # Every row carries the facets; a search without matches returns a single row of facets only
+        facet_counts = datasets_results[0]["facets"] if len(datasets_results) > 0 else {}
+        datasets_results = [row for row in datasets_results if row["dataset_id"] is not None]
+
+    datasets_dict = {}
+    for row in datasets_results:
+        dataset_id = str(row[0])
+        dataset_metadata = {}
+        if row[3] is not None:
+            dataset_metadata = row[3]
+
+        dataset_record = {
+            "dataset_id": dataset_id,
+            "dataset_name": str(row[1]),
+            "dataset_description": str(row[2]),
+            "dataset_metadata": dataset_metadata,
+            "dataset_spatial_coverage": ujson.loads(row[4])
+        }
+
+        if dataset_id not in datasets_dict:
+            datasets_dict[dataset_id] = dataset_record
+
+    if not page.requested and facet_counts is None:
+        return list(datasets_dict.values())
+
+    response = {"result": "success", "datasets": list(datasets_dict.values()),
+                "next_cursor": page.next_cursor(datasets_results, search_sort_key)}
+    if facet_counts is not None:
+        response["facets"] = facet_counts
+
+    return response
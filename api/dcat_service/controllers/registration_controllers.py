@@ -15,6 +15,7 @@ from dcat_service.models.resource import ResourceCollectionBuilder
 
 from dcat_service.misc.exception import BadRequestException
 from dcat_service import session_scope
+from dcat_service.change_feed import record_change
 
 
 def register_provenance(provenance_definition: Dict) -> Dict:
@@ -52,6 +53,8 @@ def register_standard_variables(standard_variable_definitions: list) -> dict:
             raise BadRequestException({"StandardVariableSchemaValidationError": builder.schema_validation_errors})
         builder.build_record_associations()
         standard_variables = builder.persist()
+        # Standard variables reach datasets only once variables link them, but they are matched by name on their own
+        record_change(session, dataset_ids=())
 
     return {"result": "success", "standard_variables": standard_variables}
 
@@ -77,6 +80,7 @@ def register_datasets(dataset_definitions: list) -> dict:
             raise BadRequestException({"DatasetDataValidationError": builder.data_validation_errors})
 
         datasets = builder.persist()
+        record_change(session, dataset_ids=[dataset["record_id"] for dataset in datasets])
 
     return {"result": "success", "datasets": datasets}
 
@@ -127,6 +131,7 @@ def register_variables(variable_definitions: list) -> dict:
             raise BadRequestException({"DataValidationError": builder.data_validation_errors})
 
         variables = builder.persist()
+        record_change(session, dataset_ids={variable["dataset_id"] for variable in variables})
 
     return {"result": "success", "variables": variables}
 
@@ -152,5 +157,6 @@ def register_resources(resource_definitions: list) -> dict:
             raise BadRequestException({"DataValidationError": builder.data_validation_errors})
 
         resources = builder.persist()
+        record_change(session, dataset_ids={resource["dataset_id"] for resource in resources})
 
     return {"result": "success", "resources": resources}
@@ -0,0 +1,532 @@
+from typing import *
+from datetime import datetime
+import functools
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from dcat_service.db_models import DatasetDB
+from dcat_service.misc.cursor import Page
+from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.query_geometry import query_geometry, query_geometry_params, spatial_filter_sql
+from dcat_service.search_index import SearchIndex, get_search_index, parse_keywords
+from dcat_service.settings import Settings
+
+# Statement builders shared by /datasets/search and /datasets/search_v2. Request values are always bound as
+# parameters; the SQL text depends only on which filters are present, so each shape is built once and PostgreSQL can
+# keep one prepared plan per shape.
+
+DATASET_COLUMNS = (
+    "datasets.id as dataset_id",
+    "datasets.name as dataset_name",
+    "datasets.description as description",
+    "datasets.json_metadata as dataset_metadata"
+)
+SPATIAL_COVERAGE_COLUMN = "COALESCE(ST_AsGeoJSON(datasets.spatial_coverage), '{}') as dataset_spatial_coverage"
+
+
+def tsquery_string(search_query: List) -> str:
+    """["a b", "c"] => "'a b' & 'c'"; every keyword is a quoted tsquery lexeme, so operators in keywords are literal"""
+    return " & ".join("'" + str(keyword).replace("\\", "\\\\").replace("'", "''") + "'" for keyword in search_query)
+
+
+def parse_coverage_time(value: Any, field_name: str) -> datetime:
+    """ISO 8601 date or date-time; an offset or 'Z' suffix is dropped, as PostgreSQL does for timestamp columns"""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise BadRequestException({'InvalidQueryDefinition':
+                                   f"Invalid datetime format for '{field_name}': {value}; must be ISO 8601, "
+                                   f"e.g. 2018-01-01T00:00:00"})
+
+    return parsed.replace(tzinfo=None)
+
+
+def parse_candidate_budget(value: Any, paginated: bool=False) -> Optional[int]:
+    """Candidate budget of a keyword search: the requested one, else SEARCH_CANDIDATE_BUDGET; None ranks every
+    match. Candidates are drawn in no particular order, so each page would rank a different set: searches paginated
+    with 'cursor' rank every match, and reject a 'candidate_budget'."""
+    settings = Settings.get_instance().search
+    if paginated:
+        if value is not None:
+            raise BadRequestException({'InvalidQueryDefinition': "'candidate_budget' cannot be combined with 'cursor'"})
+        return None
+
+    if value is None:
+        return settings.candidate_budget or None
+
+    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= settings.max_candidate_budget:
+        raise BadRequestException({'InvalidQueryDefinition': f"'candidate_budget' must be an integer between 1 and "
+                                                             f"{settings.max_candidate_budget}; received {value}"})
+
+    return value
+
+
+def search_sort_key(row) -> tuple:
+    """Keyset of a search result row: rank and source flag when searching by keywords, then the dataset id"""
+    if "search_rank" in row.keys():
+        return row["search_rank"], row["has_source"], row["dataset_id"]
+
+    return row["dataset_id"],
+
+
+def _filter_conditions(by_provenance: bool, by_keywords: bool, by_area: bool, from_time: bool,
+                       to_time: bool) -> List[str]:
+    """WHERE conditions of the search filters present in a request"""
+    conditions = []
+
+    if by_provenance:
+        conditions.append("datasets.provenance_id = :provenance_id")
+
+    if by_keywords:
+        conditions.append("dataset_search_documents.tsv @@ to_tsquery('english', :search_string)")
+
+    if by_area:
+        conditions.append(spatial_filter_sql("datasets.spatial_coverage", "ST_Intersects", DatasetDB.LOCATION_SRID))
+
+    if from_time or to_time:
+        # Overlap of the coverage with the requested period, open-ended on the side not requested
+        lower = "CAST(:start_time AS timestamp)" if from_time else "NULL"
+        upper = "CAST(:end_time AS timestamp)" if to_time else "NULL"
+        conditions.append(f"datasets.temporal_coverage && tsrange({lower}, {upper}, '[]')")
+
+    return conditions
+
+
+def _datasets_from_sql(by_keywords: bool) -> str:
+    """Keyword searches match the full-text documents of datasets, kept in their own table"""
+    if by_keywords:
+        return "datasets JOIN dataset_search_documents ON dataset_search_documents.dataset_id = datasets.id"
+
+    return "datasets"
+
+
+@functools.lru_cache(maxsize=128)
+def _select_datasets_sql(columns: Tuple[str, ...], by_provenance: bool, by_keywords: bool, by_area: bool,
+                         from_time: bool, to_time: bool, after: bool, two_phase: bool=False) -> str:
+    """Keyword searches also select their ranking expressions (search_rank, has_source): they are the sort key of
+    the page and let statements wrapping this one restore its order.
+
+    two_phase ranks keyword searches in two steps: the first :candidate_budget matches are taken from the
+    dataset_search_documents GIN index without computing any rank, then only those candidates are ranked and sorted."""
+    columns = list(columns)
+    conditions = _filter_conditions(by_provenance, by_keywords, by_area, from_time, to_time)
+    two_phase = two_phase and by_keywords
+    # Conditions of the candidates when ranking in two phases, otherwise the conditions of the page
+    where_query_part = [] if two_phase else conditions
+
+    if by_keywords:
+        search_rank = "ts_rank_cd(dataset_search_documents.tsv, to_tsquery('english', :search_string))"
+        # datasets that have 'source' field set should be displayed first
+        has_source = "CAST(datasets.has_source AS integer)"
+
+        # The rank (a real) is selected as double precision so the cursor keeps every digit of it, and compared as a
+        # real again, so the last row of a page compares equal to the key it left in the cursor
+        columns += [f"CAST({search_rank} AS double precision) as search_rank", f"{has_source} as has_source"]
+        # The dataset id breaks ties, so every row has a distinct position to continue from
+        order_by_query_part = ["search_rank DESC", "has_source DESC", "dataset_id DESC"]
+        if after:
+            where_query_part.append(f"({search_rank}, {has_source}, datasets.id) < (CAST(:after_search_rank AS real), "
+                                    f"CAST(:after_has_source AS integer), CAST(:after_dataset_id AS uuid))")
+    else:
+        order_by_query_part = ["dataset_id"]
+        if after:
+            where_query_part.append("datasets.id > CAST(:after_dataset_id AS uuid)")
+
+    query = "SELECT " + ", ".join(columns) + " "
+    if two_phase:
+        # Without an ORDER BY the candidates stop being read once the budget is reached
+        query += f"FROM (SELECT datasets.id FROM {_datasets_from_sql(by_keywords)} " \
+                 f"WHERE {' AND '.join(conditions)} LIMIT :candidate_budget) AS candidates " \
+                 f"JOIN datasets ON datasets.id = candidates.id " \
+                 f"JOIN dataset_search_documents ON dataset_search_documents.dataset_id = datasets.id "
+    else:
+        query += f"FROM {_datasets_from_sql(by_keywords)} "
+
+    if len(where_query_part) > 0:
+        query += "WHERE " + " AND ".join(where_query_part) + " "
+
+    query += "ORDER BY " + ", ".join(order_by_query_part) + " "
+    query += "LIMIT :limit"
+
+    return query
+
+
+@functools.lru_cache(maxsize=128)
+def _select_datasets_statement(columns: Tuple[str, ...], *filters: bool) -> TextClause:
+    return text(_select_datasets_sql(columns, *filters))
+
+
+# Variables of a dataset, each with its standard variables, aggregated into one JSON array per dataset
+_DATASET_VARIABLES_SQL = """
+    SELECT json_agg(json_build_object(
+        'variable_id', variables.id,
+        'variable_name', variables.name,
+        'variable_metadata', variables.json_metadata,
+        'standard_variables', COALESCE(variable_standard_variables.standard_variables, '[]'::json)
+    )) AS variables
+    FROM variables
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'standard_variable_id', standard_variables.id,
+            'standard_variable_name', standard_variables.name,
+            'standard_variable_uri', standard_variables.uri
+        )) AS standard_variables
+        FROM variables_standard_variables
+        JOIN standard_variables ON variables_standard_variables.standard_variable_id = standard_variables.id
+        WHERE variables_standard_variables.variable_id = variables.id
+    ) AS variable_standard_variables ON true
+    WHERE variables.dataset_id = page.dataset_id
+"""
+
+
+def _page_order_sql(by_keywords: bool) -> str:
+    """ORDER BY restoring the order of a page selected by _select_datasets_sql, once it is wrapped as 'page'"""
+    if by_keywords:
+        return "ORDER BY page.search_rank DESC, page.has_source DESC, page.dataset_id DESC"
+
+    return "ORDER BY page.dataset_id"
+
+
+def _with_variables_sql(page_sql: str, by_keywords: bool) -> str:
+    # The page of datasets is selected (and limited) first, so variables are only aggregated for returned datasets
+    return f"SELECT page.*, COALESCE(dataset_variables.variables, '[]'::json) AS variables " \
+           f"FROM ({page_sql}) AS page " \
+           f"LEFT JOIN LATERAL ({_DATASET_VARIABLES_SQL}) AS dataset_variables ON true " \
+           f"{_page_order_sql(by_keywords)}"
+
+
+@functools.lru_cache(maxsize=128)
+def _select_datasets_with_variables_sql(columns: Tuple[str, ...], *filters: bool) -> str:
+    return _with_variables_sql(_select_datasets_sql(columns, *filters), filters[1])
+
+
+@functools.lru_cache(maxsize=128)
+def _select_datasets_with_variables_statement(columns: Tuple[str, ...], *filters: bool) -> TextClause:
+    return text(_select_datasets_with_variables_sql(columns, *filters))
+
+
+# Facets count the datasets matching a search, over the whole matched set rather than the returned page. Each one
+# aggregates the 'matched' CTE into a JSON array; a CTE is evaluated once however many facets read it.
+SEARCH_FACETS = ("provenance", "standard_variable", "temporal_year", "resource_type")
+
+_FACETS_SQL = {
+    "provenance": """
+        SELECT COALESCE(json_agg(json_build_object(
+            'provenance_id', counts.provenance_id, 'provenance_name', provenance.name, 'count', counts.count
+        ) ORDER BY counts.count DESC, counts.provenance_id), '[]'::json)
+        FROM (SELECT provenance_id, count(*) AS count FROM matched GROUP BY provenance_id) AS counts
+        LEFT JOIN provenance ON provenance.id = counts.provenance_id
+    """,
+    # Only the :facet_limit standard variables covering the most datasets
+    "standard_variable": """
+        SELECT COALESCE(json_agg(json_build_object(
+            'standard_variable_id', standard_variables.id, 'standard_variable_name', standard_variables.name,
+            'count', counts.count
+        ) ORDER BY counts.count DESC, standard_variables.name), '[]'::json)
+        FROM (
+            SELECT variables_standard_variables.standard_variable_id, count(DISTINCT variables.dataset_id) AS count
+            FROM matched
+            JOIN variables ON variables.dataset_id = matched.id
+            JOIN variables_standard_variables ON variables_standard_variables.variable_id = variables.id
+            GROUP BY variables_standard_variables.standard_variable_id
+            ORDER BY count DESC, variables_standard_variables.standard_variable_id
+            LIMIT :facet_limit
+        ) AS counts
+        JOIN standard_variables ON standard_variables.id = counts.standard_variable_id
+    """,
+    # A dataset counts in every year its temporal coverage overlaps
+    "temporal_year": """
+        SELECT COALESCE(json_agg(json_build_object('year', counts.year, 'count', counts.count)
+            ORDER BY counts.year), '[]'::json)
+        FROM (
+            SELECT year, count(*) AS count
+            FROM matched, LATERAL generate_series(
+                CAST(extract(year FROM matched.temporal_coverage_start) AS integer),
+                CAST(extract(year FROM matched.temporal_coverage_end) AS integer)) AS year
+            GROUP BY year
+        ) AS counts
+    """,
+    "resource_type": """
+        SELECT COALESCE(json_agg(json_build_object('resource_type', counts.resource_type, 'count', counts.count)
+            ORDER BY counts.count DESC, counts.resource_type), '[]'::json)
+        FROM (
+            SELECT resources.resource_type, count(DISTINCT resources.dataset_id) AS count
+            FROM matched
+            JOIN resources ON resources.dataset_id = matched.id
+            GROUP BY resources.resource_type
+        ) AS counts
+    """
+}
+
+
+def _matched_datasets_sql(by_provenance: bool, by_keywords: bool, by_area: bool, from_time: bool,
+                          to_time: bool) -> str:
+    """The whole set matched by the filters, whatever the cursor position and the limit of the page"""
+    matched_sql = "SELECT datasets.id, datasets.provenance_id, datasets.temporal_coverage_start, " \
+                  "datasets.temporal_coverage_end FROM " + _datasets_from_sql(by_keywords)
+    conditions = _filter_conditions(by_provenance, by_keywords, by_area, from_time, to_time)
+    if len(conditions) > 0:
+        matched_sql += " WHERE " + " AND ".join(conditions)
+
+    return matched_sql
+
+
+@functools.lru_cache(maxsize=128)
+def _select_datasets_with_facets_statement(columns: Tuple[str, ...], with_variables: bool, facets: Tuple[str, ...],
+                                           *filters: bool) -> TextClause:
+    """The page of datasets, each row with a last 'facets' column holding the JSON object of the facets. The page is
+    joined to the facets rather than the other way round, so a search without matches still returns one row (with
+    a NULL dataset_id) carrying the facets."""
+    by_keywords = filters[1]
+    matched_sql = _matched_datasets_sql(*filters[:5])
+
+    page_sql = _select_datasets_with_variables_sql(columns, *filters) if with_variables \
+        else _select_datasets_sql(columns, *filters)
+    facets_sql = ", ".join(f"'{facet}', ({_FACETS_SQL[facet]})" for facet in facets)
+
+    query = f"WITH matched AS ({matched_sql}) " \
+            f"SELECT page.*, facets.facets " \
+            f"FROM (SELECT json_build_object({facets_sql}) AS facets) AS facets " \
+            f"LEFT JOIN ({page_sql}) AS page ON true " \
+            f"{_page_order_sql(by_keywords)}"
+
+    return text(query)
+
+
+@functools.lru_cache(maxsize=128)
+def _select_ranked_datasets_statement(columns: Tuple[str, ...], with_variables: bool, by_area: bool, from_time: bool,
+                                      to_time: bool) -> TextClause:
+    """Datasets ranked by the in-process search index: the ranking comes as arrays of ids, ranks and source flags,
+    in the same order and with the same sort key columns as a keyword search ranked by PostgreSQL"""
+    conditions = _filter_conditions(False, False, by_area, from_time, to_time)
+
+    query = "SELECT " + ", ".join(columns + ("ranked.search_rank", "ranked.has_source")) + " "
+    query += "FROM unnest(CAST(:ranked_ids AS uuid[]), CAST(:ranked_search_ranks AS double precision[]), " \
+             "CAST(:ranked_has_source AS integer[])) AS ranked(dataset_id, search_rank, has_source) " \
+             "JOIN datasets ON datasets.id = ranked.dataset_id "
+    if len(conditions) > 0:
+        query += "WHERE " + " AND ".join(conditions) + " "
+    query += "ORDER BY search_rank DESC, has_source DESC, dataset_id DESC LIMIT :limit"
+
+    return text(_with_variables_sql(query, True) if with_variables else query)
+
+
+def _build_ranked_statement(index: SearchIndex, columns: Tuple[str, ...], search_query: List, params: Dict[str, Any],
+                            with_variables: bool) -> Tuple[TextClause, Dict[str, Any]]:
+    by_area, from_time, to_time = "spatial_coverage" in params, "start_time" in params, "end_time" in params
+    after = None
+    if "after_dataset_id" in params:
+        after = (params["after_search_rank"], params["after_has_source"], params["after_dataset_id"])
+
+    # Without filters left to PostgreSQL the best ranked datasets are the page; with them, PostgreSQL picks the page
+    # from every match, since any of them may be the best one passing the filters. Ids and scores are cheap arrays;
+    # PostgreSQL keeps the best :limit of the matches passing the filters.
+    count = None if by_area or from_time or to_time else params["limit"]
+
+    ranked = index.rank(parse_keywords(search_query), params.get("provenance_id"), after, count)
+    ranked_params = {key: value for key, value in params.items()
+                     if key in ("limit", "start_time", "end_time") or key.startswith("spatial_")}
+    ranked_params["ranked_ids"] = [dataset_id for _, _, dataset_id in ranked]
+    ranked_params["ranked_search_ranks"] = [search_rank for search_rank, _, _ in ranked]
+    ranked_params["ranked_has_source"] = [has_source for _, has_source, _ in ranked]
+
+    return _select_ranked_datasets_statement(columns, with_variables, by_area, from_time, to_time), ranked_params
+
+
+def search_filter_params(provenance_id: str=None, search_query: List=None, spatial_coverage: dict=None,
+                         temporal_coverage: dict=None) -> Dict[str, Any]:
+    """Validated parameters of the search filters present in a request"""
+    params: Dict[str, Any] = {}
+
+    if provenance_id is not None:
+        params["provenance_id"] = str(provenance_id)
+
+    if search_query is not None:
+        params["search_string"] = tsquery_string(search_query)
+
+    if spatial_coverage is not None:
+        params.update(query_geometry_params(query_geometry(spatial_coverage)))
+
+    temporal_coverage = temporal_coverage or {}
+    if temporal_coverage.get('start_time') is not None:
+        params["start_time"] = parse_coverage_time(temporal_coverage['start_time'], 'start_time')
+    if temporal_coverage.get('end_time') is not None:
+        params["end_time"] = parse_coverage_time(temporal_coverage['end_time'], 'end_time')
+    if params.get("start_time") is not None and params.get("end_time") is not None \
+            and params["start_time"] > params["end_time"]:
+        raise BadRequestException({'InvalidQueryDefinition': f"'start_time' of 'temporal_coverage' must not be later "
+                                                             f"than its 'end_time'; received {temporal_coverage}"})
+
+    return params
+
+
+def _search_index_for_page(page: Optional[Page], with_facets: bool) -> Optional[SearchIndex]:
+    """Index ranking a keyword search, None when PostgreSQL ranks it. The search rank in a cursor only compares with
+    ranks of the engine that issued it (BM25 scores against ts_rank_cd), so a search continues with the engine of its
+    first page: with PostgreSQL when it fell back to it, and never falling back while the index ranks it."""
+    after_ranking = None
+    if page is not None and page.after is not None:
+        # Cursors without an engine were issued by PostgreSQL
+        after_ranking = page.ranking or "postgres"
+
+    index = None
+    if not with_facets and after_ranking in (None, "memory"):
+        index = get_search_index()
+
+    if after_ranking == "memory" and index is None:
+        if with_facets:
+            raise BadRequestException({'InvalidQueryDefinition': "Cursor was issued for a search without 'facets'; "
+                                                                 "repeat the fields of the first page"})
+        raise InternalServerException("The search index is unavailable; the pages of this search cannot be continued, "
+                                      "retry or start again from the first page")
+
+    if page is not None:
+        page.ranking = "memory" if index is not None else "postgres"
+
+    return index
+
+
+def build_select_datasets_statement(columns: Tuple[str, ...], provenance_id: str=None, search_query: List=None,
+                                    spatial_coverage: dict=None, temporal_coverage: dict=None, limit: int=20,
+                                    with_variables: bool=False, after: list=None, facets: Tuple[str, ...]=(),
+                                    facet_limit: int=50, candidate_budget: int=None,
+                                    page: Page=None) -> Tuple[TextClause, Dict[str, Any]]:
+    """with_variables adds a last column holding the JSON array of each dataset's variables and their standard
+    variables, so a page of search results is fetched in one round trip. after is the search_sort_key of the last row
+    of the previous page. facets (names from SEARCH_FACETS) add a last column holding their counts; see
+    _select_datasets_with_facets_statement. candidate_budget ranks keyword searches in two phases; see
+    _select_datasets_sql.
+
+    With SEARCH_ENGINE=memory, keyword searches without facets are ranked by the in-process search index, and
+    PostgreSQL only applies the spatial and temporal filters to the ranked datasets. The engine ranking a keyword
+    search is recorded in page.ranking, and the next pages are ranked by the same one; see _search_index_for_page."""
+    params = search_filter_params(provenance_id, search_query, spatial_coverage, temporal_coverage)
+    params["limit"] = limit
+
+    if after is not None:
+        try:
+            if search_query is not None:
+                params["after_search_rank"] = float(after[0])
+                params["after_has_source"] = int(after[1])
+            params["after_dataset_id"] = str(uuid.UUID(str(after[-1])))
+        except (TypeError, ValueError):
+            raise BadRequestException({'InvalidQueryDefinition': f"Invalid cursor position: {after}"})
+
+    if candidate_budget is not None and search_query is not None:
+        params["candidate_budget"] = candidate_budget
+
+    filters = ("provenance_id" in params, "search_string" in params, "spatial_coverage" in params,
+               "start_time" in params, "end_time" in params, after is not None, "candidate_budget" in params)
+
+    if search_query is not None:
+        index = _search_index_for_page(page, len(facets) > 0)
+        if index is not None:
+            return _build_ranked_statement(index, columns, search_query, params, with_variables)
+
+    if len(facets) > 0:
+        if "standard_variable" in facets:
+            params["facet_limit"] = facet_limit
+        return _select_datasets_with_facets_statement(columns, with_variables, tuple(facets), *filters), params
+
+    build_statement = _select_datasets_with_variables_statement if with_variables else _select_datasets_statement
+    return build_statement(columns, *filters), params
+
+
+# Resource counts per time bucket: a resource counts in every bucket its temporal coverage overlaps. Rather than
+# expanding each resource into its buckets, the first bucket of every resource adds one and the bucket after its last
+# one removes one, and a running sum over the buckets of the whole span gives the counts: the work is linear in
+# resources plus buckets however long the coverage of each resource is.
+TEMPORAL_HISTOGRAM_BUCKETS = ("day", "month", "year")
+# Buckets a histogram may hold when its bucket is requested; automatic buckets stay around 400
+MAX_TEMPORAL_HISTOGRAM_BUCKETS = 5000
+
+
+# Reads the resources in the 'coverage' CTE, as (first_time, last_time)
+_TEMPORAL_HISTOGRAM_SQL = f"""
+span AS (
+    SELECT coalesce(CAST(:bucket AS text), CASE
+               WHEN max(last_time) - min(first_time) <= interval '400 days' THEN 'day'
+               WHEN max(last_time) - min(first_time) <= interval '12000 days' THEN 'month'
+               ELSE 'year' END) AS bucket,
+           min(first_time) AS first_time, max(last_time) AS last_time
+    FROM coverage
+),
+changes AS (
+    SELECT edges.bucket_start, sum(edges.delta) AS delta
+    FROM (
+        SELECT date_trunc(span.bucket, coverage.first_time) AS bucket_start, 1 AS delta FROM coverage, span
+        UNION ALL
+        SELECT date_trunc(span.bucket, coverage.last_time) + CAST('1 ' || span.bucket AS interval), -1
+        FROM coverage, span
+    ) AS edges
+    GROUP BY edges.bucket_start
+)
+SELECT span.bucket, buckets.bucket_start,
+       CAST(sum(coalesce(changes.delta, 0)) OVER (ORDER BY buckets.bucket_start) AS integer) AS count
+FROM span
+CROSS JOIN LATERAL generate_series(date_trunc(span.bucket, span.first_time), date_trunc(span.bucket, span.last_time),
+                                   CAST('1 ' || span.bucket AS interval)) AS buckets(bucket_start)
+LEFT JOIN changes ON changes.bucket_start = buckets.bucket_start
+ORDER BY buckets.bucket_start
+LIMIT {MAX_TEMPORAL_HISTOGRAM_BUCKETS + 1}
+"""
+
+
+@functools.lru_cache(maxsize=128)
+def _temporal_histogram_statement(by_dataset: bool, by_provenance: bool, by_keywords: bool, by_area: bool,
+                                  from_time: bool, to_time: bool) -> TextClause:
+    """Rows of (bucket, bucket_start, count); the coverage of resources is clipped to the requested period, if any"""
+    first_time = "lower(temporal_coverage_index.temporal_coverage)"
+    last_time = "upper(temporal_coverage_index.temporal_coverage)"
+    conditions = ["temporal_coverage_index.temporal_coverage IS NOT NULL"]
+    # Open-ended coverages are counted within the requested period only: they have no first or last bucket
+    if not from_time:
+        conditions.append("NOT lower_inf(temporal_coverage_index.temporal_coverage)")
+    if not to_time:
+        conditions.append("NOT upper_inf(temporal_coverage_index.temporal_coverage)")
+    if from_time or to_time:
+        lower = "CAST(:start_time AS timestamp)" if from_time else "NULL"
+        upper = "CAST(:end_time AS timestamp)" if to_time else "NULL"
+        conditions.append(f"temporal_coverage_index.temporal_coverage && tsrange({lower}, {upper}, '[]')")
+        if from_time:
+            # greatest and least ignore the NULL bound of an open-ended coverage
+            first_time = f"greatest({first_time}, CAST(:start_time AS timestamp))"
+        if to_time:
+            last_time = f"least({last_time}, CAST(:end_time AS timestamp))"
+
+    coverage_sql = f"SELECT {first_time} AS first_time, {last_time} AS last_time " \
+                   f"FROM temporal_coverage_index " \
+                   f"JOIN resources ON resources.id = temporal_coverage_index.indexed_id "
+    ctes = []
+    if by_dataset:
+        conditions.append("resources.dataset_id = :dataset_id")
+    else:
+        # The requested period applies to the coverage of resources rather than to that of their datasets
+        ctes.append(f"matched AS ({_matched_datasets_sql(by_provenance, by_keywords, by_area, False, False)})")
+        coverage_sql += "JOIN matched ON matched.id = resources.dataset_id "
+    ctes.append(f"coverage AS ({coverage_sql}WHERE {' AND '.join(conditions)})")
+
+    query = "WITH " + ", ".join(ctes) + ", " + _TEMPORAL_HISTOGRAM_SQL
+    return text(query)
+
+
+def build_temporal_histogram_statement(dataset_id: str=None, provenance_id: str=None, search_query: List=None,
+                                       spatial_coverage: dict=None, temporal_coverage: dict=None,
+                                       bucket: str=None) -> Tuple[TextClause, Dict[str, Any]]:
+    """Resource counts per bucket of time for the resources of a dataset, or of the datasets a search matches. The
+    bucket is day, month or year; without one, the finest keeping the histogram to about 400 buckets is taken."""
+    if bucket is not None and bucket not in TEMPORAL_HISTOGRAM_BUCKETS:
+        raise BadRequestException({'InvalidQueryDefinition': f"Invalid value for 'bucket': {bucket}; must be either "
+                                                             f"of {list(TEMPORAL_HISTOGRAM_BUCKETS)}"})
+
+    params = search_filter_params(provenance_id, search_query, spatial_coverage, temporal_coverage)
+    params["bucket"] = bucket
+    if dataset_id is not None:
+        params["dataset_id"] = dataset_id
+
+    statement = _temporal_histogram_statement(dataset_id is not None, "provenance_id" in params,
+                                              "search_string" in params, "spatial_coverage" in params,
+                                              "start_time" in params, "end_time" in params)
+    return statement, params
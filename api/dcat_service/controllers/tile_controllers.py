@@ -0,0 +1,222 @@
+from typing import *
+import threading
+import uuid
+
+from sqlalchemy import text
+
+from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.metrics import registry
+from dcat_service.result_cache import ResultCache
+from dcat_service.settings import Settings
+from dcat_service import session_scope
+
+logger = get_logger(__name__)
+
+# Mapbox Vector Tiles of catalog coverage, so a map fetches the coverage of what is visible at its zoom level rather
+# than full GeoJSON. A tile is one layer:
+# - 'datasets': the coverage of every dataset crossing the tile;
+# - 'resources' (tiles of one dataset, from zoom TILE_RESOURCE_DETAIL_ZOOM): the coverage of its resources, from
+#   spatial_coverage_index;
+# - 'resource_cells' (tiles of one dataset, below that zoom): a point per spatial grid cell a sixty-fourth of the tile,
+#   counting the resources of the dataset in it, since the coverage of thousands of resources would not be readable.
+#   Resources covering the whole tile with coarser cells count in a point at the center of the tile.
+# Coverage is clipped to the tile before it is projected, so global coverage (+/-90 degrees) stays within the web map.
+# Tiles are cached per worker and invalidated by the catalog change feed: dataset tiles on any change, resource tiles
+# when their dataset changes or on syncs.
+
+TILE_CACHE_LOOKUPS = registry.counter(
+    "dcat_tile_cache_lookups_total", "Vector tile cache lookups, by layer and outcome: hit, miss or bypass",
+    ("layer", "outcome"))
+TILE_CACHE_EVICTIONS = registry.counter(
+    "dcat_tile_cache_evictions_total", "Vector tile cache entries removed, by reason: size, ttl or change", ("reason",))
+TILE_CACHE_ENTRIES = registry.gauge("dcat_tile_cache_entries", "Entries in the vector tile cache of this process")
+
+MAX_ZOOM = 24
+EXTENT = 4096
+# Pixels of coverage kept around the tile, so strokes of polygons crossing tile edges do not show seams
+BUFFER = 64
+# Deepest level of spatial_grid_cells (see spatial_grid_cover)
+GRID_MAX_LEVEL = 16
+# Resource counts are bucketed by cells this many levels below the tile: 8 x 8 per tile
+GRID_BUCKET_LEVELS = 3
+
+_BOUNDS = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(:z, :x, :y) AS tile, ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326) AS tile_4326
+)
+"""
+
+_DATASETS_TILE = _BOUNDS + f"""
+SELECT ST_AsMVT(features, 'datasets', {EXTENT}, 'geom')
+FROM (
+    SELECT datasets.id::text AS dataset_id, datasets.name AS dataset_name,
+           ST_AsMVTGeom(ST_Transform(ST_ClipByBox2D(datasets.spatial_coverage, bounds.tile_4326::box2d), 3857),
+                        bounds.tile, {EXTENT}, {BUFFER}, true) AS geom
+    FROM datasets, bounds
+    WHERE datasets.spatial_coverage && bounds.tile_4326
+    LIMIT :max_features
+) AS features
+WHERE features.geom IS NOT NULL
+"""
+
+_RESOURCES_TILE = _BOUNDS + f"""
+SELECT ST_AsMVT(features, 'resources', {EXTENT}, 'geom')
+FROM (
+    SELECT resources.id::text AS resource_id, resources.name AS resource_name,
+           ST_AsMVTGeom(ST_Transform(ST_ClipByBox2D(spatial_coverage_index.spatial_coverage,
+                                                    bounds.tile_4326::box2d), 3857),
+                        bounds.tile, {EXTENT}, {BUFFER}, true) AS geom
+    FROM resources
+    JOIN spatial_coverage_index ON spatial_coverage_index.indexed_type = 'RESOURCE'
+                                AND spatial_coverage_index.indexed_id = resources.id, bounds
+    WHERE resources.dataset_id = :dataset_id AND spatial_coverage_index.spatial_coverage && bounds.tile_4326
+    LIMIT :max_features
+) AS features
+WHERE features.geom IS NOT NULL
+"""
+
+# Cells inside the tile have its quadkey as prefix, and cells containing it are prefixes of its quadkey: a coverage
+# larger than the tile may only have such coarse cells, which count in the bucket of the whole tile. Cells coarser than
+# a bucket are their own bucket.
+_RESOURCE_CELLS_TILE = f"""
+WITH tile_cells AS (
+    SELECT spatial_grid_cells.indexed_id,
+           CASE WHEN length(spatial_grid_cells.cell) < :z THEN CAST(:quadkey AS text)
+                ELSE left(spatial_grid_cells.cell, :bucket_level) END AS cell
+    FROM spatial_grid_cells
+    WHERE spatial_grid_cells.indexed_type = 'RESOURCE'
+          AND (spatial_grid_cells.cell LIKE :quadkey_prefix
+               OR spatial_grid_cells.cell = ANY(CAST(:quadkey_ancestors AS text[])))
+),
+buckets AS (
+    SELECT tile_cells.cell, count(DISTINCT tile_cells.indexed_id) AS resource_count
+    FROM tile_cells
+    JOIN resources ON resources.id = tile_cells.indexed_id
+    WHERE resources.dataset_id = :dataset_id
+    GROUP BY tile_cells.cell
+    LIMIT :max_features
+)
+SELECT ST_AsMVT(features, 'resource_cells', {EXTENT}, 'geom')
+FROM (
+    SELECT buckets.cell, buckets.resource_count,
+           ST_AsMVTGeom(ST_Centroid(grid_cell_envelope(buckets.cell)), ST_TileEnvelope(:z, :x, :y), {EXTENT}, 0,
+                        true) AS geom
+    FROM buckets
+) AS features
+WHERE features.geom IS NOT NULL
+"""
+
+
+def _invalid(message: str) -> BadRequestException:
+    return BadRequestException({'InvalidQueryDefinition': message})
+
+
+def quadkey(z: int, x: int, y: int) -> str:
+    """Quadkey of tile (x, y) of zoom level z, as grid_cell_quadkey in the database"""
+    return "".join(str(((x >> (z - i)) & 1) | (((y >> (z - i)) & 1) << 1)) for i in range(1, z + 1))
+
+
+def quadkey_ancestors(key: str) -> List[str]:
+    """Quadkeys of the tiles containing the tile of a quadkey, from the whole world ('') down to its parent"""
+    return [key[:level] for level in range(len(key))]
+
+
+def _tile_query(z: int, x: int, y: int, dataset_id: Optional[str]) -> Tuple[str, str, Dict[str, Any]]:
+    """(layer, sql, params) of a tile"""
+    settings = Settings.get_instance().tiles
+    params = {"z": z, "x": x, "y": y, "max_features": settings.max_features}
+    if dataset_id is None:
+        return "datasets", _DATASETS_TILE, params
+
+    params["dataset_id"] = dataset_id
+    if z >= settings.resource_detail_zoom:
+        return "resources", _RESOURCES_TILE, params
+
+    params["quadkey"] = quadkey(z, x, y)
+    params["quadkey_prefix"] = params["quadkey"] + "%"
+    params["quadkey_ancestors"] = quadkey_ancestors(params["quadkey"])
+    params["bucket_level"] = min(z + GRID_BUCKET_LEVELS, GRID_MAX_LEVEL)
+    return "resource_cells", _RESOURCE_CELLS_TILE, params
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_tile_cache() -> Optional[ResultCache]:
+    """Tile cache of this process; None when disabled"""
+    global _cache
+    if _cache is None:
+        settings = Settings.get_instance().tiles
+        if settings.cache_max_entries <= 0:
+            return None
+
+        from dcat_service import change_feed
+
+        with _cache_lock:
+            if _cache is None:
+                cache = ResultCache(settings.cache_max_entries, settings.cache_ttl, TILE_CACHE_ENTRIES,
+                                    TILE_CACHE_EVICTIONS)
+                change_feed.subscribe(cache.invalidate)
+                _cache = cache
+
+    return _cache
+
+
+def _lookup(layer: str, key: str) -> Tuple[Optional[ResultCache], bool, Optional[bytes]]:
+    """(cache, hit, tile); cache is None when the request bypasses the cache"""
+    cache = get_tile_cache()
+    if cache is None:
+        return None, False, None
+
+    from dcat_service import change_feed
+
+    try:
+        change_feed.poll()
+    except Exception:
+        logger.warning("Could not read the catalog change feed; bypassing the tile cache", exc_info=True)
+        cache.clear()
+        TILE_CACHE_LOOKUPS.inc(layer=layer, outcome="bypass")
+        return None, False, None
+
+    hit, tile = cache.get(key)
+    TILE_CACHE_LOOKUPS.inc(layer=layer, outcome="hit" if hit else "miss")
+    return cache, hit, tile
+
+
+def get_tile(z: int, x: int, y: int, dataset_id: Optional[str]=None) -> bytes:
+    """Mapbox Vector Tile (x, y) of zoom level z: the coverage of datasets, or of the resources of a dataset"""
+    if not 0 <= z <= MAX_ZOOM:
+        raise _invalid(f"Zoom level must be between 0 and {MAX_ZOOM}; received {z}")
+    if not 0 <= x < (1 << z) or not 0 <= y < (1 << z):
+        raise _invalid(f"Tile ({x}, {y}) does not exist at zoom level {z}")
+    if dataset_id is not None:
+        try:
+            dataset_id = str(uuid.UUID(str(dataset_id)))
+        except ValueError:
+            raise _invalid(f"'dataset_id' value must be a valid UUID v4; received {dataset_id}")
+
+    layer, sql, params = _tile_query(z, x, y, dataset_id)
+    key = f"{z}/{x}/{y}" if dataset_id is None else f"{z}/{x}/{y}?dataset_id={dataset_id}"
+    cache, hit, tile = _lookup(layer, key)
+    if hit:
+        return tile
+
+    generation = cache.generation if cache is not None else None
+    try:
+        with session_scope(read_only=True) as session:
+            tile = session.execute(text(sql), params).scalar()
+    except Exception as e:
+        logger.exception("Query failed")
+        raise InternalServerException(e)
+
+    # ST_AsMVT of no features
+    tile = bytes(tile) if tile is not None else b""
+    if cache is not None:
+        if dataset_id is None:
+            cache.put(key, tile, None, False, generation)
+        else:
+            cache.put(key, tile, frozenset([dataset_id]), True, generation)
+
+    return tile
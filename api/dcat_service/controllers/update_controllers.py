@@ -1,19 +1,21 @@
 from typing import *
 
 import uuid
-import sys
-import traceback
 import json
 
 from dcat_service import session_scope
+from dcat_service.change_feed import record_change
 from dcat_service.models.dataset import Dataset
 from dcat_service.models.resource import Resource
 from dcat_service.models.variable import Variable
 from dcat_service.models.standard_variable import StandardVariable
 
 from dcat_service.misc.exception import BadRequestException, InternalServerException
+from dcat_service.misc.logger import get_logger
 from sqlalchemy.orm.attributes import flag_modified
 
+logger = get_logger(__name__)
+
 
 def update_dataset_viz_status(update_definition: Dict) -> Dict:
     if len(update_definition) == 0:
@@ -45,6 +47,8 @@ def update_dataset_viz_status(update_definition: Dict) -> Dict:
         # update dataset metadata
         dataset.json_metadata[viz_config_id]["visualized"] = True
         flag_modified(dataset, "json_metadata")
+        # Viz configs are not searched: only results containing the dataset change
+        record_change(session, dataset_ids=[dataset_id], membership=False)
 
     return {"success": True}
 
@@ -83,6 +87,7 @@ def update_dataset_viz_config(update_definition: Dict) -> Dict:
         # update dataset metadata
         dataset.json_metadata[viz_config_id].update(new_viz_config_vals)
         flag_modified(dataset, "json_metadata")
+        record_change(session, dataset_ids=[dataset_id], membership=False)
 
     return {"success": True}
 
@@ -157,13 +162,15 @@ def update_dataset(update_definition: Dict) -> Dict:
                 update_query_arr.append(f"WHERE datasets.id = '{dataset_id}'")
                 update_query = " ".join(update_query_arr)
 
-                print(update_query)
+                logger.debug("%s", update_query)
                 session.execute(update_query)
+                # Name, description and metadata feed name matching and the search text
+                record_change(session, dataset_ids=[dataset_id])
 
         return {"success": True, "dataset_id": dataset_id, "changes": changes}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Update failed")
         raise InternalServerException(e)
 
 
@@ -243,13 +250,14 @@ def update_resource(update_definition: Dict) -> Dict:
                 update_query_arr.append(f"WHERE resources.id = '{resource_id}'")
                 update_query = " ".join(update_query_arr)
 
-                print(update_query)
+                logger.debug("%s", update_query)
                 session.execute(update_query)
+                record_change(session, dataset_ids=[resource.dataset_id], membership=False)
 
         return {"success": True, "resource_id": resource_id, "changes": changes}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Update failed")
         raise InternalServerException(e)
 
 
@@ -314,13 +322,15 @@ def update_variable(update_definition: Dict) -> Dict:
                 update_query_arr.append(f"WHERE variables.id = '{variable_id}'")
                 update_query = " ".join(update_query_arr)
 
-                print(update_query)
+                logger.debug("%s", update_query)
                 session.execute(update_query)
+                # Datasets are found by the names of their variables, so a rename changes which searches match
+                record_change(session, dataset_ids=[variable.dataset_id], membership=name is not None)
 
         return {"success": True, "variable_id": variable_id, "changes": changes}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Update failed")
         raise InternalServerException(e)
 
 
@@ -381,13 +391,15 @@ def update_standard_variable(update_definition: Dict) -> Dict:
                 update_query_arr.append(f"WHERE standard_variables.id = '{standard_variable_id}'")
                 update_query = " ".join(update_query_arr)
 
-                print(update_query)
+                logger.debug("%s", update_query)
                 session.execute(update_query)
+                # Datasets are found by the names of their standard variables
+                record_change(session, dataset_ids=None)
 
         return {"success": True, "standard_variable_id": standard_variable_id, "changes": changes}
 
     except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+        logger.exception("Update failed")
         raise InternalServerException(e)
 
 
@@ -397,8 +409,9 @@ def sync_datasets_metadata() -> List[Dict]:
     responses.append(_update_polygon_point_coverage())
     responses.append(_update_temporal_coverage())
     responses.append(_update_resource_summary())
-    responses.append(_update_variables_list())
-    responses.append(_update_standard_variables_list())
+
+    with session_scope() as session:
+        record_change(session, dataset_ids=None)
 
     return responses
 
@@ -510,58 +523,15 @@ def _update_resource_summary():
             return {"updated_resource_summary": False, "error": e}
 
 
-def _update_variables_list():
-    with session_scope() as session:
-        query = """
-                with variables_summary as (
-        	        select variables.dataset_id as dataset_id, 
-        	            string_agg(variables.name, ',') as variables_list 
-        	        from variables 
-        	        group by dataset_id
-                )
-                UPDATE datasets
-                set variables_list = variables_summary.variables_list
-                from variables_summary 
-                where datasets.id = variables_summary.dataset_id"""
-
-        try:
-            session.execute(query)
-            return {"updated_variables_list": True}
-        except Exception as e:
-            return {"updated_variables_list": False, "error": e}
-
-
-def _update_standard_variables_list():
-    with session_scope() as session:
-        query = """
-                with standard_variables_summary as (
-        	        select variables.dataset_id as dataset_id, 
-        	            string_agg(standard_variables.name, ',') as standard_variables_list 
-        	        from variables 
-        	        join variables_standard_variables on variables.id = variables_standard_variables.variable_id
-        	        join standard_variables on standard_variables.id = variables_standard_variables.standard_variable_id
-        	        group by dataset_id
-                )
-                UPDATE datasets
-                set standard_variables_list = standard_variables_summary.standard_variables_list
-                from standard_variables_summary 
-                where datasets.id = standard_variables_summary.dataset_id"""
-
-        try:
-            session.execute(query)
-            return {"updated_standard_variables_list": True}
-        except Exception as e:
-            return {"updated_standard_variables_list": False, "error": e}
-
-
 def sync_dataset_metadata(dsid) -> List[Dict]:
     responses = []
     responses.append(_update_polygon_spatial_coverage_query_ds(dsid))
     responses.append(_update_polygon_point_coverage_ds(dsid))
     responses.append(_update_temporal_coverage_ds(dsid))
     responses.append(_update_resource_summary_ds(dsid))
-    responses.append(_update_variables_list_ds(dsid))
-    responses.append(_update_standard_variables_list_ds(dsid))
+
+    with session_scope() as session:
+        record_change(session, dataset_ids=[dsid])
 
     return responses
 
@@ -677,51 +647,5 @@ def _update_resource_summary_ds(dsid):
             return {"updated_resource_summary": False, "error": e}
 
 
-def _update_variables_list_ds(dsid):
-    with session_scope() as session:
-        query = f"""
-                with variables_summary as (
-        	        select variables.dataset_id as dataset_id, 
-        	            string_agg(variables.name, ',') as variables_list 
-        	        from variables 
-                    where dataset_id='{dsid}'
-        	        group by dataset_id
-                )
-                UPDATE datasets
-                set variables_list = variables_summary.variables_list
-                from variables_summary 
-                where datasets.id = variables_summary.dataset_id"""
-
-        try:
-            session.execute(query)
-            return {"updated_variables_list": True}
-        except Exception as e:
-            return {"updated_variables_list": False, "error": e}
-
-
-def _update_standard_variables_list_ds(dsid):
-    with session_scope() as session:
-        query = f"""
-                with standard_variables_summary as (
-        	        select variables.dataset_id as dataset_id, 
-        	            string_agg(standard_variables.name, ',') as standard_variables_list 
-        	        from variables 
-        	        join variables_standard_variables on variables.id = variables_standard_variables.variable_id
-        	        join standard_variables on standard_variables.id = variables_standard_variables.standard_variable_id
-                    where dataset_id='{dsid}'
-        	        group by dataset_id
-                )
-                UPDATE datasets
-                set standard_variables_list = standard_variables_summary.standard_variables_list
-                from standard_variables_summary 
-                where datasets.id = standard_variables_summary.dataset_id"""
-
-        try:
-            session.execute(query)
-            return {"updated_standard_variables_list": True}
-        except Exception as e:
-            return {"updated_standard_variables_list": False, "error": e}
-
-
 def _get_change_record(old_value, new_value):
     return {"from": old_value, "to": new_value}
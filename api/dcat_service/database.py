@@ -0,0 +1,226 @@
+from typing import *
+from contextlib import contextmanager
+from dcat_service.settings import Settings
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.metrics import registry
+from dcat_service.router import current_statement_timeout
+from dcat_service.misc.sql_profiler import install_sql_profiler
+from dcat_service.misc.pool_monitor import InstrumentedQueuePool, install_pool_monitor, forget_pools
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+import os
+import itertools
+import threading
+import time
+import ujson
+
+# Engines and their connection pools belong to the process that created them. They are created lazily, on first
+# use, so a pre-forking server can import the app in its master process and every worker builds its own pools.
+# Keyed by "primary" and "replica:<host>:<port>".
+_engines: Dict[str, Engine] = {}
+_engines_pid = None
+_engine_lock = threading.Lock()
+# Engines inherited across fork are kept referenced rather than garbage collected: closing their connections in the
+# child would terminate sessions the parent process is still using over the same sockets
+_inherited_engines = []
+
+PRIMARY = "primary"
+
+DB_ROUTING = registry.counter(
+    "dcat_db_session_routing_total",
+    "Sessions opened, by target: primary, replica, or fallback (read-only session sent to the primary because no "
+    "replica was healthy)", ("target",))
+
+# A replica is in sync when it has replayed everything it received; otherwise lag is the age of the last replayed
+# transaction
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+Session = sessionmaker(expire_on_commit=False)
+
+logger = get_logger(__name__)
+
+
+class _ReplicaHealth:
+    """Replication lag of one replica, re-checked at most once per interval by whichever thread gets there first"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.healthy = True
+        self.lag_seconds = None
+        self.checked_at = None
+        self._check_lock = threading.Lock()
+
+    def is_healthy(self, engine: Engine, max_lag_seconds: float, check_interval: float) -> bool:
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < check_interval:
+            return self.healthy
+
+        # Other threads keep using the last known state while one of them runs the check
+        if not self._check_lock.acquire(blocking=False):
+            return self.healthy and self.checked_at is not None
+
+        try:
+            with engine.connect() as connection:
+                self.lag_seconds = float(connection.execute(REPLICA_LAG_QUERY).scalar())
+            self.healthy = self.lag_seconds <= max_lag_seconds
+            if not self.healthy:
+                logger.warning("Replica %s is %.1f s behind the primary; routing reads elsewhere", self.key,
+                               self.lag_seconds)
+        except Exception:
+            self.healthy = False
+            self.lag_seconds = None
+            logger.warning("Replica %s failed its lag check; routing reads elsewhere", self.key, exc_info=True)
+        finally:
+            self.checked_at = time.monotonic()
+            self._check_lock.release()
+
+        return self.healthy
+
+
+_replica_health: Dict[str, _ReplicaHealth] = {}
+_replica_counter = itertools.count()
+
+
+def _pool_options() -> Dict[str, Any]:
+    pool = Settings.get_instance().database.pool
+    if pool.external_pooler:
+        # The external pooler owns the server connections; holding them here as well would pin them to this process
+        return {"poolclass": NullPool}
+
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": pool.size,
+        "max_overflow": pool.max_overflow,
+        "pool_timeout": pool.timeout,
+        "pool_recycle": pool.recycle,
+        "pool_pre_ping": pool.pre_ping
+    }
+
+
+def _create_engine(key: str, host: str, port: str) -> Engine:
+    settings = Settings.get_instance()
+    db = settings.database
+    connection_string = f"postgresql+psycopg2://{db.user}:{db.password}@{host}:{port}/{db.db_name}"
+    # json/jsonb columns are (de)serialized by ujson so result rows are decoded once, in C
+    engine = create_engine(connection_string, echo=False, json_serializer=ujson.dumps, json_deserializer=ujson.loads,
+                           **_pool_options())
+
+    @event.listens_for(engine, "connect")
+    def record_pid(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        # Never hand out a connection created by another process
+        if connection_record.info["pid"] != os.getpid():
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                f"Connection record belongs to pid {connection_record.info['pid']}, "
+                f"attempting to check out in pid {os.getpid()}")
+
+    install_sql_profiler(engine, settings.profiling)
+    install_pool_monitor(engine, key)
+    return engine
+
+
+def _get_engine(key: str, host: str, port: str) -> Engine:
+    global _engines_pid
+    engine = _engines.get(key) if _engines_pid == os.getpid() else None
+    if engine is None:
+        with _engine_lock:
+            if _engines_pid != os.getpid():
+                _inherited_engines.extend(_engines.values())
+                _engines.clear()
+                _replica_health.clear()
+                forget_pools()
+                _engines_pid = os.getpid()
+
+            engine = _engines.get(key)
+            if engine is None:
+                engine = _engines[key] = _create_engine(key, host, port)
+
+    return engine
+
+
+def _get_replica_engine() -> Optional[Engine]:
+    """Round-robin over the configured replicas, skipping any that lag or fail their check"""
+    db = Settings.get_instance().database
+    if not db.replicas:
+        return None
+
+    start = next(_replica_counter)
+    for i in range(len(db.replicas)):
+        host, port = db.replicas[(start + i) % len(db.replicas)]
+        key = f"replica:{host}:{port}"
+        engine = _get_engine(key, host, port)
+        health = _replica_health.get(key)
+        if health is None:
+            health = _replica_health.setdefault(key, _ReplicaHealth(key))
+
+        if health.is_healthy(engine, db.replica_max_lag_seconds, db.replica_lag_check_interval):
+            return engine
+
+    return None
+
+
+def get_engine(read_only: bool=False) -> Engine:
+    """Engine of the primary, or of a healthy replica for read-only work when replicas are configured"""
+    db = Settings.get_instance().database
+    if read_only and db.replicas:
+        engine = _get_replica_engine()
+        if engine is not None:
+            DB_ROUTING.inc(target="replica")
+            return engine
+
+        DB_ROUTING.inc(target="fallback")
+    else:
+        DB_ROUTING.inc(target=PRIMARY)
+
+    return _get_engine(PRIMARY, db.host, db.port)
+
+
+def dispose_engine():
+    """Close the pooled connections owned by this process; the next session creates fresh engines"""
+    global _engines_pid
+    with _engine_lock:
+        if _engines_pid == os.getpid():
+            for engine in _engines.values():
+                engine.dispose()
+        else:
+            _inherited_engines.extend(_engines.values())
+
+        _engines.clear()
+        _replica_health.clear()
+        forget_pools()
+        _engines_pid = None
+
+
+@contextmanager
+def session_scope(read_only: bool=False):
+    """Provide a transactional scope around a series of operations.
+
+    Read-only sessions may be served by a replica and can miss the most recent writes, so anything that reads its own
+    writes (registration, updates, validation lookups) must use the primary."""
+    session = Session(bind=get_engine(read_only))
+    try:
+        if read_only:
+            session.execute("SET TRANSACTION READ ONLY")
+
+        statement_timeout = current_statement_timeout()
+        if statement_timeout is not None:
+            session.execute(f"SET LOCAL statement_timeout = {int(statement_timeout)}")
+
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
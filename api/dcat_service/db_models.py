@@ -2,8 +2,8 @@ from typing import *
 
 from sqlalchemy.ext.declarative import declarative_base
 
-from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
-from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB, TSRANGE
+from sqlalchemy.sql import func, expression
 
 from sqlalchemy import Index, PrimaryKeyConstraint, UniqueConstraint, Table, Column, String, ForeignKey, DateTime, orm, Boolean
 from sqlalchemy.orm import relationship
@@ -44,10 +44,13 @@ class DatasetDB(Base):
     created_at = Column(DateTime, nullable=False, index=True, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), server_onupdate=func.now())
 
-    tsv = Column(TSVECTOR, nullable=True)
+    # Set by the datasets_tsv_trigger from json_metadata
+    has_source = Column(Boolean, nullable=False, server_default=expression.false())
     spatial_coverage = Column(Geometry(srid=LOCATION_SRID))
     temporal_coverage_start = Column(DateTime)
     temporal_coverage_end = Column(DateTime)
+    # Set by the datasets_tsv_trigger from temporal_coverage_start and temporal_coverage_end
+    temporal_coverage = Column(TSRANGE)
 
     provenance = relationship("ProvenanceDB", back_populates="datasets")
 
@@ -196,10 +199,36 @@ class TemporalCoverageIndexDB(Base):
     indexed_id = Column(postgresql.UUID(as_uuid=True), nullable=False)
     start_time = Column(DateTime, nullable=False, index=True)
     end_time = Column(DateTime, nullable=False, index=True)
+    # Set by the temporal_coverage_index_range trigger from start_time and end_time
+    temporal_coverage = Column(TSRANGE)
 
     __table_args__ = (PrimaryKeyConstraint(indexed_type, indexed_id, name="indexed_temporal_coverage_constraint"), )
 
 
+class DatasetSearchDocumentDB(Base):
+    """Full-text document of a dataset, maintained by database triggers (see postgres/db.sql); read-only here"""
+    __tablename__ = "dataset_search_documents"
+
+    dataset_id = Column(postgresql.UUID(as_uuid=True), ForeignKey("datasets.id", ondelete="CASCADE"),
+                        primary_key=True)
+    variables_text = Column(String, nullable=False, server_default="")
+    standard_variables_text = Column(String, nullable=False, server_default="")
+    stale = Column(Boolean, nullable=False, server_default=expression.true())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class SpatialGridCellDB(Base):
+    """Quadkey of a web map tile covering a dataset ('DATASET') or a spatial_coverage_index entry (its indexed_type),
+    maintained by database triggers (see postgres/db.sql); read-only here"""
+    __tablename__ = "spatial_grid_cells"
+
+    indexed_type = Column(String, nullable=False)
+    indexed_id = Column(postgresql.UUID(as_uuid=True), nullable=False)
+    cell = Column(String, nullable=False)
+
+    __table_args__ = (PrimaryKeyConstraint(indexed_type, indexed_id, cell), )
+
+
 class EventDB(Base):
     __tablename__ = "events"
 
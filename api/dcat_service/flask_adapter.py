@@ -0,0 +1,24 @@
+from flask import request, Response
+from dcat_service.handler import request_handler, tile_request_handler
+from dcat_service.misc.response import build_post_event, encoded_body, bad_request, JSON_CONTENT_TYPE
+from dcat_service.misc.exception import BadRequestException
+
+
+def handle_flask_request(path: str):
+    """Translate the current Flask request into a request_handler event and its result into a Flask response"""
+    try:
+        event = build_post_event(path, request.get_data(cache=False), request.headers)
+    except BadRequestException as e:
+        return to_flask_response(bad_request(str(e)))
+
+    return to_flask_response(request_handler(event, context=None))
+
+
+def handle_flask_tile_request(z: int, x: int, y: int):
+    return to_flask_response(tile_request_handler(z, x, y, dataset_id=request.args.get('dataset_id')))
+
+
+def to_flask_response(result: dict) -> Response:
+    headers = result['headers']
+    return Response(encoded_body(result), status=result['statusCode'], headers=headers,
+                    content_type=headers.get('Content-Type', JSON_CONTENT_TYPE))
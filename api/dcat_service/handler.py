@@ -1,21 +1,62 @@
 import functools
 import pprint
-import sys
-import traceback
+import time
 import uuid
+from typing import *
 
 import ujson
-from dcat_service.controllers.delete_controller import delete_resource, delete_dataset
-from dcat_service.controllers.query_controllers import find_datasets_old, find_datasets, \
-    find_standard_variables, dataset_standard_variables, dataset_variables, variables_standard_variables, \
-    dataset_resources, get_dataset_info, get_resource_info, get_variable_info, get_standard_variable_info, \
-    search_datasets, dataset_temporal_coverage
-from dcat_service.controllers.query_controllers_v2 import search_datasets_v2
-from dcat_service.controllers.registration_controllers import register_provenance, register_datasets, \
-    register_standard_variables, register_variables, register_resources
-from dcat_service.controllers.update_controllers import update_dataset_viz_status, update_dataset_viz_config, \
-    update_dataset, update_resource, update_variable, update_standard_variable, sync_datasets_metadata, sync_dataset_metadata
 from dcat_service.misc.exception import UnauthorizedException, BadRequestException, InternalServerException
+from dcat_service.misc.lazy_import import lazy
+from dcat_service.misc.logger import get_logger, begin_request, end_request, Truncated
+from dcat_service.misc.metrics import metrics_middleware, record_request, payload_size
+from dcat_service.misc.response import parse_json, request_succeeded, bad_request, unauthorized, not_found, \
+    internal_error, binary_response, MVT_CONTENT_TYPE
+from dcat_service.router import Router, Route, authentication_middleware, admin_middleware, body_schema_middleware
+from dcat_service.result_cache import result_cache_middleware
+from dcat_service.settings import Settings
+
+logger = get_logger(__name__)
+
+# Controllers (and the models, GeoAlchemy and the engine behind them) are imported by the first request that needs
+# them, keeping cold start down to the routing layer
+delete_resource = lazy("dcat_service.controllers.delete_controller:delete_resource")
+delete_dataset = lazy("dcat_service.controllers.delete_controller:delete_dataset")
+find_datasets_old = lazy("dcat_service.controllers.query_controllers:find_datasets_old")
+find_datasets = lazy("dcat_service.controllers.query_controllers:find_datasets")
+find_standard_variables = lazy("dcat_service.controllers.query_controllers:find_standard_variables")
+dataset_standard_variables = lazy("dcat_service.controllers.query_controllers:dataset_standard_variables")
+dataset_variables = lazy("dcat_service.controllers.query_controllers:dataset_variables")
+variables_standard_variables = lazy("dcat_service.controllers.query_controllers:variables_standard_variables")
+dataset_resources = lazy("dcat_service.controllers.query_controllers:dataset_resources")
+get_dataset_info = lazy("dcat_service.controllers.query_controllers:get_dataset_info")
+get_resource_info = lazy("dcat_service.controllers.query_controllers:get_resource_info")
+get_variable_info = lazy("dcat_service.controllers.query_controllers:get_variable_info")
+get_standard_variable_info = lazy("dcat_service.controllers.query_controllers:get_standard_variable_info")
+search_datasets = lazy("dcat_service.controllers.query_controllers:search_datasets")
+dataset_temporal_coverage = lazy("dcat_service.controllers.query_controllers:dataset_temporal_coverage")
+temporal_histogram = lazy("dcat_service.controllers.query_controllers:temporal_histogram")
+search_datasets_v2 = lazy("dcat_service.controllers.query_controllers_v2:search_datasets_v2")
+find_datasets_async = lazy("dcat_service.controllers.async_query_controllers:find_datasets_async")
+dataset_resources_async = lazy("dcat_service.controllers.async_query_controllers:dataset_resources_async")
+search_datasets_async = lazy("dcat_service.controllers.async_query_controllers:search_datasets_async")
+search_datasets_v2_async = lazy("dcat_service.controllers.async_query_controllers:search_datasets_v2_async")
+register_provenance = lazy("dcat_service.controllers.registration_controllers:register_provenance")
+register_datasets = lazy("dcat_service.controllers.registration_controllers:register_datasets")
+register_standard_variables = lazy("dcat_service.controllers.registration_controllers:register_standard_variables")
+register_variables = lazy("dcat_service.controllers.registration_controllers:register_variables")
+register_resources = lazy("dcat_service.controllers.registration_controllers:register_resources")
+update_dataset_viz_status = lazy("dcat_service.controllers.update_controllers:update_dataset_viz_status")
+update_dataset_viz_config = lazy("dcat_service.controllers.update_controllers:update_dataset_viz_config")
+update_dataset = lazy("dcat_service.controllers.update_controllers:update_dataset")
+update_resource = lazy("dcat_service.controllers.update_controllers:update_resource")
+update_variable = lazy("dcat_service.controllers.update_controllers:update_variable")
+update_standard_variable = lazy("dcat_service.controllers.update_controllers:update_standard_variable")
+sync_datasets_metadata = lazy("dcat_service.controllers.update_controllers:sync_datasets_metadata")
+sync_dataset_metadata = lazy("dcat_service.controllers.update_controllers:sync_dataset_metadata")
+get_slow_queries = lazy("dcat_service.misc.sql_profiler:get_slow_queries")
+get_pool_stats = lazy("dcat_service.misc.pool_monitor:get_pool_stats")
+explain_query = lazy("dcat_service.controllers.explain_controllers:explain_query")
+get_tile = lazy("dcat_service.controllers.tile_controllers:get_tile")
 
 
 # For search query
@@ -27,7 +68,7 @@ def authenticate(func):
         if not _is_api_key_valid(event.get('headers', {}).get('X-Api-Key')):
             raise UnauthorizedException("Invalid X-Api-Key")
 
-        print(f"Wrapper: {event}")
+        logger.debug("Wrapper: %s", Truncated(event))
         return func(event, **kwargs)
 
     return wrapper
@@ -63,155 +104,139 @@ GET_RESOURCE_INFO_PATH = '/resources/get_resource_info'
 GET_VARIABLE_INFO_PATH = '/variables/get_variable_info'
 GET_STANDARD_VARIABLE_INFO_PATH = '/standard_variables/get_standard_variable_info'
 GET_DATASET_TEMPORAL_COVERAGE_PATH = '/datasets/get_dataset_temporal_coverage'
+DATASETS_TEMPORAL_HISTOGRAM_PATH = '/datasets/temporal_histogram'
 
 DELETE_RESOURCE_PATH = '/resources/delete_resource'
 DELETE_DATASET_PATH = '/datasets/delete_dataset'
 
 CACHE_RESOURCES_PATH = '/resources/cache_resources'
 
-PATHS = frozenset([
-    GET_SESSION_TOKEN_PATH,
-    REGISTER_PROVENANCE_PATH,
-    REGISTER_STANDARD_VARIABLES_PATH,
-    REGISTER_DATASETS_PATH,
-    REGISTER_VARIABLES_PATH,
-    REGISTER_RESOURCES_PATH,
-    FIND_DATASETS_PATH,
-    DATASETS_FIND_PATH_OLD,
-    FIND_STANDARD_VARIABLES_PATH,
-    DATASET_STANDARD_VARIABLES_PATH,
-    DATASET_VARIABLES_PATH,
-    DATASET_RESOURCES_PATH,
-    VARIABLES_STANDARD_VARIABLES_PATH,
-    JATAWARE_SEARCH_PATH,
-    SEARCH_PATH,
-    SEARCH_PATH_V2,
-    UPDATE_DATASET_VIZ_STATUS_PATH,
-    UPDATE_DATASET_VIZ_CONFIG_PATH,
-    UPDATE_DATASET_PATH,
-    UPDATE_DATASET_PATH,
-    UPDATE_RESOURCE_PATH,
-    UPDATE_VARIABLE_PATH,
-    UPDATE_STANDARD_VARIABLE_PATH,
-    SYNC_DATASETS_METADATA_PATH,
-    SYNC_DATASET_METADATA_PATH,
-    GET_DATASET_INFO_PATH,
-    GET_RESOURCE_INFO_PATH,
-    GET_VARIABLE_INFO_PATH,
-    GET_STANDARD_VARIABLE_INFO_PATH,
-    GET_DATASET_TEMPORAL_COVERAGE_PATH,
-    DELETE_RESOURCE_PATH,
-    DELETE_DATASET_PATH,
-    CACHE_RESOURCES_PATH
-])
+ADMIN_SLOW_QUERIES_PATH = '/admin/slow_queries'
+ADMIN_POOL_STATS_PATH = '/admin/pool_stats'
+ADMIN_EXPLAIN_PATH = '/admin/explain'
+
+TILES_PATH = '/tiles'
 
 
 def request_handler(event, context):
     path = event.get('path')
     http_method = event.get('httpMethod')
 
-    print(path)
-    if path not in PATHS:
-        return _not_found()
+    start = time.perf_counter()
+    request_bytes = event.get('contentLength', payload_size(event.get('body')))
+
+    route = router.resolve(path)
+    if route is None:
+        return _not_found(event, start, request_bytes)
+
+    begin_request(path)
+    try:
+        logger.info("%s %s", http_method, path)
+        result = _decode_body(event, http_method)
+        if result is None:
+            try:
+                result = request_succeeded(route.dispatch(event))
+            except Exception as e:
+                result = _error_response(route, e)
+
+        record_request(path, result['statusCode'], time.perf_counter() - start, request_bytes,
+                       payload_size(result['body']))
+        return result
+    finally:
+        end_request()
+
+
+async def request_handler_async(event, executor=None):
+    """Coroutine entry point: routes with an async handler are awaited on the event loop, all others run
+    request_handler on the executor's threads"""
+    # Imported here, under the running loop, so the synchronous entry points do not pay for importing asyncio
+    import asyncio
+
+    path = event.get('path')
+    http_method = event.get('httpMethod')
+
+    route = router.resolve(path)
+    if route is None or route.async_pipeline is None:
+        return await asyncio.get_event_loop().run_in_executor(executor, request_handler, event, None)
+
+    start = time.perf_counter()
+    request_bytes = event.get('contentLength', payload_size(event.get('body')))
 
+    begin_request(path)
+    try:
+        logger.info("%s %s", http_method, path)
+        result = _decode_body(event, http_method)
+        if result is None:
+            try:
+                result = request_succeeded(await route.dispatch_async(event))
+            except Exception as e:
+                result = _error_response(route, e)
+
+        record_request(path, result['statusCode'], time.perf_counter() - start, request_bytes,
+                       payload_size(result['body']))
+        return result
+    finally:
+        end_request()
+
+
+def tile_request_handler(z: int, x: int, y: int, dataset_id: Optional[str]=None) -> dict:
+    """Entry point of GET /tiles/<z>/<x>/<y>: a Mapbox Vector Tile rather than JSON, so it is served outside the
+    router"""
+    start = time.perf_counter()
+
+    begin_request(TILES_PATH)
+    try:
+        logger.info("GET %s/%s/%s/%s", TILES_PATH, z, x, y)
+        event = {'httpMethod': 'GET', 'path': TILES_PATH,
+                 'body': {"z": z, "x": x, "y": y, "dataset_id": dataset_id}}
+        try:
+            result = binary_response(tiles_route.dispatch(event), MVT_CONTENT_TYPE)
+        except Exception as e:
+            result = _error_response(tiles_route, e)
+
+        # Tiles of every z/x/y share one label
+        record_request(TILES_PATH, result['statusCode'], time.perf_counter() - start, None,
+                       payload_size(result['body']))
+        return result
+    finally:
+        end_request()
+
+
+def _not_found(event: dict, start: float, request_bytes: Optional[int]) -> dict:
+    logger.info("%s %s -> 404", event.get('httpMethod'), event.get('path'))
+    result = not_found()
+    # Unknown paths share one label so arbitrary URLs cannot blow up metric cardinality
+    record_request("unmatched", result['statusCode'], time.perf_counter() - start, request_bytes,
+                   payload_size(result['body']))
+    return result
+
+
+def _decode_body(event: dict, http_method: str) -> Optional[dict]:
+    """Decode the request body in place; returns an error response if it is not valid JSON"""
     # headers = event.get('headers')
     if http_method and http_method == 'POST':
         try:
-            event['body'] = _parse_json(event.get('body', ''))
+            event['body'] = parse_json(event.get('body', ''))
         except BadRequestException as e:
-            return _bad_request(e)
+            return bad_request(str(e))
+
+    logger.debug("Request body: %s", Truncated(event.get('body')))
+    return None
 
-    try:
-        if path == GET_SESSION_TOKEN_PATH:
-            result = get_session_token()
-        elif path == REGISTER_PROVENANCE_PATH:
-            result = register_provenance_handler(event)
-        elif path == REGISTER_STANDARD_VARIABLES_PATH:
-            result = register_standard_variables_handler(event)
-        elif path == REGISTER_DATASETS_PATH:
-            result = register_datasets_handler(event)
-        elif path == REGISTER_VARIABLES_PATH:
-            result = register_variables_handler(event)
-        elif path == REGISTER_RESOURCES_PATH:
-            result = register_resources_handler(event)
-        elif path == DATASET_STANDARD_VARIABLES_PATH:
-            result = dataset_standard_variables_handler(event)
-        elif path == DATASET_VARIABLES_PATH:
-            result = dataset_variables_handler(event)
-        elif path == DATASET_RESOURCES_PATH:
-            result = dataset_resources_handler(event)
-        elif path == VARIABLES_STANDARD_VARIABLES_PATH:
-            result = variables_standard_variables_handler(event)
-        elif path == DATASETS_FIND_PATH_OLD:
-            result = find_datasets_old_handler(event)
-        elif path == FIND_DATASETS_PATH:
-            result = find_datasets_handler(event)
-        elif path == FIND_STANDARD_VARIABLES_PATH:
-            result = find_standard_variables_handler(event)
-        elif path == JATAWARE_SEARCH_PATH:
-            result = jataware_search_handler(event)
-        elif path == SEARCH_PATH:
-            result = search_handler(event)
-        elif path == SEARCH_PATH_V2:
-            result = search_v2_handler(event)
-        elif path == UPDATE_DATASET_VIZ_STATUS_PATH:
-            result = update_dataset_viz_status_handler(event)
-        elif path == UPDATE_DATASET_VIZ_CONFIG_PATH:
-            result = update_dataset_viz_config_handler(event)
-        elif path == UPDATE_DATASET_PATH:
-            result = update_dataset_handler(event)
-        elif path == UPDATE_RESOURCE_PATH:
-            result = update_resource_handler(event)
-        elif path == UPDATE_VARIABLE_PATH:
-            result = update_variable_handler(event)
-        elif path == UPDATE_STANDARD_VARIABLE_PATH:
-            result = update_standard_variable_handler(event)
-        elif path == GET_DATASET_INFO_PATH:
-            result = get_dataset_info_handler(event)
-        elif path == GET_RESOURCE_INFO_PATH:
-            result = get_resource_info_handler(event)
-        elif path == GET_VARIABLE_INFO_PATH:
-            result = get_variable_info_handler(event)
-        elif path == GET_STANDARD_VARIABLE_INFO_PATH:
-            result = get_standard_variable_info_handler(event)
-        elif path == GET_DATASET_TEMPORAL_COVERAGE_PATH:
-            result = get_dataset_temporal_coverage_handler(event)
-        elif path == DELETE_RESOURCE_PATH:
-            result = delete_resource_handler(event)
-        elif path == DELETE_DATASET_PATH:
-            result = delete_dataset_handler(event)
-        elif path == SYNC_DATASETS_METADATA_PATH:
-            result = sync_datasets_metadata_handler(event)
-        elif path == SYNC_DATASET_METADATA_PATH:
-            result = sync_dataset_metadata_handler(event)
-        elif path == CACHE_RESOURCES_PATH:
-            result = cache_resources_handler(event)
-        else:
-            return _not_found()
-
-        return _request_succeeded(result)
-
-    except UnauthorizedException as e:
-        return _unauthorized(str(e))
-    except BadRequestException as e:
-        return _bad_request(str(e))
-    except InternalServerException as e:
-        traceback.print_exc(file=sys.stdout)
-        return _internal_error()
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-
-        return _internal_error()
-
-
-def _parse_json(payload):
-    try:
-        if isinstance(payload, str):
-            return ujson.loads(payload)
-        else:
-            return payload
-    except Exception:
-        raise BadRequestException(f"Not a valid json object: {payload}")
+
+def _error_response(route: Route, e: Exception) -> dict:
+    if isinstance(e, UnauthorizedException):
+        return unauthorized(str(e))
+    elif isinstance(e, BadRequestException):
+        logger.info("Bad request to %s: %s", route.path, Truncated(str(e)))
+        return bad_request(str(e))
+    elif isinstance(e, InternalServerException):
+        # Controllers log the underlying traceback before wrapping it
+        logger.error("Internal error while serving %s: %s", route.path, Truncated(str(e)))
+        return internal_error()
+    else:
+        logger.error("Unhandled error while serving %s", route.path, exc_info=e)
+        return internal_error()
 
 
 @authenticate
@@ -220,76 +245,65 @@ def test_function(event):
     return {"results": ["some", "results"], "payload": payload}
 
 
-def get_session_token():
+def get_session_token(event=None):
     session_key = f"mint-data-catalog:{uuid.uuid4()}:{uuid.uuid4()}"
     return {"X-Api-Key": str(session_key)}
 
 
-@authenticate
 def register_provenance_handler(event):
     provenance_definition = event.get('body', {}).get('provenance', {})
     return register_provenance(provenance_definition)
 
 
-@authenticate
 def register_datasets_handler(event):
     dataset_definitions = event.get('body', {}).get('datasets', [])
 
     return register_datasets(dataset_definitions)
 
 
-@authenticate
 def register_standard_variables_handler(event):
     standard_variable_definitions = event.get('body', {}).get('standard_variables', [])
 
     return register_standard_variables(standard_variable_definitions)
 
 
-@authenticate
 def register_variables_handler(event):
     variable_definitions = event.get('body', {}).get('variables', [])
 
     return register_variables(variable_definitions)
 
 
-@authenticate
 def register_resources_handler(event):
     resource_definitions = event.get('body', {}).get('resources', [])
 
     return register_resources(resource_definitions)
 
 
-@authenticate
 def find_datasets_old_handler(event):
     query_definition = event.get('body', {})
     return find_datasets_old(query_definition)
 
 
-@authenticate
 def find_datasets_handler(event):
     query_definition = event.get('body', {})
     return find_datasets(query_definition)
 
 
-@authenticate
 def find_standard_variables_handler(event):
     query_definition = event.get('body', {})
     return find_standard_variables(query_definition)
 
 
-@authenticate
 def dataset_standard_variables_handler(event):
     query_definition = event.get('body', {})
     return dataset_standard_variables(query_definition)
 
 
-@authenticate
 def dataset_variables_handler(event):
     query_definition = event.get('body', {})
     return dataset_variables(query_definition)
 
 
-@authenticate
 def dataset_resources_handler(event):
     query_definition = event.get('body', {})
     return dataset_resources(query_definition)
@@ -311,7 +325,32 @@ def search_v2_handler(event):
     return search_datasets_v2(query_definition)
 
 
-@authenticate
+async def find_datasets_handler_async(event):
+    query_definition = event.get('body', {})
+    return await find_datasets_async(query_definition)
+
+
+async def dataset_resources_handler_async(event):
+    query_definition = event.get('body', {})
+    return await dataset_resources_async(query_definition)
+
+
+async def jataware_search_handler_async(event):
+    query_definition = event.get('body', {})
+    query_definition["provenance_id"] = "3831a57f-a372-424a-b310-525b5441581b"
+    return await search_datasets_async(query_definition)
+
+
+async def search_handler_async(event):
+    query_definition = event.get('body', {})
+    return await search_datasets_async(query_definition)
+
+
+async def search_v2_handler_async(event):
+    query_definition = event.get('body', {})
+    return await search_datasets_v2_async(query_definition)
+
+
 def variables_standard_variables_handler(event):
     query_definition = event.get('body', {})
     return variables_standard_variables(query_definition)
@@ -380,6 +419,11 @@ def get_dataset_temporal_coverage_handler(event):
     return dataset_temporal_coverage(query_definition)
 
 
+def datasets_temporal_histogram_handler(event):
+    query_definition = event.get('body', {})
+    return temporal_histogram(query_definition)
+
+
 def delete_resource_handler(event):
     delete_definition = event.get('body', {})
     return delete_resource(delete_definition)
@@ -395,6 +439,24 @@ def cache_resources_handler(event):
     return {"job_id": str(uuid.uuid4()), "status": "pending"}
 
 
+def admin_slow_queries_handler(event):
+    body = event.get('body', {})
+    return get_slow_queries(limit=body.get('limit'), reset=bool(body.get('reset', False)))
+
+
+def admin_pool_stats_handler(event):
+    return get_pool_stats()
+
+
+def admin_explain_handler(event):
+    return explain_query(event.get('body', {}))
+
+
+def tiles_handler(event):
+    body = event['body']
+    return get_tile(body['z'], body['x'], body['y'], dataset_id=body.get('dataset_id'))
+
+
 def _enable_sqlalchemy_logging():
     import logging
 
@@ -430,52 +492,92 @@ def _is_uuid(uuid_str: str) -> bool:
         return False
 
 
-def _default_response_headers():
-    return {
-        "Access-Control-Allow-Methods": "GET, POST, DELETE, PUT",
-        "Access-Control-Allow-Headers": "X-Requested-With, Content-Type, X-HTTP-Method-Override, X-Api-Key",
-        "Access-Control-Allow-Origin": "*"
-    }
-
-
-def _request_succeeded(payload: dict) -> dict:
-    return {
-        "headers": _default_response_headers(),
-        "statusCode": 200,
-        "body": ujson.dumps(payload)
-    }
-
-
-def _bad_request(message: str) -> dict:
-    return {
-        "headers": _default_response_headers(),
-        "statusCode": 400,
-        "body": ujson.dumps({"error": message})
-    }
-
-
-def _unauthorized(message: str) -> dict:
-    return {
-        "headers": _default_response_headers(),
-        "statusCode": 403,
-        "body": ujson.dumps({"error": message})
-    }
-
-
-def _not_found():
-    return {
-        "headers": _default_response_headers(),
-        "statusCode": 404,
-        "body": ujson.dumps({"error": "Not Found"})
-    }
-
+router = Router(middleware=[
+    metrics_middleware,
+    authentication_middleware(_is_api_key_valid),
+    admin_middleware(lambda: Settings.get_instance().admin.api_key),
+    body_schema_middleware,
+    result_cache_middleware
+])
 
-def _internal_error():
-    return {
-        "headers": _default_response_headers(),
-        "statusCode": 500,
-        "body": ujson.dumps({"error": "Internal Error"})
-    }
+for _route in [
+    Route(GET_SESSION_TOKEN_PATH, get_session_token),
+    Route(REGISTER_PROVENANCE_PATH, register_provenance_handler, requires_auth=True,
+          body_schema={"provenance": dict}, timeout_class="bulk"),
+    Route(REGISTER_STANDARD_VARIABLES_PATH, register_standard_variables_handler, requires_auth=True,
+          body_schema={"standard_variables": list}, timeout_class="bulk"),
+    Route(REGISTER_DATASETS_PATH, register_datasets_handler, requires_auth=True,
+          body_schema={"datasets": list}, timeout_class="bulk"),
+    Route(REGISTER_VARIABLES_PATH, register_variables_handler, requires_auth=True,
+          body_schema={"variables": list}, timeout_class="bulk"),
+    Route(REGISTER_RESOURCES_PATH, register_resources_handler, requires_auth=True,
+          body_schema={"resources": list}, timeout_class="bulk"),
+    Route(FIND_DATASETS_PATH, find_datasets_handler, requires_auth=True, body_schema={"cursor": str},
+          cacheable=True, timeout_class="search", async_handler=find_datasets_handler_async),
+    Route(DATASETS_FIND_PATH_OLD, find_datasets_old_handler, requires_auth=True, body_schema={"cursor": str},
+          cacheable=True, timeout_class="search"),
+    Route(FIND_STANDARD_VARIABLES_PATH, find_standard_variables_handler, requires_auth=True, body_schema={},
+          cacheable=True),
+    Route(DATASET_STANDARD_VARIABLES_PATH, dataset_standard_variables_handler, requires_auth=True,
+          body_schema={"dataset_id": str}, cacheable=True),
+    Route(DATASET_VARIABLES_PATH, dataset_variables_handler, requires_auth=True,
+          body_schema={"dataset_id": str}, cacheable=True),
+    Route(DATASET_RESOURCES_PATH, dataset_resources_handler, requires_auth=True,
+          body_schema={"dataset_id": str, "filter": dict}, cacheable=True, timeout_class="search",
+          async_handler=dataset_resources_handler_async),
+    Route(VARIABLES_STANDARD_VARIABLES_PATH, variables_standard_variables_handler, requires_auth=True,
+          body_schema={"variable_ids__in": list, "cursor": str}, cacheable=True),
+    Route(JATAWARE_SEARCH_PATH, jataware_search_handler,
+          body_schema={"search_query": list, "cursor": str}, cacheable=True, timeout_class="search",
+          async_handler=jataware_search_handler_async),
+    Route(SEARCH_PATH, search_handler,
+          body_schema={"search_query": list, "provenance_id": str, "cursor": str, "candidate_budget": int},
+          cacheable=True, timeout_class="search",
+          async_handler=search_handler_async),
+    Route(SEARCH_PATH_V2, search_v2_handler,
+          body_schema={"search_query": list, "provenance_id": str, "spatial_coverage": (dict, list),
+                       "temporal_coverage": dict, "cursor": str, "facets": (bool, list), "facet_limit": int,
+                       "candidate_budget": int},
+          cacheable=True, timeout_class="search",
+          async_handler=search_v2_handler_async),
+    Route(UPDATE_DATASET_VIZ_STATUS_PATH, update_dataset_viz_status_handler, body_schema={"dataset_id": str}),
+    Route(UPDATE_DATASET_VIZ_CONFIG_PATH, update_dataset_viz_config_handler,
+          body_schema={"dataset_id": str, "$set": dict}),
+    Route(UPDATE_DATASET_PATH, update_dataset_handler, body_schema={"dataset_id": str, "metadata": dict}),
+    Route(UPDATE_RESOURCE_PATH, update_resource_handler, body_schema={"resource_id": str, "metadata": dict}),
+    Route(UPDATE_VARIABLE_PATH, update_variable_handler, body_schema={"variable_id": str, "metadata": dict}),
+    Route(UPDATE_STANDARD_VARIABLE_PATH, update_standard_variable_handler,
+          body_schema={"standard_variable_id": str}),
+    Route(SYNC_DATASETS_METADATA_PATH, sync_datasets_metadata_handler, timeout_class="bulk"),
+    Route(SYNC_DATASET_METADATA_PATH, sync_dataset_metadata_handler, body_schema={"dataset_id": str},
+          timeout_class="bulk"),
+    Route(GET_DATASET_INFO_PATH, get_dataset_info_handler, body_schema={"dataset_id": str}, cacheable=True),
+    Route(GET_RESOURCE_INFO_PATH, get_resource_info_handler, body_schema={"resource_id": str}, cacheable=True),
+    Route(GET_VARIABLE_INFO_PATH, get_variable_info_handler, body_schema={"variable_id": str}, cacheable=True),
+    Route(GET_STANDARD_VARIABLE_INFO_PATH, get_standard_variable_info_handler,
+          body_schema={"standard_variable_id": str}, cacheable=True),
+    Route(GET_DATASET_TEMPORAL_COVERAGE_PATH, get_dataset_temporal_coverage_handler,
+          body_schema={"dataset_id": str}, cacheable=True),
+    Route(DATASETS_TEMPORAL_HISTOGRAM_PATH, datasets_temporal_histogram_handler,
+          body_schema={"dataset_id": str, "search_query": list, "provenance_id": str, "spatial_coverage": (dict, list),
+                       "temporal_coverage": dict, "bucket": str},
+          cacheable=True, timeout_class="search"),
+    Route(DELETE_RESOURCE_PATH, delete_resource_handler, body_schema={"resource_id": str, "provenance_id": str}),
+    Route(DELETE_DATASET_PATH, delete_dataset_handler, body_schema={"dataset_id": str, "provenance_id": str},
+          timeout_class="bulk"),
+    Route(CACHE_RESOURCES_PATH, cache_resources_handler),
+    Route(ADMIN_SLOW_QUERIES_PATH, admin_slow_queries_handler, requires_admin=True,
+          body_schema={"limit": int, "reset": bool}),
+    Route(ADMIN_POOL_STATS_PATH, admin_pool_stats_handler, requires_admin=True),
+    Route(ADMIN_EXPLAIN_PATH, admin_explain_handler, requires_admin=True, body_schema={"endpoint": str, "query": dict},
+          timeout_class="search")
+]:
+    router.add_route(_route)
+
+PATHS = router.paths
+
+# Served over GET by tile_request_handler rather than by the router; dispatching it applies its statement timeout
+tiles_route = Route(TILES_PATH, tiles_handler, timeout_class="search")
 
 
 def _test_register_provenance():
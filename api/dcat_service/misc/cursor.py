@@ -0,0 +1,94 @@
+from typing import *
+import base64
+import binascii
+import hashlib
+
+import ujson
+
+from dcat_service.misc.exception import BadRequestException
+
+# Opaque keyset pagination cursors: the sort key of the last row of a page, tied to the endpoint and to the filters
+# of the request that produced it. The next page continues strictly after that key, so it costs the same as the first
+# one however deep it is, and rows inserted meanwhile do not shift pages.
+
+CURSOR_FIELD = "cursor"
+
+
+def _json_value(value: Any) -> Any:
+    return value if isinstance(value, (int, float, str, type(None))) else str(value)
+
+
+class Page:
+    """Limit and position of the page a request asks for. Created before the query definition is validated, since
+    'limit' and 'cursor' are not filters."""
+
+    def __init__(self, scope: str, fingerprint: str, limit: int, after: Optional[list], requested: bool,
+                 ranking: Optional[str]=None):
+        self.scope = scope
+        self.fingerprint = fingerprint
+        self.limit = limit
+        # Sort key of the last row of the previous page, None for the first page
+        self.after = after
+        # Whether the request used cursor pagination at all (sent a 'cursor' field, null for the first page)
+        self.requested = requested
+        # Search engine that ranked the previous page when its sort key holds a search rank, which only compares with
+        # ranks of the same engine; set to the engine ranking this page when its statement is built
+        self.ranking = ranking
+
+    @staticmethod
+    def from_query_definition(scope: str, query_definition: dict, default_limit: int, key_length: int,
+                              presentation_fields: Iterable[str]=()) -> 'Page':
+        """Pop 'limit' and 'cursor' from the query definition and decode the cursor. presentation_fields change
+        what comes with the results but not which rows match, so a cursor stays valid when they change."""
+        try:
+            limit = int(query_definition.pop("limit", default_limit))
+        except (TypeError, ValueError):
+            raise BadRequestException({'InvalidQueryDefinition': "'limit' must be an integer"})
+        if limit < 1:
+            raise BadRequestException({'InvalidQueryDefinition': f"'limit' must be positive; received {limit}"})
+
+        requested = CURSOR_FIELD in query_definition
+        cursor = query_definition.pop(CURSOR_FIELD, None)
+
+        filters = {key: value for key, value in query_definition.items()
+                   if key != "offset" and key not in presentation_fields}
+        fingerprint = hashlib.sha1(f"{scope}:{ujson.dumps(filters, sort_keys=True)}".encode("utf-8")).hexdigest()[:12]
+
+        after, ranking = None, None
+        if cursor is not None:
+            after, ranking = Page._decode(cursor, fingerprint, key_length)
+
+        return Page(scope, fingerprint, limit, after, requested, ranking)
+
+    @staticmethod
+    def _decode(cursor: Any, fingerprint: str, key_length: int) -> Tuple[list, Optional[str]]:
+        try:
+            padded = str(cursor) + "=" * (-len(str(cursor)) % 4)
+            payload = ujson.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+            key = payload["k"]
+            cursor_fingerprint = payload["f"]
+            ranking = payload.get("r")
+        except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+            raise BadRequestException({'InvalidQueryDefinition': f"Invalid cursor: {cursor}"})
+
+        if not isinstance(key, list) or len(key) != key_length:
+            raise BadRequestException({'InvalidQueryDefinition': f"Invalid cursor: {cursor}"})
+
+        if cursor_fingerprint != fingerprint:
+            raise BadRequestException({'InvalidQueryDefinition':
+                                       "Cursor was issued for a different query; repeat the filters of the first page"})
+
+        return key, ranking
+
+    def encode(self, key: Sequence[Any]) -> str:
+        payload = {"f": self.fingerprint, "k": [_json_value(value) for value in key]}
+        if self.ranking is not None:
+            payload["r"] = self.ranking
+        return base64.urlsafe_b64encode(ujson.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+    def next_cursor(self, rows: Sequence, sort_key: Callable[[Any], Sequence[Any]]) -> Optional[str]:
+        """Cursor of the page after these rows; None once a page comes back short"""
+        if len(rows) < self.limit:
+            return None
+
+        return self.encode(sort_key(rows[-1]))
@@ -0,0 +1,31 @@
+from typing import *
+import importlib
+
+
+class LazyCallable:
+    """Stand-in for a function named by "package.module:function", imported on its first call.
+
+    Lets the route table reference every controller without paying for importing them (and the models, GeoAlchemy
+    and SQLAlchemy behind them) until a request actually needs one."""
+
+    def __init__(self, target: str):
+        self.target = target
+        self._function: Optional[Callable] = None
+
+    def resolve(self) -> Callable:
+        if self._function is None:
+            module_name, _, function_name = self.target.partition(":")
+            # importlib serializes concurrent imports of the same module, so racing threads resolve the same function
+            self._function = getattr(importlib.import_module(module_name), function_name)
+
+        return self._function
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazyCallable({self.target!r})"
+
+
+def lazy(target: str) -> LazyCallable:
+    return LazyCallable(target)
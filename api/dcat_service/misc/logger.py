@@ -0,0 +1,157 @@
+from typing import *
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+import ujson
+
+from dcat_service.settings import LoggingSettings
+
+ROOT_LOGGER_NAME = "dcat_service"
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s:%(funcName)s] %(message)s"
+
+_configure_lock = threading.Lock()
+_configured_pid: Optional[int] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_settings: Optional[LoggingSettings] = None
+# Per-request sampling decision; a context variable so concurrent asyncio tasks do not share it
+_request_sampled: contextvars.ContextVar = contextvars.ContextVar("request_sampled", default=True)
+
+
+class Truncated:
+    """Lazily serialized log argument; nothing is formatted unless the record is actually emitted"""
+
+    max_chars = 512
+
+    def __init__(self, payload: Any, max_chars: int=None):
+        self.payload = payload
+        self.max_chars = max_chars or Truncated.max_chars
+
+    def __str__(self):
+        if isinstance(self.payload, (dict, list, tuple)):
+            try:
+                text = ujson.dumps(self.payload)
+            except Exception:
+                text = repr(self.payload)
+        else:
+            text = str(self.payload)
+
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... [truncated {len(text) - self.max_chars} chars]"
+
+        return text
+
+    __repr__ = __str__
+
+
+class RequestSamplingFilter(logging.Filter):
+    """Drops sub-WARNING records of requests that were not sampled; warnings and errors always go through"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _request_sampled.get()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the request thread: records are discarded when the queue is full.
+    The listener thread does not survive fork, so it is restarted in whichever process first emits."""
+
+    def emit(self, record: logging.LogRecord):
+        if _configured_pid != os.getpid():
+            _start_listener()
+
+        super().emit(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _start_listener():
+    global _listener, _configured_pid
+    with _configure_lock:
+        if _configured_pid == os.getpid():
+            return
+
+        # The listener inherited from a parent process has no running thread; it is simply replaced
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+        for handler in root_logger.handlers:
+            if isinstance(handler, _DroppingQueueHandler):
+                _listener = logging.handlers.QueueListener(handler.queue, stream_handler)
+                _listener.start()
+
+        _configured_pid = os.getpid()
+
+
+def configure_logging(settings: LoggingSettings=None):
+    """Install handlers on the dcat_service logger; safe to call more than once"""
+    global _configured_pid, _settings
+    settings = settings or LoggingSettings.from_env()
+
+    with _configure_lock:
+        root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        if _listener is not None and _configured_pid == os.getpid():
+            _listener.stop()
+        _configured_pid = None
+
+        root_logger.setLevel(settings.level)
+        root_logger.propagate = False
+        Truncated.max_chars = settings.max_payload_chars
+        _settings = settings
+
+        if settings.use_queue:
+            handler = _DroppingQueueHandler(queue.Queue(maxsize=settings.queue_size))
+        else:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            _configured_pid = os.getpid()
+
+        handler.addFilter(RequestSamplingFilter())
+        root_logger.addHandler(handler)
+
+    if settings.use_queue:
+        _start_listener()
+
+
+def shutdown_logging():
+    """Flush queued records; call before the process exits"""
+    if _listener is not None and _configured_pid == os.getpid():
+        _listener.stop()
+
+
+atexit.register(shutdown_logging)
+
+
+def begin_request(path: str):
+    """Decide once per request whether its debug/info records are emitted"""
+    if _settings is None:
+        rate = 1.0
+    else:
+        rate = _settings.sample_rates.get(path, _settings.default_sample_rate)
+    _request_sampled.set(rate >= 1.0 or random.random() < rate)
+
+
+def end_request():
+    _request_sampled.set(True)
+
+
+def get_logger(name: str) -> logging.Logger:
+    if _settings is None:
+        configure_logging()
+
+    if not name.startswith(ROOT_LOGGER_NAME):
+        name = f"{ROOT_LOGGER_NAME}.{name}"
+
+    return logging.getLogger(name)
@@ -0,0 +1,460 @@
+from typing import *
+from collections import deque
+from contextlib import contextmanager
+import fcntl
+import glob
+import math
+import os
+import threading
+import time
+
+import ujson
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Number of most recent observations per label set that quantiles are computed from
+RESERVOIR_SIZE = 2048
+
+# Multiprocess mode (see MetricsRegistry.enable_multiprocess): every process writes a snapshot of its metrics to
+# <directory>/<pid>-<id>.json, and a scrape renders the sum of all snapshots in the directory. Snapshots of processes
+# that have exited keep their counters and summary counts and sums, merged into DEAD_SNAPSHOT, so totals never go
+# backwards when a worker is recycled; their gauges and observations are dropped.
+DEAD_SNAPSHOT = "dead.json"
+LOCK_FILE = ".lock"
+# Seconds between snapshots of a process
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+# Most recent observations per label set written to a snapshot; quantiles are computed over those of all processes
+SNAPSHOT_RESERVOIR_SIZE = 256
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+
+    return repr(float(value))
+
+
+class Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def snapshot(self, live: bool) -> List[list]:
+        """Samples of this metric in a multiprocess snapshot; a process that is not live keeps only totals"""
+        raise NotImplementedError()
+
+    def merge(self, samples: List[list], live: bool, pid: int):
+        """Add the samples of a snapshot of process pid"""
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]=()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self, live: bool) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, samples: List[list], live: bool, pid: int):
+        with self._lock:
+            for key, value in samples:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]=()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self, live: bool) -> List[list]:
+        if not live:
+            return []
+
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, samples: List[list], live: bool, pid: int):
+        # Gauges describe a process: only live processes are reported, each with its pid
+        if not live:
+            return
+
+        with self._lock:
+            for key, value in samples:
+                key = tuple(key)
+                if len(key) < len(self.label_names):
+                    key += (str(pid),)
+                self._values[key] = value
+
+
+class Summary(Metric):
+    """Count, sum and p50/p95/p99 over the most recent observations of every label set"""
+    metric_type = "summary"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]=()):
+        super().__init__(name, documentation, label_names)
+        self._series: Dict[Tuple[str, ...], Tuple[List[float], deque]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0, 0.0], deque(maxlen=RESERVOIR_SIZE))
+                self._series[key] = series
+
+            totals, reservoir = series
+            totals[0] += 1
+            totals[1] += value
+            reservoir.append(value)
+
+    @staticmethod
+    def _quantile(ordered: List[float], q: float) -> float:
+        if not ordered:
+            return float("nan")
+
+        return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = [(key, totals[0], totals[1], sorted(reservoir))
+                        for key, (totals, reservoir) in self._series.items()]
+
+        for key, count, total, ordered in snapshot:
+            for q in QUANTILES:
+                labels = _format_labels(self.label_names, key, f'quantile="{q}"')
+                yield f"{self.name}{labels} {_format_value(self._quantile(ordered, q))}"
+
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {_format_value(count)}"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self, live: bool) -> List[list]:
+        with self._lock:
+            return [[list(key), totals[0], totals[1], list(reservoir)[-SNAPSHOT_RESERVOIR_SIZE:] if live else []]
+                    for key, (totals, reservoir) in self._series.items()]
+
+    def merge(self, samples: List[list], live: bool, pid: int):
+        with self._lock:
+            for key, count, total, observations in samples:
+                key = tuple(key)
+                series = self._series.get(key)
+                if series is None:
+                    # Observations of every process are kept
+                    series = ([0, 0.0], deque())
+                    self._series[key] = series
+
+                totals, reservoir = series
+                totals[0] += count
+                totals[1] += total
+                if live:
+                    reservoir.extend(observations)
+
+
+_METRIC_TYPES: Dict[str, Type[Metric]] = {"counter": Counter, "gauge": Gauge, "summary": Summary}
+
+
+@contextmanager
+def _directory_lock(directory: str, exclusive: bool):
+    """Held shared while reading the snapshots, exclusive while moving one into DEAD_SNAPSHOT, so a scrape never counts
+    an exited process twice or not at all"""
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return ujson.load(f)
+    except (OSError, ValueError):
+        # An unreadable snapshot is left out rather than failing the scrape
+        return None
+
+
+def _write_snapshot(path: str, snapshot: dict):
+    # Readers never see a partially written file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        ujson.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+
+def _merge_snapshots(snapshots: Iterable[dict]) -> Dict[str, Metric]:
+    merged: Dict[str, Metric] = {}
+    for snapshot in snapshots:
+        for name, data in snapshot["metrics"].items():
+            metric = merged.get(name)
+            if metric is None:
+                label_names = data["label_names"]
+                if data["type"] == "gauge" and "pid" not in label_names:
+                    label_names = label_names + ["pid"]
+                metric = _METRIC_TYPES[data["type"]](name, data["documentation"], label_names)
+                merged[name] = metric
+
+            metric.merge(data["samples"], snapshot["live"], snapshot["pid"])
+
+    return merged
+
+
+def _snapshot(metrics: Iterable[Metric], live: bool, pid: Optional[int]) -> dict:
+    return {
+        "pid": pid,
+        "live": live,
+        "metrics": {
+            metric.name: {
+                "type": metric.metric_type,
+                "documentation": metric.documentation,
+                "label_names": list(metric.label_names),
+                "samples": metric.snapshot(live)
+            }
+            for metric in metrics
+        }
+    }
+
+
+def mark_process_dead(directory: str, pid: int):
+    """Merge the snapshot of an exited process into the totals of dead processes
+
+    Called by the process that started the workers, after a worker has exited, however it exited.
+    """
+    paths = glob.glob(os.path.join(directory, f"{pid}-*.json"))
+    if not paths:
+        return
+
+    dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+    with _directory_lock(directory, exclusive=True):
+        snapshots = [_read_snapshot(path) for path in [dead_path] + paths]
+        for snapshot in snapshots:
+            if snapshot is not None:
+                snapshot["live"] = False
+
+        merged = _merge_snapshots(snapshot for snapshot in snapshots if snapshot is not None)
+        _write_snapshot(dead_path, _snapshot(merged.values(), False, None))
+        for path in paths:
+            os.remove(path)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir: Optional[str] = None
+        self._snapshot_path: Optional[str] = None
+        self._flush_stop: Optional[threading.Event] = None
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str]=()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str]=()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def summary(self, name: str, documentation: str, label_names: Sequence[str]=()) -> Summary:
+        return self._register(Summary(name, documentation, label_names))
+
+    def enable_multiprocess(self, directory: str):
+        """Share the metrics of this process with the other processes writing to directory
+
+        Called in each worker process after fork. Values recorded before (by the master, with preload_app) are dropped
+        so that they are not counted once per worker.
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+        self.multiprocess_dir = directory
+        self._snapshot_path = os.path.join(directory, f"{os.getpid()}-{os.urandom(4).hex()}.json")
+        self._flush_stop = threading.Event()
+        self.flush()
+        threading.Thread(target=self._flush_periodically, args=(self._flush_stop,), name="metrics-flush",
+                         daemon=True).start()
+
+    def _flush_periodically(self, stop: threading.Event):
+        while not stop.wait(FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except OSError:
+                from dcat_service.misc.logger import get_logger
+                get_logger(__name__).warning("Could not write the metrics snapshot", exc_info=True)
+
+    def flush(self):
+        """Write the snapshot of this process in multiprocess mode"""
+        if self._snapshot_path is None:
+            return
+
+        with self._lock:
+            metrics = list(self.metrics.values())
+        _write_snapshot(self._snapshot_path, _snapshot(metrics, True, os.getpid()))
+
+    def shutdown(self):
+        """Write a final snapshot and stop writing snapshots; called when a worker exits"""
+        if self._flush_stop is not None:
+            self._flush_stop.set()
+        self.flush()
+
+    def render(self) -> str:
+        """Prometheus text exposition format; in multiprocess mode, of all the processes sharing the directory"""
+        if self.multiprocess_dir is None:
+            with self._lock:
+                metrics = list(self.metrics.values())
+        else:
+            self.flush()
+            with _directory_lock(self.multiprocess_dir, exclusive=False):
+                paths = glob.glob(os.path.join(self.multiprocess_dir, "*.json"))
+                snapshots = [_read_snapshot(path) for path in sorted(paths)]
+            metrics = list(_merge_snapshots(snapshot for snapshot in snapshots if snapshot is not None).values())
+
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.summary(
+    "dcat_request_duration_seconds", "Time spent in request_handler, including body decoding and response encoding",
+    ("endpoint",))
+REQUESTS = registry.counter(
+    "dcat_requests_total", "Requests handled, by endpoint and response status", ("endpoint", "status"))
+REQUEST_BYTES = registry.summary(
+    "dcat_request_body_bytes", "Size of request bodies", ("endpoint",))
+RESPONSE_BYTES = registry.summary(
+    "dcat_response_body_bytes", "Size of encoded response bodies", ("endpoint",))
+CONTROLLER_DURATION = registry.summary(
+    "dcat_controller_duration_seconds", "Time spent in the route handler and its controller", ("endpoint",))
+CONTROLLER_ERRORS = registry.counter(
+    "dcat_controller_errors_total", "Exceptions raised by route handlers, by exception type",
+    ("endpoint", "exception"))
+
+
+def metrics_middleware(route, event: dict, call_next):
+    """Router middleware timing the controller of each route and counting its exceptions"""
+    start = time.perf_counter()
+    try:
+        return call_next(event)
+    except Exception as e:
+        CONTROLLER_ERRORS.inc(endpoint=route.path, exception=type(e).__name__)
+        raise
+    finally:
+        CONTROLLER_DURATION.observe(time.perf_counter() - start, endpoint=route.path)
+
+
+async def _metrics_middleware_async(route, event: dict, call_next):
+    start = time.perf_counter()
+    try:
+        return await call_next(event)
+    except Exception as e:
+        CONTROLLER_ERRORS.inc(endpoint=route.path, exception=type(e).__name__)
+        raise
+    finally:
+        CONTROLLER_DURATION.observe(time.perf_counter() - start, endpoint=route.path)
+
+
+metrics_middleware.async_variant = _metrics_middleware_async
+
+
+def payload_size(payload: Any) -> Optional[int]:
+    """Size in bytes of a body once encoded to UTF-8, without encoding it: response bodies are encoded once, by
+    encoded_body, and are ASCII (ujson escapes other characters), so their length is their size. isascii reads a flag
+    CPython keeps on the string."""
+    if isinstance(payload, str):
+        return len(payload) if payload.isascii() else len(payload.encode("utf-8"))
+    elif isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+
+    return None
+
+
+def record_request(endpoint: str, status: int, duration: float, request_bytes: Optional[int],
+                   response_bytes: Optional[int]):
+    REQUEST_DURATION.observe(duration, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    if request_bytes is not None:
+        REQUEST_BYTES.observe(request_bytes, endpoint=endpoint)
+    if response_bytes is not None:
+        RESPONSE_BYTES.observe(response_bytes, endpoint=endpoint)
@@ -0,0 +1,132 @@
+from typing import *
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from dcat_service.misc.metrics import registry
+from dcat_service.settings import Settings
+
+POOL_CHECKED_OUT = registry.gauge(
+    "dcat_db_pool_checked_out", "Connections currently checked out of the pool, per worker process",
+    ("pool", "pid"))
+POOL_CHECKED_IN = registry.gauge(
+    "dcat_db_pool_checked_in", "Idle connections held by the pool, per worker process", ("pool", "pid"))
+POOL_OVERFLOW = registry.gauge(
+    "dcat_db_pool_overflow", "Connections opened beyond pool_size, per worker process", ("pool", "pid"))
+POOL_WAIT = registry.summary(
+    "dcat_db_pool_wait_seconds", "Time spent checking out a connection, including opening a new one", ("pool",))
+POOL_EXHAUSTED = registry.counter(
+    "dcat_db_pool_exhausted_total",
+    "Checkouts that found every connection in use and no overflow left, and had to wait for a checkin", ("pool",))
+POOL_TIMEOUTS = registry.counter(
+    "dcat_db_pool_timeouts_total", "Checkouts that gave up after pool_timeout seconds", ("pool",))
+
+# Pools of this process by label ("primary", "replica:<host>:<port>")
+_pools: Dict[str, 'InstrumentedQueuePool'] = {}
+_pools_lock = threading.Lock()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool recording checkout wait time, exhaustion and its size in the metrics registry"""
+
+    label = "none"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.exhausted = 0
+        self.timeouts = 0
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+    def is_exhausted(self) -> bool:
+        return self.checkedin() == 0 and -1 < self._max_overflow <= self.overflow()
+
+    def _do_get(self):
+        exhausted = self.is_exhausted()
+        if exhausted:
+            POOL_EXHAUSTED.inc(pool=self.label)
+
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            POOL_TIMEOUTS.inc(pool=self.label)
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            POOL_WAIT.observe(waited, pool=self.label)
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                self.exhausted += exhausted
+                self.timeouts += timed_out
+            self.update_gauges()
+
+    def _do_return_conn(self, conn):
+        super()._do_return_conn(conn)
+        self.update_gauges()
+
+    def update_gauges(self):
+        labels = {"pool": self.label, "pid": os.getpid()}
+        POOL_CHECKED_OUT.set(self.checkedout(), **labels)
+        POOL_CHECKED_IN.set(self.checkedin(), **labels)
+        POOL_OVERFLOW.set(max(0, self.overflow()), **labels)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "timeout": self._timeout,
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(0, self.overflow()),
+                "exhausted": self.is_exhausted(),
+                "checkouts": self.checkouts,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+                "exhausted_checkouts": self.exhausted,
+                "timeouts": self.timeouts
+            }
+
+
+def install_pool_monitor(engine: Engine, label: str):
+    """Label the engine's pool in metrics and pool stats; no-op for pools that are not instrumented (NullPool)"""
+    if not isinstance(engine.pool, InstrumentedQueuePool):
+        return
+
+    engine.pool.label = label
+    with _pools_lock:
+        _pools[label] = engine.pool
+
+
+def forget_pools():
+    with _pools_lock:
+        _pools.clear()
+
+
+def get_pool_stats() -> Dict:
+    """Stats of the pools owned by the worker process serving the request"""
+    with _pools_lock:
+        pools = list(_pools.items())
+
+    return {
+        "result": "success",
+        "pid": os.getpid(),
+        "external_pooler": Settings.get_instance().database.pool.external_pooler,
+        "pools": {label: pool.stats() for label, pool in pools}
+    }
@@ -0,0 +1,99 @@
+from typing import *
+import ujson
+
+from dcat_service.misc.exception import BadRequestException
+
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def parse_json(payload):
+    """Decode a request payload exactly once; already-decoded objects are passed through"""
+    try:
+        if isinstance(payload, (str, bytes, bytearray)):
+            return ujson.loads(payload)
+        else:
+            return payload
+    except Exception:
+        raise BadRequestException(f"Not a valid json object: {payload}")
+
+
+def build_post_event(path: str, raw_body: bytes, request_headers: Mapping[str, str]) -> dict:
+    """request_handler event for a raw HTTP POST; raises BadRequestException if the body is not valid JSON"""
+    # Decode the raw request bytes once; request_handler passes already-decoded bodies straight through
+    payload = parse_json(raw_body or None)
+
+    if isinstance(payload, dict) and 'body' in payload:
+        # Lambda-proxy style envelope, e.g. {"headers": {...}, "body": "<json string>"}
+        headers = payload.get('headers') or {}
+        body = payload['body']
+    else:
+        headers = {'X-Api-Key': request_headers.get('X-Api-Key'), 'X-Admin-Key': request_headers.get('X-Admin-Key')}
+        body = payload
+
+    return {
+        'httpMethod': 'POST',
+        'path': path,
+        'headers': headers,
+        'body': body,
+        # Size of the raw request, which request_handler can no longer see once the body is decoded
+        'contentLength': len(raw_body or b'')
+    }
+
+
+def default_response_headers() -> Dict[str, str]:
+    return {
+        "Access-Control-Allow-Methods": "GET, POST, DELETE, PUT",
+        "Access-Control-Allow-Headers": "X-Requested-With, Content-Type, X-HTTP-Method-Override, X-Api-Key",
+        "Access-Control-Allow-Origin": "*",
+        "Content-Type": JSON_CONTENT_TYPE
+    }
+
+
+def json_response(status_code: int, payload: Any) -> dict:
+    """Lambda-style response; the payload is serialized here and nowhere else"""
+    return {
+        "headers": default_response_headers(),
+        "statusCode": status_code,
+        "body": ujson.dumps(payload)
+    }
+
+
+def binary_response(body: bytes, content_type: str) -> dict:
+    """Lambda-style response with a body that is not JSON"""
+    headers = default_response_headers()
+    headers["Content-Type"] = content_type
+    return {
+        "headers": headers,
+        "statusCode": 200,
+        "body": body
+    }
+
+
+def request_succeeded(payload: Any) -> dict:
+    return json_response(200, payload)
+
+
+def bad_request(message: str) -> dict:
+    return json_response(400, {"error": message})
+
+
+def unauthorized(message: str) -> dict:
+    return json_response(403, {"error": message})
+
+
+def not_found() -> dict:
+    return json_response(404, {"error": "Not Found"})
+
+
+def internal_error() -> dict:
+    return json_response(500, {"error": "Internal Error"})
+
+
+def encoded_body(result: dict) -> bytes:
+    """Response body as bytes, ready to be written to the socket without further processing"""
+    body = result["body"]
+    if isinstance(body, str):
+        return body.encode("utf-8")
+
+    return body
@@ -0,0 +1,179 @@
+from typing import *
+from datetime import datetime
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from dcat_service.misc.logger import get_logger, Truncated
+from dcat_service.misc.metrics import registry
+from dcat_service.prepared_statements import prepared_statement_sql
+from dcat_service.router import current_route
+from dcat_service.settings import ProfilingSettings
+
+logger = get_logger(__name__)
+
+SQL_DURATION = registry.summary(
+    "dcat_sql_duration_seconds", "Wall time of individual SQL statements, by originating endpoint", ("endpoint",))
+SQL_ROWS = registry.summary(
+    "dcat_sql_rows", "Rows returned or affected by individual SQL statements, by originating endpoint", ("endpoint",))
+
+MAX_STATEMENT_CHARS = 8000
+
+# Only read-only statements are re-run under EXPLAIN ANALYZE
+_READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_DATA_MODIFYING_STATEMENT = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+
+
+class SlowQueryLog:
+    """The slowest statements above the configured threshold, kept in a bounded min-heap: a new statement only
+    replaces the fastest one kept, so a burst of moderately slow statements cannot push out an outlier"""
+
+    def __init__(self, size: int):
+        self._size = size
+        # (duration_ms, sequence, entry); the sequence keeps equal durations from comparing entries
+        self._heap: List[Tuple[float, int, dict]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        item = (entry["duration_ms"], next(self._sequence), entry)
+        with self._lock:
+            if len(self._heap) < self._size:
+                heapq.heappush(self._heap, item)
+            elif self._size > 0 and item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self, limit: int=None) -> List[dict]:
+        with self._lock:
+            items = sorted(self._heap, key=lambda item: item[0], reverse=True)
+
+        entries = [entry for _, _, entry in items]
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+slow_query_log = SlowQueryLog(100)
+_settings = ProfilingSettings(enabled=False)
+# The log is sized by the first engine profiled and shared by all engines of the process (primary, replicas, and
+# engines created again after dispose_engine), so creating an engine does not drop the statements collected so far
+_slow_query_log_configured = False
+_install_lock = threading.Lock()
+
+
+def _current_endpoint() -> str:
+    route = current_route()
+    return route.path if route is not None else "none"
+
+
+def _is_explainable(statement: str) -> bool:
+    return bool(_READ_ONLY_STATEMENT.match(statement)) and not _DATA_MODIFYING_STATEMENT.search(statement)
+
+
+def _explain(cursor, statement: str, parameters) -> Optional[Any]:
+    """Re-run a read-only statement under EXPLAIN (ANALYZE, BUFFERS) on the same connection.
+    A savepoint keeps a failing EXPLAIN from aborting the caller's transaction."""
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute("SAVEPOINT sql_profiler_explain")
+        try:
+            explain_cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+            plan = explain_cursor.fetchone()[0]
+            explain_cursor.execute("RELEASE SAVEPOINT sql_profiler_explain")
+            return plan
+        except Exception:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT sql_profiler_explain")
+            logger.warning("Could not capture plan for slow statement", exc_info=True)
+            return None
+    finally:
+        explain_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute is not called for failed statements
+    start_times = exception_context.connection.info.get("query_start_time") \
+        if exception_context.connection is not None else None
+    if start_times:
+        start_times.pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+
+    duration = time.perf_counter() - start_times.pop()
+    endpoint = _current_endpoint()
+    rowcount = cursor.rowcount
+
+    SQL_DURATION.observe(duration, endpoint=endpoint)
+    if rowcount is not None and rowcount >= 0:
+        SQL_ROWS.observe(rowcount, endpoint=endpoint)
+
+    duration_ms = duration * 1000
+    if duration_ms < _settings.slow_query_ms:
+        return
+
+    # Prepared statements run as EXECUTE <name>(...): their SQL is logged and checked, and the EXECUTE explained
+    prepared_sql = prepared_statement_sql(conn.info, statement)
+    sql = prepared_sql if prepared_sql is not None else statement
+
+    plan = None
+    if _settings.explain_threshold_ms is not None and duration_ms >= _settings.explain_threshold_ms \
+            and not executemany and _is_explainable(sql):
+        plan = _explain(cursor, statement, parameters)
+
+    logger.warning("Slow statement (%.1f ms, %s rows) from %s: %s", duration_ms, rowcount, endpoint,
+                   Truncated(sql))
+    slow_query_log.add({
+        "endpoint": endpoint,
+        "duration_ms": round(duration_ms, 3),
+        "rowcount": rowcount,
+        "executemany": executemany,
+        "statement": sql[:MAX_STATEMENT_CHARS],
+        "prepared_statement": statement[:MAX_STATEMENT_CHARS] if prepared_sql is not None else None,
+        "parameters": str(Truncated(parameters)),
+        "timestamp": datetime.utcnow().isoformat(),
+        "plan": plan
+    })
+
+
+def install_sql_profiler(engine: Engine, settings: ProfilingSettings):
+    """Attach statement timing listeners to the engine; no-op when profiling is disabled"""
+    global slow_query_log, _settings, _slow_query_log_configured
+    if not settings.enabled:
+        return
+
+    with _install_lock:
+        _settings = settings
+        if not _slow_query_log_configured:
+            slow_query_log = SlowQueryLog(settings.slow_query_log_size)
+            _slow_query_log_configured = True
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def get_slow_queries(limit: int=None, reset: bool=False) -> Dict:
+    entries = slow_query_log.entries(limit)
+    if reset:
+        slow_query_log.clear()
+
+    return {
+        "result": "success",
+        "slow_query_ms": _settings.slow_query_ms,
+        "explain_threshold_ms": _settings.explain_threshold_ms,
+        "slow_queries": entries
+    }
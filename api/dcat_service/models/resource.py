@@ -8,10 +8,13 @@ from dcat_service.misc.validator import Validator, ValidateNotEmpty, ValidatorRu
     ValidateTemporalCoverage, ValidateSpatialCoverage, ValidateIsList
 
 from dcat_service import session_scope
+from dcat_service.misc.logger import get_logger, Truncated
 from sqlalchemy import bindparam, Table, func
 from sqlalchemy.dialects import postgresql
 from uuid import uuid4
 
+logger = get_logger(__name__)
+
 
 class Resource:
     def __init__(self, dataset_id: str=None, record_id: str=None, provenance_id: str=None, name: str=None,
@@ -329,7 +332,7 @@ class ResourceCollectionBuilder:
 
         # Get session's connection to perform bulk inserts, but still within self.session's transaction
         connection = self.session.connection()
-        print(resource_json_records)
+        logger.debug("Upserting resources: %s", Truncated(resource_json_records))
         connection.execute(do_update_resources_stmt, resource_json_records)
         if len(resources_variables_json_records) > 0:
             connection.execute(insert_resources_variables_stmt, resources_variables_json_records)
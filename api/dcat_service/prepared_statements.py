@@ -0,0 +1,95 @@
+from typing import *
+import functools
+import hashlib
+import re
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import ClauseElement
+
+from dcat_service.settings import Settings
+
+_dialect = postgresql.dialect()
+_PYFORMAT_PARAMETER = re.compile(r"%\(([^)]+)\)s")
+
+# Statements prepared on a DBAPI connection, by name, with their SQL; kept in its .info (cleared when the connection is
+# replaced). The SQL profiler reads it to log and explain the statements behind EXECUTE.
+PREPARED_STATEMENTS_KEY = "prepared_statements"
+_EXECUTE_STATEMENT = re.compile(r"^\s*EXECUTE\s+(\w+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_positional(statement: ClauseElement) -> Tuple[str, Tuple[str, ...], Dict[str, Any]]:
+    """PostgreSQL SQL of the statement with $n placeholders, the bind parameter name of every position and the values
+    bound into the statement itself"""
+    compiled = statement.compile(dialect=_dialect)
+    names: List[str] = []
+
+    def to_positional(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+
+        return f"${names.index(name) + 1}"
+
+    sql = _PYFORMAT_PARAMETER.sub(to_positional, compiled.string).replace("%%", "%")
+    return sql, tuple(names), compiled.params
+
+
+def compile_statement(statement: Union[str, ClauseElement], params: Dict[str, Any]=None) -> Tuple[str, list]:
+    """Render a statement for positional execution ($1, $2, ...): SQLAlchemy constructs are compiled with the
+    PostgreSQL dialect. Statements reused with different params (the search statements) are compiled once."""
+    if isinstance(statement, str):
+        # Textual queries carry their values inline
+        return statement, []
+
+    if params is None:
+        # Statements built per request (ORM queries) are not worth caching
+        sql, names, bound = _compile_positional.__wrapped__(statement)
+    else:
+        sql, names, bound = _compile_positional(statement)
+        bound = {**bound, **params}
+
+    return sql, [bound[name] for name in names]
+
+
+@functools.lru_cache(maxsize=256)
+def _execute_clause(name: str, arity: int) -> ClauseElement:
+    arguments = ", ".join(f":p{i}" for i in range(arity))
+    return text(f"EXECUTE {name}({arguments})" if arity else f"EXECUTE {name}")
+
+
+def execute_prepared(session, statement: ClauseElement, params: Dict[str, Any]):
+    """Execute a statement of stable shape as a server-side prepared statement, so PostgreSQL parses and plans it once
+    per connection rather than once per request.
+
+    Behind an external pooler (DB_EXTERNAL_POOLER) consecutive transactions may run on different server connections,
+    so the statement is executed directly instead."""
+    if Settings.get_instance().database.pool.external_pooler:
+        return session.execute(statement, params)
+
+    sql, args = compile_statement(statement, params)
+    name = "dcat_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:24]
+
+    connection = session.connection()
+    prepared = connection.info.setdefault(PREPARED_STATEMENTS_KEY, {})
+    if name not in prepared:
+        # Straight on the DBAPI cursor: without parameters psycopg2 sends the text as is, $n placeholders included.
+        # Prepared statements outlive the transaction that created them.
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+        finally:
+            cursor.close()
+        prepared[name] = sql
+
+    return session.execute(_execute_clause(name, len(args)), {f"p{i}": arg for i, arg in enumerate(args)})
+
+
+def prepared_statement_sql(connection_info: dict, statement: str) -> Optional[str]:
+    """SQL of the prepared statement an EXECUTE statement runs on the connection of connection_info, if any"""
+    match = _EXECUTE_STATEMENT.match(statement)
+    if match is None:
+        return None
+
+    return connection_info.get(PREPARED_STATEMENTS_KEY, {}).get(match.group(1))
@@ -1,8 +1,5 @@
-from flask import Blueprint, jsonify, request
-from dcat_service.handler import _parse_json, register_provenance_handler
-from dcat_service.misc.exception import UnauthorizedException, BadRequestException, InternalServerException
-import sys
-import traceback
+from flask import Blueprint
+from dcat_service.flask_adapter import handle_flask_request
 
 provenance_blueprint = Blueprint('provenance', __name__, url_prefix='/provenance')
 
@@ -18,18 +15,5 @@ def test_provenance_api():
 
 @provenance_blueprint.route('/register_provenance', methods=['POST'])
 def register_provenance_api():
-    event = request.get_json()
-    event['body'] = _parse_json(event.get('body', ''))
-    try:
-        result = register_provenance_handler(event)
-        return jsonify(result), 200
-    except UnauthorizedException as e:
-        return jsonify(error=str(e)), 403
-    except BadRequestException as e:
-        return jsonify(error=str(e)), 400
-    except InternalServerException as e:
-        traceback.print_exc(file=sys.stdout)
-        return jsonify(error="Internal Error"), 500
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
-        return jsonify(error="Internal Error"), 500
\ No newline at end of file
+    return handle_flask_request('/provenance/register_provenance')
+
@@ -0,0 +1,271 @@
+from typing import *
+from collections import OrderedDict
+import hashlib
+import math
+import threading
+
+import ujson
+from sqlalchemy import and_, func
+
+from dcat_service.misc.exception import BadRequestException
+from dcat_service.misc.metrics import registry
+from dcat_service.settings import Settings
+
+# Geometries of spatial filters ('spatial_coverage' of searches, finds and dataset resources). A geometry is validated,
+# normalized to two-dimensional GeoJSON with closed rings and without repeated vertices, and simplified to
+# QUERY_GEOMETRY_SIMPLIFY_TOLERANCE once, then cached by hash of the value sent: a watershed drawn in the UI is parsed
+# once per worker rather than on every request. Filters test its bounding box with `&&` first, so the exact predicate
+# only runs on the rows whose own box overlaps it.
+
+GEOMETRY_CACHE_LOOKUPS = registry.counter(
+    "dcat_query_geometry_cache_lookups_total", "Query geometry cache lookups, by outcome: hit or miss", ("outcome",))
+GEOMETRY_VERTICES = registry.summary(
+    "dcat_query_geometry_vertices", "Vertices of parsed query geometries, by stage: received or simplified",
+    ("stage",))
+
+# Nesting depth of the positions in the coordinates of each geometry type
+_POSITION_DEPTHS = {"Point": 0, "MultiPoint": 1, "LineString": 1, "MultiLineString": 2, "Polygon": 2,
+                    "MultiPolygon": 3}
+
+Position = Tuple[float, float]
+
+
+class QueryGeometry:
+    __slots__ = ("geojson", "bbox", "vertices")
+
+    def __init__(self, geojson: str, bbox: Tuple[float, float, float, float], vertices: int):
+        # Normalized and simplified GeoJSON, in the SRID of the catalog (WGS 84)
+        self.geojson = geojson
+        # (x_min, y_min, x_max, y_max)
+        self.bbox = bbox
+        self.vertices = vertices
+
+
+def _invalid(field: str, reason: str) -> BadRequestException:
+    return BadRequestException({'InvalidQueryDefinition': f"Invalid geometry for '{field}': {reason}"})
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _position(value, field: str) -> Position:
+    if not isinstance(value, (list, tuple)) or len(value) < 2 or not _is_number(value[0]) \
+            or not _is_number(value[1]):
+        raise _invalid(field, f"positions must be arrays of [longitude, latitude]; received {value}")
+
+    x, y = float(value[0]), float(value[1])
+    if not -180 <= x <= 180 or not -90 <= y <= 90:
+        raise _invalid(field, f"position out of longitude/latitude range: {value}")
+
+    return x, y
+
+
+def _squared_segment_distance(point: Position, start: Position, end: Position) -> float:
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return (point[0] - start[0]) ** 2 + (point[1] - start[1]) ** 2
+
+    t = max(0.0, min(1.0, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)))
+    return (point[0] - start[0] - t * dx) ** 2 + (point[1] - start[1] - t * dy) ** 2
+
+
+def _simplify(positions: List[Position], tolerance: float, ring: bool) -> List[Position]:
+    """Douglas-Peucker, without recursion so that lines of any length can be simplified. Rings keep at least four
+    positions; a ring that would not is kept as sent."""
+    minimum = 4 if ring else 2
+    if tolerance <= 0 or len(positions) <= minimum:
+        return positions
+
+    keep = [False] * len(positions)
+    keep[0] = keep[-1] = True
+    squared_tolerance = tolerance * tolerance
+    stack = [(0, len(positions) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, farthest_distance = None, squared_tolerance
+        for index in range(first + 1, last):
+            distance = _squared_segment_distance(positions[index], positions[first], positions[last])
+            if distance > farthest_distance:
+                farthest, farthest_distance = index, distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    simplified = [position for position, kept in zip(positions, keep) if kept]
+    return simplified if len(simplified) >= minimum else positions
+
+
+def _line(value, field: str, ring: bool, tolerance: float) -> List[Position]:
+    if not isinstance(value, list):
+        raise _invalid(field, f"lines and rings must be arrays of positions; received {value}")
+
+    positions: List[Position] = []
+    for item in value:
+        position = _position(item, field)
+        if len(positions) == 0 or positions[-1] != position:
+            positions.append(position)
+
+    if ring:
+        if len(positions) > 0 and positions[0] != positions[-1]:
+            positions.append(positions[0])
+        if len(positions) < 4:
+            raise _invalid(field, f"polygon rings must have at least three distinct positions; received {value}")
+    elif len(positions) < 2:
+        raise _invalid(field, f"lines must have at least two distinct positions; received {value}")
+
+    return _simplify(positions, tolerance, ring)
+
+
+def _polygon(value, field: str, tolerance: float) -> List[List[Position]]:
+    if not isinstance(value, list) or len(value) == 0:
+        raise _invalid(field, f"polygons must be non-empty arrays of rings; received {value}")
+
+    return [_line(ring, field, True, tolerance) for ring in value]
+
+
+def _coordinates(geometry_type: str, value, field: str, tolerance: float):
+    if geometry_type != "Point" and (not isinstance(value, list) or len(value) == 0):
+        raise _invalid(field, f"{geometry_type} coordinates must be a non-empty array; received {value}")
+
+    if geometry_type == "Point":
+        return _position(value, field)
+    elif geometry_type == "MultiPoint":
+        return [_position(item, field) for item in value]
+    elif geometry_type == "LineString":
+        return _line(value, field, False, tolerance)
+    elif geometry_type == "MultiLineString":
+        return [_line(item, field, False, tolerance) for item in value]
+    elif geometry_type == "Polygon":
+        return _polygon(value, field, tolerance)
+    else:
+        return [_polygon(item, field, tolerance) for item in value]
+
+
+def _normalize(value, field: str, tolerance: float) -> dict:
+    if not isinstance(value, dict):
+        raise _invalid(field, f"must be a GeoJSON object or [x_min, y_min, x_max, y_max]; received {value}")
+
+    value_type = value.get("type")
+    if value_type == "Feature":
+        return _normalize(value.get("geometry"), field, tolerance)
+
+    if value_type in ("FeatureCollection", "GeometryCollection"):
+        members = value.get("features" if value_type == "FeatureCollection" else "geometries")
+        if not isinstance(members, list) or len(members) == 0:
+            raise _invalid(field, f"{value_type} must not be empty")
+
+        return {"type": "GeometryCollection", "geometries": [_normalize(member, field, tolerance)
+                                                             for member in members]}
+
+    if value_type not in _POSITION_DEPTHS:
+        raise _invalid(field, f"unsupported type {value_type}; must be either of {list(_POSITION_DEPTHS)}, Feature, "
+                              f"FeatureCollection or GeometryCollection")
+
+    return {"type": value_type, "coordinates": _coordinates(value_type, value.get("coordinates"), field, tolerance)}
+
+
+def _envelope(value: list, field: str) -> dict:
+    if len(value) != 4 or not all(_is_number(item) for item in value):
+        raise _invalid(field, f"bounding boxes must be [x_min, y_min, x_max, y_max]; received {value}")
+
+    x_min, y_min = _position(value[:2], field)
+    x_max, y_max = _position(value[2:], field)
+    if x_min > x_max or y_min > y_max:
+        raise _invalid(field, f"bounding box minimums must not exceed its maximums; received {value}")
+
+    return {"type": "Polygon", "coordinates": [[(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max),
+                                                (x_min, y_min)]]}
+
+
+def _positions(geometry: dict) -> Iterator[Position]:
+    if geometry["type"] == "GeometryCollection":
+        for member in geometry["geometries"]:
+            yield from _positions(member)
+        return
+
+    coordinates = [geometry["coordinates"]]
+    for _ in range(_POSITION_DEPTHS[geometry["type"]]):
+        coordinates = [item for items in coordinates for item in items]
+
+    yield from coordinates
+
+
+def _count_positions(value) -> int:
+    """Positions of a GeoJSON value as sent"""
+    if isinstance(value, dict):
+        return sum(_count_positions(item) for key, item in value.items()
+                   if key in ("coordinates", "geometry", "geometries", "features"))
+    if isinstance(value, list):
+        if len(value) > 0 and _is_number(value[0]):
+            return 1
+        return sum(_count_positions(item) for item in value)
+
+    return 0
+
+
+def _parse(value: Union[dict, list], field: str) -> QueryGeometry:
+    if isinstance(value, list):
+        geometry = _envelope(value, field)
+    else:
+        geometry = _normalize(value, field, Settings.get_instance().geometry.simplify_tolerance)
+
+    positions = list(_positions(geometry))
+    bbox = (min(x for x, _ in positions), min(y for _, y in positions),
+            max(x for x, _ in positions), max(y for _, y in positions))
+
+    GEOMETRY_VERTICES.observe(_count_positions(value), stage="received")
+    GEOMETRY_VERTICES.observe(len(positions), stage="simplified")
+    return QueryGeometry(ujson.dumps(geometry), bbox, len(positions))
+
+
+_cache: 'OrderedDict[str, QueryGeometry]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def query_geometry(value: Union[dict, list], field: str="spatial_coverage") -> QueryGeometry:
+    """Parsed geometry of a spatial filter: GeoJSON (a geometry, Feature or FeatureCollection) or a bounding box
+    [x_min, y_min, x_max, y_max]. Raises BadRequestException for invalid geometries."""
+    key = hashlib.sha1(ujson.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+    with _cache_lock:
+        geometry = _cache.get(key)
+        if geometry is not None:
+            _cache.move_to_end(key)
+
+    GEOMETRY_CACHE_LOOKUPS.inc(outcome="hit" if geometry is not None else "miss")
+    if geometry is not None:
+        return geometry
+
+    geometry = _parse(value, field)
+    cache_size = Settings.get_instance().geometry.cache_size
+    with _cache_lock:
+        _cache[key] = geometry
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+
+    return geometry
+
+
+def query_geometry_params(geometry: QueryGeometry) -> Dict[str, Any]:
+    """Parameters of the condition built by spatial_filter_sql"""
+    x_min, y_min, x_max, y_max = geometry.bbox
+    return {"spatial_coverage": geometry.geojson, "spatial_x_min": x_min, "spatial_y_min": y_min,
+            "spatial_x_max": x_max, "spatial_y_max": y_max}
+
+
+def spatial_filter_sql(column: str, predicate: str, srid: int) -> str:
+    """Bounding box test, then the exact predicate (ST_Intersects or ST_Within) of a column against the query geometry
+    bound by query_geometry_params"""
+    return (f"{column} && ST_MakeEnvelope(:spatial_x_min, :spatial_y_min, :spatial_x_max, :spatial_y_max, {srid}) "
+            f"AND {predicate}({column}, ST_SetSRID(ST_GeomFromGeoJSON(CAST(:spatial_coverage AS text)), {srid}))")
+
+
+def spatial_filter(column, op: str, geometry: QueryGeometry, srid: int):
+    """Bounding box test, then the exact predicate of op ('within' or 'intersects') of a geometry column against the
+    query geometry"""
+    shape = func.ST_SetSRID(func.ST_GeomFromGeoJSON(geometry.geojson), srid)
+    exact = column.ST_Within(shape) if op == "within" else column.ST_Intersects(shape)
+
+    return and_(column.op("&&")(func.ST_MakeEnvelope(*geometry.bbox, srid)), exact)
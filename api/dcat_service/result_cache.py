@@ -0,0 +1,270 @@
+from typing import *
+from collections import OrderedDict
+import threading
+import time
+
+import ujson
+
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.metrics import registry
+from dcat_service.settings import Settings
+
+if TYPE_CHECKING:
+    from dcat_service.change_feed import CatalogChange
+
+logger = get_logger(__name__)
+
+# In-process cache of the results of cacheable routes, keyed by path and normalized request body. Entries are
+# size- and TTL-bounded, and invalidated by the catalog change feed:
+# - requests about one dataset (a 'dataset_id' in the body) are dropped when that dataset changes;
+# - any other request (searches, finds) is dropped when a dataset it returned changes, or when a change can alter
+#   which records match (registrations, renames, deletions, syncs);
+# - results counting over every matched dataset (search facets, temporal histograms) are dropped on any change.
+
+CACHE_LOOKUPS = registry.counter(
+    "dcat_result_cache_lookups_total", "Result cache lookups, by endpoint and outcome: hit, miss or bypass",
+    ("endpoint", "outcome"))
+CACHE_EVICTIONS = registry.counter(
+    "dcat_result_cache_evictions_total", "Result cache entries removed, by reason: size, ttl or change",
+    ("reason",))
+CACHE_ENTRIES = registry.gauge("dcat_result_cache_entries", "Entries in the result cache of this process")
+
+# Response fields counting over every matched dataset rather than listing them
+AGGREGATE_FIELDS = frozenset(["facets", "histogram"])
+
+# Body fields holding GeoJSON or bounding boxes; their coordinates are rounded in cache keys
+GEOMETRY_FIELDS = frozenset(["spatial_coverage", "spatial_coverage__within", "spatial_coverage__intersects",
+                             "filter", "geometry", "coordinates", "bbox"])
+
+
+def _round_coordinates(value: Any, precision: int) -> Any:
+    if isinstance(value, float):
+        return round(value, precision)
+    elif isinstance(value, list):
+        return [_round_coordinates(item, precision) for item in value]
+    elif isinstance(value, dict):
+        return {key: _round_coordinates(item, precision) for key, item in value.items()}
+
+    return value
+
+
+def cache_key(path: str, body: Any, precision: int) -> str:
+    if isinstance(body, dict):
+        body = {key: _round_coordinates(value, precision) if key in GEOMETRY_FIELDS else value
+                for key, value in body.items()}
+
+    return path + ":" + ujson.dumps(body, sort_keys=True)
+
+
+def _collect_dataset_ids(value: Any, dataset_ids: Set[str]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "dataset_id" and item is not None:
+                dataset_ids.add(str(item))
+            else:
+                _collect_dataset_ids(item, dataset_ids)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_dataset_ids(item, dataset_ids)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "dataset_ids", "scoped")
+
+    def __init__(self, value: Any, expires_at: float, dataset_ids: Optional[FrozenSet[str]], scoped: bool):
+        self.value = value
+        self.expires_at = expires_at
+        # None when the entry depends on datasets it does not list
+        self.dataset_ids = dataset_ids
+        # The entry is about the datasets in dataset_ids only: membership changes elsewhere cannot affect it
+        self.scoped = scoped
+
+
+class ResultCache:
+    """LRU cache with a TTL. Results computed across an invalidation are not stored, since they may predate it."""
+
+    def __init__(self, max_entries: int, ttl: float, entries_gauge=CACHE_ENTRIES, evictions_counter=CACHE_EVICTIONS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Caches of other kinds of values (vector tiles) report under their own metrics
+        self._entries_gauge = entries_gauge
+        self._evictions_counter = evictions_counter
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self._evictions_counter.inc(reason="ttl")
+                self._entries_gauge.set(len(self._entries))
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, entry.value
+
+    def put(self, key: str, value: Any, dataset_ids: Optional[FrozenSet[str]], scoped: bool, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries[key] = _Entry(value, time.monotonic() + self.ttl, dataset_ids, scoped)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions_counter.inc(reason="size")
+            self._entries_gauge.set(len(self._entries))
+
+    def invalidate(self, change: 'CatalogChange'):
+        with self._lock:
+            self._generation += 1
+            if change.dataset_ids is None:
+                stale = list(self._entries.keys())
+            else:
+                stale = [key for key, entry in self._entries.items()
+                         if (change.membership and not entry.scoped) or entry.dataset_ids is None
+                         or not entry.dataset_ids.isdisjoint(change.dataset_ids)]
+
+            for key in stale:
+                del self._entries[key]
+            self._entries_gauge.set(len(self._entries))
+
+        if stale:
+            self._evictions_counter.inc(len(stale), reason="change")
+            logger.debug("Result cache dropped %s entries after %s", len(stale), change)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._entries_gauge.set(0)
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Cache of this process; None when disabled"""
+    global _cache
+    if _cache is None:
+        settings = Settings.get_instance().cache
+        if not settings.enabled:
+            return None
+
+        # The change feed needs the ORM models, so it is only imported once a cacheable route is served
+        from dcat_service import change_feed
+
+        with _cache_lock:
+            if _cache is None:
+                cache = ResultCache(settings.max_entries, settings.ttl)
+                change_feed.subscribe(cache.invalidate)
+                _cache = cache
+
+    return _cache
+
+
+def _bypass(route, cache: ResultCache) -> Tuple[Optional[ResultCache], Optional[str], bool, Any]:
+    # Changes made by other processes cannot be seen: serve from the database until they can
+    logger.warning("Could not read the catalog change feed; bypassing the result cache", exc_info=True)
+    cache.clear()
+    CACHE_LOOKUPS.inc(endpoint=route.path, outcome="bypass")
+    return None, None, False, None
+
+
+def _lookup(route, event: dict) -> Tuple[Optional[ResultCache], Optional[str], bool, Any]:
+    """(cache, key, hit, value); cache is None when the request bypasses the cache"""
+    cache = get_result_cache() if route.cacheable else None
+    if cache is None:
+        return None, None, False, None
+
+    from dcat_service import change_feed
+
+    try:
+        change_feed.poll()
+    except Exception:
+        return _bypass(route, cache)
+
+    return _get(route, cache, event)
+
+
+async def _lookup_async(route, event: dict) -> Tuple[Optional[ResultCache], Optional[str], bool, Any]:
+    """_lookup reading the change feed on a thread: a poll is a blocking psycopg2 round trip"""
+    cache = get_result_cache() if route.cacheable else None
+    if cache is None:
+        return None, None, False, None
+
+    from dcat_service import change_feed
+    from dcat_service.async_db import run_blocking
+
+    try:
+        if change_feed.poll_due():
+            await run_blocking(change_feed.poll)
+    except Exception:
+        return _bypass(route, cache)
+
+    return _get(route, cache, event)
+
+
+def _get(route, cache: ResultCache, event: dict) -> Tuple[Optional[ResultCache], Optional[str], bool, Any]:
+    key = cache_key(route.path, event.get('body'), Settings.get_instance().cache.coordinate_precision)
+    hit, value = cache.get(key)
+    CACHE_LOOKUPS.inc(endpoint=route.path, outcome="hit" if hit else "miss")
+    return cache, key, hit, value
+
+
+def _store(cache: ResultCache, key: str, event_body: Any, value: Any, generation: int):
+    dataset_ids: Set[str] = set()
+    scoped = isinstance(event_body, dict) and event_body.get("dataset_id") is not None
+    if scoped:
+        dataset_ids.add(str(event_body["dataset_id"]))
+    elif isinstance(value, dict) and not AGGREGATE_FIELDS.isdisjoint(value.keys()):
+        # Facets and histograms count over matched datasets beyond the ones returned
+        cache.put(key, value, None, scoped, generation)
+        return
+    else:
+        _collect_dataset_ids(value, dataset_ids)
+
+    cache.put(key, value, frozenset(dataset_ids), scoped, generation)
+
+
+def result_cache_middleware(route, event: dict, call_next):
+    """Serve cacheable routes from the result cache. Controllers consume fields of the body, so the key and the
+    scope are taken before the request is handed on."""
+    cache, key, hit, value = _lookup(route, event)
+    if cache is None:
+        return call_next(event)
+    if hit:
+        return value
+
+    body = dict(event['body']) if isinstance(event.get('body'), dict) else event.get('body')
+    generation = cache.generation
+    value = call_next(event)
+    _store(cache, key, body, value, generation)
+    return value
+
+
+async def _result_cache_middleware_async(route, event: dict, call_next):
+    cache, key, hit, value = await _lookup_async(route, event)
+    if cache is None:
+        return await call_next(event)
+    if hit:
+        return value
+
+    body = dict(event['body']) if isinstance(event.get('body'), dict) else event.get('body')
+    generation = cache.generation
+    value = await call_next(event)
+    _store(cache, key, body, value, generation)
+    return value
+
+
+result_cache_middleware.async_variant = _result_cache_middleware_async
@@ -0,0 +1,190 @@
+from typing import *
+import contextvars
+import hmac
+
+from dcat_service.misc.exception import BadRequestException, UnauthorizedException
+
+
+# Statement timeouts (in milliseconds) applied to database sessions opened while serving a route;
+# None leaves the server default in place
+TIMEOUT_CLASSES = {
+    "default": None,
+    "search": 30000,
+    "bulk": None
+}
+
+# A context variable rather than a thread-local so it is also isolated between asyncio tasks sharing a thread
+_current_route: contextvars.ContextVar = contextvars.ContextVar("current_route", default=None)
+
+
+def current_route() -> Optional['Route']:
+    """Route currently being dispatched in this thread or task, if any"""
+    return _current_route.get()
+
+
+def current_statement_timeout() -> Optional[int]:
+    route = current_route()
+    if route is None:
+        return None
+
+    return TIMEOUT_CLASSES.get(route.timeout_class)
+
+
+class Route:
+    def __init__(self, path: str, handler: Callable[[dict], Any], requires_auth: bool=False,
+                 body_schema: Dict[str, Any]=None, cacheable: bool=False, timeout_class: str="default",
+                 requires_admin: bool=False, async_handler: Callable[[dict], Awaitable[Any]]=None):
+        if timeout_class not in TIMEOUT_CLASSES:
+            raise ValueError(f"Unknown timeout class '{timeout_class}'; must be one of {list(TIMEOUT_CLASSES.keys())}")
+
+        self.path = path
+        self.handler = handler
+        self.requires_auth = requires_auth
+        self.requires_admin = requires_admin
+        self.body_schema = body_schema
+        self.cacheable = cacheable
+        self.timeout_class = timeout_class
+
+        # Coroutine variant of the handler, served by the async entry point
+        self.async_handler = async_handler
+
+        # Composed middleware chains; built by Router when the route is registered
+        self.pipeline = handler
+        self.async_pipeline = None
+
+    def dispatch(self, event: dict):
+        token = _current_route.set(self)
+        try:
+            return self.pipeline(event)
+        finally:
+            _current_route.reset(token)
+
+    async def dispatch_async(self, event: dict):
+        token = _current_route.set(self)
+        try:
+            return await self.async_pipeline(event)
+        finally:
+            _current_route.reset(token)
+
+    def __repr__(self):
+        return f"Route({self.path})"
+
+
+# Middleware signature: middleware(route, event, call_next) -> result
+# A middleware that needs to wrap the awaited handler (e.g. to time it) exposes a coroutine function with the same
+# signature as its `async_variant` attribute; other middleware run unchanged in async pipelines.
+Middleware = Callable[[Route, dict, Callable[[dict], Any]], Any]
+
+_FORWARDED = object()
+
+
+class Router:
+    def __init__(self, middleware: List[Middleware]=None):
+        self.routes: Dict[str, Route] = {}
+        self.middleware: List[Middleware] = list(middleware or [])
+
+    def add_route(self, route: Route):
+        self._build_pipelines(route)
+        self.routes[route.path] = route
+
+    def use(self, middleware: Middleware):
+        """Append middleware to the pipeline and rebuild the chain of every registered route"""
+        self.middleware.append(middleware)
+        for route in self.routes.values():
+            self._build_pipelines(route)
+
+    def _build_pipelines(self, route: Route):
+        route.pipeline = self._compose(route)
+        if route.async_handler is not None:
+            route.async_pipeline = self._compose_async(route)
+
+    def resolve(self, path: str) -> Optional[Route]:
+        return self.routes.get(path)
+
+    @property
+    def paths(self) -> FrozenSet[str]:
+        return frozenset(self.routes.keys())
+
+    def _compose(self, route: Route) -> Callable[[dict], Any]:
+        call_next = route.handler
+        for middleware in reversed(self.middleware):
+            call_next = self._bind(middleware, route, call_next)
+
+        return call_next
+
+    @staticmethod
+    def _bind(middleware: Middleware, route: Route, call_next: Callable[[dict], Any]) -> Callable[[dict], Any]:
+        def step(event):
+            return middleware(route, event, call_next)
+
+        return step
+
+    def _compose_async(self, route: Route) -> Callable[[dict], Awaitable[Any]]:
+        call_next = route.async_handler
+        for middleware in reversed(self.middleware):
+            call_next = self._bind_async(middleware, route, call_next)
+
+        return call_next
+
+    @staticmethod
+    def _bind_async(middleware: Middleware, route: Route,
+                    call_next: Callable[[dict], Awaitable[Any]]) -> Callable[[dict], Awaitable[Any]]:
+        async_variant = getattr(middleware, "async_variant", None)
+        if async_variant is not None:
+            async def step(event):
+                return await async_variant(route, event, call_next)
+
+            return step
+
+        async def step(event):
+            # Run the synchronous middleware up to the point where it hands the event on, then await the rest of
+            # the chain; a middleware that answers by itself short-circuits as it does in the synchronous pipeline
+            forwarded = []
+            result = middleware(route, event, lambda next_event: forwarded.append(next_event) or _FORWARDED)
+            if result is _FORWARDED:
+                return await call_next(forwarded[0])
+
+            return result
+
+        return step
+
+
+def authentication_middleware(is_api_key_valid: Callable[[Optional[str]], bool]) -> Middleware:
+    def authenticate(route: Route, event: dict, call_next):
+        if route.requires_auth and not is_api_key_valid((event.get('headers') or {}).get('X-Api-Key')):
+            raise UnauthorizedException("Invalid X-Api-Key")
+
+        return call_next(event)
+
+    return authenticate
+
+
+def admin_middleware(admin_api_key: Callable[[], Optional[str]]) -> Middleware:
+    """Admin routes require the X-Admin-Key header to match the configured key; without one they are disabled"""
+    def authorize_admin(route: Route, event: dict, call_next):
+        if route.requires_admin:
+            expected_key = admin_api_key()
+            provided_key = (event.get('headers') or {}).get('X-Admin-Key')
+            if expected_key is None or provided_key is None or not hmac.compare_digest(provided_key, expected_key):
+                raise UnauthorizedException("Invalid X-Admin-Key")
+
+        return call_next(event)
+
+    return authorize_admin
+
+
+def body_schema_middleware(route: Route, event: dict, call_next):
+    if route.body_schema is not None:
+        body = event.get('body')
+        if body is None:
+            body = {}
+            event['body'] = body
+
+        if not isinstance(body, dict):
+            raise BadRequestException({'InvalidRequestBody': f"Request body must be a JSON object; received {body}"})
+
+        for key, expected_type in route.body_schema.items():
+            if key in body and body[key] is not None and not isinstance(body[key], expected_type):
+                raise BadRequestException({'InvalidRequestBody': f"Invalid value type for '{key}': {body[key]}"})
+
+    return call_next(event)
@@ -0,0 +1,334 @@
+from typing import *
+from collections import OrderedDict
+import heapq
+import math
+import threading
+import time
+
+from sqlalchemy import text
+
+from dcat_service.misc.exception import InternalServerException
+from dcat_service.misc.logger import get_logger
+from dcat_service.misc.metrics import registry
+from dcat_service.settings import Settings
+
+if TYPE_CHECKING:
+    from dcat_service.change_feed import CatalogChange
+
+logger = get_logger(__name__)
+
+# In-process inverted index of the dataset search documents (SEARCH_ENGINE=memory). It ranks keyword searches with
+# BM25 over the lexemes of the tsvector of dataset_search_documents, weighted by their label (name A, tags B, standard
+# variables C, variables and description D), and leaves the rest of a search (spatial and temporal filters, the
+# columns of the page) to PostgreSQL. Documents and keywords are both normalized by PostgreSQL (to_tsvector('english')),
+# and a keyword of several words matches as a phrase, so the index matches the datasets a PostgreSQL keyword search
+# matches. The index is loaded on the first search and kept current by the catalog change feed: changed datasets are
+# reloaded before the next search.
+
+INDEX_DOCUMENTS = registry.gauge("dcat_search_index_documents", "Datasets in the in-process search index")
+INDEX_RELOADS = registry.counter(
+    "dcat_search_index_reloads_total", "Search index loads, by scope: full or partial", ("scope",))
+INDEX_QUERY_DURATION = registry.summary(
+    "dcat_search_index_query_seconds", "Time spent ranking a keyword search in the in-process index")
+
+# Weight of each occurrence of a lexeme by its label, as ts_rank weighs {D, C, B, A}: {0.1, 0.2, 0.4, 1.0}
+LABEL_WEIGHTS = {"A": 10.0, "B": 4.0, "C": 2.0, "D": 1.0}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keywords whose lexemes are kept per process
+KEYWORD_CACHE_SIZE = 4096
+
+# The lexemes of a keyword with their offsets from its first word, as to_tsquery reads a quoted keyword: several words
+# form a phrase, with the gaps of the stop words left out
+Keyword = Tuple[Tuple[int, str], ...]
+
+_LOAD_QUERY = """
+    SELECT datasets.id, datasets.provenance_id, datasets.has_source, entries.lexemes, entries.positions,
+           entries.weights
+    FROM datasets
+    JOIN dataset_search_documents ON dataset_search_documents.dataset_id = datasets.id
+    CROSS JOIN LATERAL (
+        SELECT array_agg(entry.lexeme) AS lexemes, array_agg(array_to_string(entry.positions, ',')) AS positions,
+               array_agg(array_to_string(entry.weights, '')) AS weights
+        FROM unnest(dataset_search_documents.tsv) AS entry
+    ) AS entries
+"""
+
+_KEYWORDS_QUERY = """
+    SELECT keywords.keyword, entry.lexeme, entry.positions
+    FROM unnest(CAST(:keywords AS text[])) AS keywords(keyword)
+    CROSS JOIN LATERAL unnest(to_tsvector('english', keywords.keyword)) AS entry
+"""
+
+_keyword_cache: 'OrderedDict[str, Keyword]' = OrderedDict()
+_keyword_cache_lock = threading.Lock()
+
+
+def _keyword(entries: Iterable[Tuple[str, Sequence[int]]]) -> Keyword:
+    occurrences = sorted((position, lexeme) for lexeme, positions in entries for position in positions)
+    if not occurrences:
+        return ()
+
+    first = occurrences[0][0]
+    return tuple((position - first, lexeme) for position, lexeme in occurrences)
+
+
+def parse_keywords(search_query: List) -> List[Keyword]:
+    """Lexemes of every keyword of a search, from PostgreSQL; keywords made of stop words only have none"""
+    keywords = [str(keyword) for keyword in search_query]
+    parsed: Dict[str, Keyword] = {}
+    with _keyword_cache_lock:
+        for keyword in keywords:
+            if keyword in _keyword_cache:
+                _keyword_cache.move_to_end(keyword)
+                parsed[keyword] = _keyword_cache[keyword]
+
+    missing = sorted(set(keywords) - set(parsed))
+    if missing:
+        from dcat_service import session_scope
+
+        try:
+            with session_scope(read_only=True) as session:
+                rows = session.execute(text(_KEYWORDS_QUERY), {"keywords": missing}).fetchall()
+        except Exception as e:
+            logger.exception("Query failed")
+            raise InternalServerException(e)
+
+        entries: Dict[str, List[Tuple[str, Sequence[int]]]] = {keyword: [] for keyword in missing}
+        for row in rows:
+            entries[row["keyword"]].append((row["lexeme"], row["positions"]))
+
+        with _keyword_cache_lock:
+            for keyword in missing:
+                parsed[keyword] = _keyword_cache[keyword] = _keyword(entries[keyword])
+            while len(_keyword_cache) > KEYWORD_CACHE_SIZE:
+                _keyword_cache.popitem(last=False)
+
+    return [parsed[keyword] for keyword in keywords]
+
+
+class _Document:
+    __slots__ = ("dataset_id", "provenance_id", "has_source", "length", "terms", "positions")
+
+    def __init__(self, dataset_id: str, provenance_id: Optional[str], has_source: int, length: float,
+                 terms: Dict[str, float], positions: Dict[str, FrozenSet[int]]):
+        self.dataset_id = dataset_id
+        self.provenance_id = provenance_id
+        self.has_source = has_source
+        self.length = length
+        # lexeme -> weighted frequency
+        self.terms = terms
+        # lexeme -> positions in the tsvector, for phrases
+        self.positions = positions
+
+    def contains_phrase(self, keyword: Keyword) -> bool:
+        first_offset, first_lexeme = keyword[0]
+        return any(all(start - first_offset + offset in self.positions[lexeme] for offset, lexeme in keyword[1:])
+                   for start in self.positions[first_lexeme])
+
+
+class SearchIndex:
+    """Inverted index: term -> {document slot: weighted frequency}. Slots of removed documents are reused."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents: List[Optional[_Document]] = []
+        self._slots: Dict[str, int] = {}
+        self._free_slots: List[int] = []
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._total_length = 0.0
+        # Datasets to reload before the next search; None reloads the whole index
+        self._pending: Optional[Set[str]] = None
+        self._pending_lock = threading.Lock()
+        # One load at a time; searches wait for the one in progress rather than read a partly loaded index
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def invalidate(self, change: 'CatalogChange'):
+        """Change feed subscriber: the datasets of the change are reloaded before the next search"""
+        with self._pending_lock:
+            if change.dataset_ids is None:
+                self._pending = None
+            elif self._pending is not None:
+                self._pending.update(change.dataset_ids)
+
+    def _remove(self, dataset_id: str):
+        slot = self._slots.pop(dataset_id, None)
+        if slot is None:
+            return
+
+        document = self._documents[slot]
+        for term in document.terms:
+            postings = self._postings[term]
+            del postings[slot]
+            if len(postings) == 0:
+                del self._postings[term]
+
+        self._total_length -= document.length
+        self._documents[slot] = None
+        self._free_slots.append(slot)
+
+    def _add(self, row):
+        dataset_id = str(row["id"])
+        self._remove(dataset_id)
+
+        terms: Dict[str, float] = {}
+        positions: Dict[str, FrozenSet[int]] = {}
+        # A stale document has no tsvector until the transaction changing it commits
+        for lexeme, lexeme_positions, weights in zip(row["lexemes"] or (), row["positions"] or (),
+                                                     row["weights"] or ()):
+            terms[lexeme] = sum(LABEL_WEIGHTS[label] for label in weights)
+            positions[lexeme] = frozenset(int(position) for position in lexeme_positions.split(","))
+
+        document = _Document(dataset_id, str(row["provenance_id"]) if row["provenance_id"] is not None else None,
+                             int(bool(row["has_source"])), sum(terms.values()), terms, positions)
+        slot = self._free_slots.pop() if self._free_slots else len(self._documents)
+        if slot == len(self._documents):
+            self._documents.append(document)
+        else:
+            self._documents[slot] = document
+
+        self._slots[dataset_id] = slot
+        self._total_length += document.length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[slot] = frequency
+
+    def refresh(self):
+        """Load the datasets changed since the last search; the whole catalog on the first one"""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = set()
+
+        if pending is not None and len(pending) == 0:
+            return
+
+        from dcat_service import session_scope
+
+        try:
+            # Read from the primary: a replica may not have the changes just published yet
+            with session_scope() as session:
+                if pending is None:
+                    rows = session.execute(text(_LOAD_QUERY)).fetchall()
+                else:
+                    rows = session.execute(text(_LOAD_QUERY + " WHERE datasets.id = ANY(CAST(:dataset_ids AS uuid[]))"),
+                                           {"dataset_ids": sorted(pending)}).fetchall()
+        except Exception:
+            # Load them on the next search
+            self._requeue(pending)
+            raise
+
+        with self._lock:
+            if pending is None:
+                self._documents, self._slots, self._free_slots, self._postings = [], {}, [], {}
+                self._total_length = 0.0
+            else:
+                # Deleted datasets are no longer returned
+                for dataset_id in pending:
+                    self._remove(dataset_id)
+
+            for row in rows:
+                self._add(row)
+
+            INDEX_DOCUMENTS.set(len(self._slots))
+
+        INDEX_RELOADS.inc(scope="full" if pending is None else "partial")
+        logger.debug("Search index loaded %s datasets", len(rows))
+
+    def _requeue(self, dataset_ids: Optional[Set[str]]):
+        with self._pending_lock:
+            if dataset_ids is None:
+                self._pending = None
+            elif self._pending is not None:
+                self._pending.update(dataset_ids)
+
+    def rank(self, keywords: Sequence[Keyword], provenance_id: Optional[str]=None, after: Optional[Sequence]=None,
+             count: Optional[int]=20) -> List[Tuple[float, int, str]]:
+        """(score, has_source, dataset_id) of the best `count` datasets matching every keyword (every one of them when
+        count is None), best first and after the `after` key when given: the order and keyset of a PostgreSQL keyword
+        search. Keywords come from parse_keywords; those of stop words only are left out, as to_tsquery does."""
+        start = time.perf_counter()
+        keywords = [keyword for keyword in keywords if len(keyword) > 0]
+        phrases = [keyword for keyword in keywords if len(keyword) > 1]
+        terms = set(lexeme for keyword in keywords for _, lexeme in keyword)
+
+        with self._lock:
+            if len(terms) == 0 or len(self._slots) == 0:
+                return []
+
+            postings = []
+            for term in terms:
+                term_postings = self._postings.get(term)
+                if term_postings is None:
+                    return []
+                postings.append(term_postings)
+
+            # Intersect from the rarest term
+            postings.sort(key=len)
+            document_count = len(self._slots)
+            average_length = self._total_length / document_count
+            idfs = [math.log(1 + (document_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                    for term_postings in postings]
+
+            after_key = (float(after[0]), int(after[1]), str(after[2])) if after is not None else None
+            ranked = []
+            for slot in postings[0]:
+                if not all(slot in term_postings for term_postings in postings[1:]):
+                    continue
+
+                document = self._documents[slot]
+                if provenance_id is not None and document.provenance_id != provenance_id:
+                    continue
+                if not all(document.contains_phrase(phrase) for phrase in phrases):
+                    continue
+
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * document.length / average_length)
+                score = 0.0
+                for idf, term_postings in zip(idfs, postings):
+                    frequency = term_postings[slot]
+                    score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+                key = (score, document.has_source, document.dataset_id)
+                if after_key is None or key < after_key:
+                    ranked.append(key)
+
+        result = heapq.nlargest(count, ranked) if count is not None else sorted(ranked, reverse=True)
+        INDEX_QUERY_DURATION.observe(time.perf_counter() - start)
+        return result
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """Index of this process, current with the change feed; None when searches are ranked by PostgreSQL, or while
+    the index cannot be brought up to date"""
+    global _index
+    if Settings.get_instance().search.engine != "memory":
+        return None
+
+    from dcat_service import change_feed
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = SearchIndex()
+                change_feed.subscribe(index.invalidate)
+                _index = index
+
+    try:
+        change_feed.poll()
+        _index.refresh()
+    except Exception:
+        logger.warning("Could not bring the search index up to date; searching in the database", exc_info=True)
+        return None
+
+    return _index
@@ -1,40 +1,270 @@
 import os
-from dotenv import load_dotenv
+from typing import *
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-load_dotenv(dotenv_path)
+_env_loaded = False
+
+
+def load_env():
+    """Read .env into the environment once, when the first settings are built rather than at import"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path)
+        _env_loaded = True
+
+
+class PoolSettings:
+
+    def __init__(self, size: int=5, max_overflow: int=10, timeout: float=30, recycle: int=1800,
+                 pre_ping: bool=True, external_pooler: bool=False):
+        # Every worker process holds up to size + max_overflow connections per engine (primary and each replica)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        # Behind PgBouncer (transaction pooling) or a similar pooler: no client-side pool, no server-side prepared
+        # statements
+        self.external_pooler = external_pooler
+
+    @staticmethod
+    def from_env() -> 'PoolSettings':
+        load_env()
+        return PoolSettings(
+            size=int(os.environ.get("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.environ.get("DB_POOL_MAX_OVERFLOW", "10")),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+            recycle=int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+            pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() not in ("0", "false", "no"),
+            external_pooler=os.environ.get("DB_EXTERNAL_POOLER", "false").lower() in ("1", "true", "yes")
+        )
 
 
 class DBSettings:
 
-    def __init__(self, host: str, port: str, user: str, password: str, db_name: str):
+    def __init__(self, host: str, port: str, user: str, password: str, db_name: str,
+                 async_pool_min_size: int=2, async_pool_max_size: int=20, replicas: List[Tuple[str, str]]=None,
+                 replica_max_lag_seconds: float=30, replica_lag_check_interval: float=5, pool: PoolSettings=None):
         self.host = host
         self.port = port
         self.db_name = db_name
         self.user = user
         self.password = password
+        # asyncpg pool of the async entry point (one per worker process)
+        self.async_pool_min_size = async_pool_min_size
+        self.async_pool_max_size = async_pool_max_size
+        # (host, port) of read replicas; they share the primary's credentials and database name
+        self.replicas = replicas or []
+        self.replica_max_lag_seconds = replica_max_lag_seconds
+        self.replica_lag_check_interval = replica_lag_check_interval
+        self.pool = pool or PoolSettings()
 
     @staticmethod
     def from_env() -> 'DBSettings':
+        """DB_REPLICA_HOSTS is a comma separated list of <host>[:<port>]; the port defaults to DB_PORT"""
+        load_env()
+        replicas = []
+        for replica in os.environ.get("DB_REPLICA_HOSTS", "").split(","):
+            if replica.strip():
+                host, _, port = replica.strip().partition(":")
+                replicas.append((host, port or os.environ["DB_PORT"]))
+
         return DBSettings(
             os.environ["DB_HOST"],
             os.environ["DB_PORT"],
             os.environ["DB_USERNAME"],
             os.environ["DB_PASSWORD"],
-            os.environ["DB_NAME"]
+            os.environ["DB_NAME"],
+            async_pool_min_size=int(os.environ.get("ASYNC_DB_POOL_MIN_SIZE", "2")),
+            async_pool_max_size=int(os.environ.get("ASYNC_DB_POOL_MAX_SIZE", "20")),
+            replicas=replicas,
+            replica_max_lag_seconds=float(os.environ.get("DB_REPLICA_MAX_LAG_SECONDS", "30")),
+            replica_lag_check_interval=float(os.environ.get("DB_REPLICA_LAG_CHECK_INTERVAL", "5")),
+            pool=PoolSettings.from_env()
+        )
+
+
+class LoggingSettings:
+
+    def __init__(self, level: str="INFO", sample_rates: Dict[str, float]=None, default_sample_rate: float=1.0,
+                 max_payload_chars: int=512, queue_size: int=10000, use_queue: bool=True):
+        self.level = level.upper()
+        self.sample_rates = sample_rates or {}
+        self.default_sample_rate = default_sample_rate
+        self.max_payload_chars = max_payload_chars
+        self.queue_size = queue_size
+        self.use_queue = use_queue
+
+    @staticmethod
+    def from_env() -> 'LoggingSettings':
+        """LOG_SAMPLE_RATES is a comma separated list of <path>=<rate>, e.g. '/datasets/search_v2=0.1'"""
+        load_env()
+        sample_rates = {}
+        for entry in os.environ.get("LOG_SAMPLE_RATES", "").split(","):
+            if "=" in entry:
+                path, rate = entry.rsplit("=", 1)
+                sample_rates[path.strip()] = float(rate)
+
+        return LoggingSettings(
+            level=os.environ.get("LOG_LEVEL", "INFO"),
+            sample_rates=sample_rates,
+            default_sample_rate=float(os.environ.get("LOG_DEFAULT_SAMPLE_RATE", "1.0")),
+            max_payload_chars=int(os.environ.get("LOG_MAX_PAYLOAD_CHARS", "512")),
+            queue_size=int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+            use_queue=os.environ.get("LOG_ASYNC", "true").lower() not in ("0", "false", "no")
+        )
+
+
+class ProfilingSettings:
+
+    def __init__(self, enabled: bool=True, slow_query_ms: float=200, slow_query_log_size: int=100,
+                 explain_threshold_ms: Optional[float]=None):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log_size = slow_query_log_size
+        # EXPLAIN (ANALYZE, BUFFERS) re-runs the statement, so plan capture is off unless a threshold is set
+        self.explain_threshold_ms = explain_threshold_ms
+
+    @staticmethod
+    def from_env() -> 'ProfilingSettings':
+        load_env()
+        explain_threshold_ms = os.environ.get("SQL_EXPLAIN_THRESHOLD_MS")
+        return ProfilingSettings(
+            enabled=os.environ.get("SQL_PROFILING", "true").lower() not in ("0", "false", "no"),
+            slow_query_ms=float(os.environ.get("SQL_SLOW_QUERY_MS", "200")),
+            slow_query_log_size=int(os.environ.get("SQL_SLOW_QUERY_LOG_SIZE", "100")),
+            explain_threshold_ms=float(explain_threshold_ms) if explain_threshold_ms else None
+        )
+
+
+class AdminSettings:
+
+    def __init__(self, api_key: Optional[str]=None):
+        # Admin endpoints are disabled when no key is configured
+        self.api_key = api_key
+
+    @staticmethod
+    def from_env() -> 'AdminSettings':
+        load_env()
+        return AdminSettings(os.environ.get("ADMIN_API_KEY") or None)
+
+
+class CacheSettings:
+
+    def __init__(self, enabled: bool=True, max_entries: int=1024, ttl: float=300, coordinate_precision: int=6,
+                 change_poll_interval: float=1.0, change_overlap_seconds: float=120,
+                 change_retention_hours: float=24):
+        # In-process cache of the results of cacheable routes, per worker process
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Decimals GeoJSON coordinates are rounded to in cache keys
+        self.coordinate_precision = coordinate_precision
+        # Catalog changes made by other processes are read from the events table at most this often
+        self.change_poll_interval = change_poll_interval
+        # Changes are re-read for this long after their timestamp, which is taken before the writing transaction
+        # commits
+        self.change_overlap_seconds = change_overlap_seconds
+        self.change_retention_hours = change_retention_hours
+
+    @staticmethod
+    def from_env() -> 'CacheSettings':
+        load_env()
+        return CacheSettings(
+            enabled=os.environ.get("RESULT_CACHE", "true").lower() not in ("0", "false", "no"),
+            max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024")),
+            ttl=float(os.environ.get("RESULT_CACHE_TTL", "300")),
+            coordinate_precision=int(os.environ.get("RESULT_CACHE_COORDINATE_PRECISION", "6")),
+            change_poll_interval=float(os.environ.get("CHANGE_FEED_POLL_INTERVAL", "1.0")),
+            change_overlap_seconds=float(os.environ.get("CHANGE_FEED_OVERLAP_SECONDS", "120")),
+            change_retention_hours=float(os.environ.get("CHANGE_FEED_RETENTION_HOURS", "24"))
+        )
+
+
+class SearchSettings:
+
+    def __init__(self, candidate_budget: int=0, max_candidate_budget: int=20000, engine: str="postgres"):
+        # Ranks keyword searches: "postgres" (full-text search in the database) or "memory" (in-process index)
+        self.engine = engine
+        # Keyword searches rank at most this many matches (two-phase ranking); 0 ranks every match
+        self.candidate_budget = candidate_budget
+        # Largest 'candidate_budget' a request may ask for
+        self.max_candidate_budget = max_candidate_budget
+
+    @staticmethod
+    def from_env() -> 'SearchSettings':
+        load_env()
+        return SearchSettings(
+            candidate_budget=int(os.environ.get("SEARCH_CANDIDATE_BUDGET", "0")),
+            max_candidate_budget=int(os.environ.get("SEARCH_MAX_CANDIDATE_BUDGET", "20000")),
+            engine=os.environ.get("SEARCH_ENGINE", "postgres").lower()
+        )
+
+
+class GeometrySettings:
+
+    def __init__(self, simplify_tolerance: float=0.0001, cache_size: int=256):
+        # Query geometries are simplified to this tolerance, in degrees; 0 keeps every vertex
+        self.simplify_tolerance = simplify_tolerance
+        # Parsed query geometries kept per worker, by hash of the GeoJSON sent
+        self.cache_size = cache_size
+
+    @staticmethod
+    def from_env() -> 'GeometrySettings':
+        load_env()
+        return GeometrySettings(
+            simplify_tolerance=float(os.environ.get("QUERY_GEOMETRY_SIMPLIFY_TOLERANCE", "0.0001")),
+            cache_size=int(os.environ.get("QUERY_GEOMETRY_CACHE_SIZE", "256"))
+        )
+
+
+class TileSettings:
+
+    def __init__(self, cache_max_entries: int=512, cache_ttl: float=600, max_features: int=10000,
+                 resource_detail_zoom: int=10):
+        # Vector tiles kept per worker, invalidated by the catalog change feed like cached results; 0 disables
+        self.cache_max_entries = cache_max_entries
+        self.cache_ttl = cache_ttl
+        # Features of a layer encoded in one tile
+        self.max_features = max_features
+        # Below this zoom level, resource tiles carry resource counts per grid cell rather than resource coverage
+        self.resource_detail_zoom = resource_detail_zoom
+
+    @staticmethod
+    def from_env() -> 'TileSettings':
+        load_env()
+        return TileSettings(
+            cache_max_entries=int(os.environ.get("TILE_CACHE_MAX_ENTRIES", "512")),
+            cache_ttl=float(os.environ.get("TILE_CACHE_TTL", "600")),
+            max_features=int(os.environ.get("TILE_MAX_FEATURES", "10000")),
+            resource_detail_zoom=int(os.environ.get("TILE_RESOURCE_DETAIL_ZOOM", "10"))
         )
 
 
 class Settings:
     instance = None
 
-    def __init__(self, database: DBSettings):
+    def __init__(self, database: DBSettings, logging: 'LoggingSettings'=None, profiling: ProfilingSettings=None,
+                 admin: AdminSettings=None, cache: CacheSettings=None, search: SearchSettings=None,
+                 geometry: GeometrySettings=None, tiles: TileSettings=None):
         self.database = database
+        self.logging = logging or LoggingSettings.from_env()
+        self.profiling = profiling or ProfilingSettings.from_env()
+        self.admin = admin or AdminSettings.from_env()
+        self.cache = cache or CacheSettings.from_env()
+        self.search = search or SearchSettings.from_env()
+        self.geometry = geometry or GeometrySettings.from_env()
+        self.tiles = tiles or TileSettings.from_env()
 
     @staticmethod
     def get_instance() -> 'Settings':
         if Settings.instance is None:
-            Settings.instance = Settings(DBSettings.from_env())
+            Settings.instance = Settings(DBSettings.from_env(), LoggingSettings.from_env(),
+                                         ProfilingSettings.from_env(), AdminSettings.from_env(),
+                                         CacheSettings.from_env(), SearchSettings.from_env(),
+                                         GeometrySettings.from_env(), TileSettings.from_env())
 
         return Settings.instance
 
@@ -0,0 +1,81 @@
+"""Production server configuration: `gunicorn --config gunicorn.conf.py app:app`
+
+Runs pre-forked worker processes with a thread pool each. Send HUP to the master to gracefully replace the workers
+(and pick up code changes), TERM for a graceful shutdown that lets in-flight requests finish within graceful_timeout.
+"""
+import glob
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:7000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# Use aiohttp.GunicornWebWorker with async_app:app for the asyncio entry point; threads then do not apply
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers periodically so slow leaks cannot accumulate; jitter keeps them from restarting together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+# Importing the app in the master shares its memory with the workers, but HUP then no longer reloads code
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+# Each worker keeps its own metrics; they are written to this directory so that /metrics, served by any worker, reports
+# the sum over all workers, including those already recycled. Created (and removed on exit) by the master when unset.
+metrics_dir = os.environ.get("METRICS_MULTIPROC_DIR") or None
+_created_metrics_dir = None
+
+
+def on_starting(server):
+    global metrics_dir, _created_metrics_dir
+    if metrics_dir is None:
+        metrics_dir = _created_metrics_dir = tempfile.mkdtemp(prefix="dcat-metrics-")
+    else:
+        # Snapshots of a previous run would be counted again
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+            os.remove(path)
+
+
+def on_exit(server):
+    if _created_metrics_dir is not None:
+        shutil.rmtree(_created_metrics_dir, ignore_errors=True)
+
+
+def _dispose_engine():
+    # Nothing to dispose until a request has imported the database module; importing it here would undo lazy loading
+    database = sys.modules.get("dcat_service.database")
+    if database is not None:
+        database.dispose_engine()
+
+
+def post_fork(server, worker):
+    from dcat_service.misc.metrics import registry
+    # Drop any engine created before fork; the worker lazily creates its own on first use
+    _dispose_engine()
+    registry.enable_multiprocess(metrics_dir)
+
+
+def worker_exit(server, worker):
+    from dcat_service.misc.logger import shutdown_logging
+    from dcat_service.misc.metrics import registry
+    _dispose_engine()
+    registry.shutdown()
+    shutdown_logging()
+
+
+def child_exit(server, worker):
+    # Runs in the master however the worker exited, including when it was killed on timeout
+    from dcat_service.misc.metrics import mark_process_dead
+    mark_process_dead(metrics_dir, worker.pid)
@@ -0,0 +1,93 @@
+"""Cold start benchmark: import time per module of an entry point, measured in fresh interpreters.
+
+    python startup_benchmark.py                                  # dcat_service.handler
+    python startup_benchmark.py --module app --top 40
+    python startup_benchmark.py --request /datasets/search_v2    # plus the first request, which loads its controller
+
+Run it from the api directory with the DB_* variables set (or a dcat_service/.env); the first request does not need
+a reachable database, its time up to the failed connection attempt is reported.
+"""
+from typing import *
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REQUEST_SNIPPET = """
+import time, ujson
+from dcat_service.handler import request_handler
+start = time.perf_counter()
+request_handler({{'path': {path!r}, 'httpMethod': 'POST', 'body': ujson.dumps({body}), 'headers': {{}}}}, None)
+print('first_request_ms', (time.perf_counter() - start) * 1000)
+"""
+
+
+def run_once(module: str, request_path: Optional[str], body: str) -> Tuple[Dict[str, Tuple[int, int]], Optional[float]]:
+    """Import the module in a fresh interpreter; returns {module: (self_us, cumulative_us)} and the first request
+    time in ms"""
+    code = f"import {module}"
+    if request_path is not None:
+        code += "\n" + REQUEST_SNIPPET.format(path=request_path, body=body)
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True, cwd=os.path.dirname(__file__) or ".")
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{process.stderr[-2000:]}")
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    first_request_ms = None
+    for line in process.stdout.splitlines():
+        if line.startswith("first_request_ms"):
+            first_request_ms = float(line.split()[1])
+
+    return timings, first_request_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time per module of a dcat_service entry point")
+    parser.add_argument("--module", default="dcat_service.handler", help="module to import (default %(default)s)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to take the median over")
+    parser.add_argument("--top", type=int, default=25, help="modules to list, by cumulative import time")
+    parser.add_argument("--prefix", default=None, help="only list modules starting with this prefix")
+    parser.add_argument("--request", dest="request_path", default=None,
+                        help="also time the first request to this path, which imports its controller")
+    parser.add_argument("--body", default="{}", help="JSON body of that request (default %(default)s)")
+    args = parser.parse_args()
+
+    runs = [run_once(args.module, args.request_path, args.body) for _ in range(args.runs)]
+
+    modules = set()
+    for timings, _ in runs:
+        modules.update(timings)
+
+    rows = []
+    for name in modules:
+        samples = [timings[name] for timings, _ in runs if name in timings]
+        rows.append((name, statistics.median(s[0] for s in samples), statistics.median(s[1] for s in samples)))
+
+    if args.prefix:
+        rows = [row for row in rows if row[0].startswith(args.prefix)]
+    rows.sort(key=lambda row: row[2], reverse=True)
+
+    print(f"{'module':<60} {'self ms':>10} {'cumulative ms':>14}")
+    for name, self_us, cumulative_us in rows[:args.top]:
+        print(f"{name:<60} {self_us / 1000:>10.1f} {cumulative_us / 1000:>14.1f}")
+
+    total = [timings.get(args.module, (0, 0))[1] for timings, _ in runs]
+    print(f"\nimport {args.module}: median {statistics.median(total) / 1000:.1f} ms over {args.runs} runs")
+
+    first_requests = [first_request_ms for _, first_request_ms in runs if first_request_ms is not None]
+    if first_requests:
+        print(f"first request to {args.request_path}: median {statistics.median(first_requests):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
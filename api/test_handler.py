@@ -991,6 +991,608 @@ def _test_get_dataset_temporal_coverage():
     print(res)
 
 
+
+def _test_tiles_resource_cells():
+    """A resource covering far more than a tile has only coarse grid cells; tiles deeper than them still count it"""
+    import math
+    from dcat_service.controllers.tile_controllers import quadkey
+
+    api_key = "mint-data-catalog:2bc0308c-ed42-4d05-b1ab-9f0a9f5caac7:30124599-a1d3-48af-a5e1-798446f83662"
+    headers = {
+        "X-Api-Key": api_key
+    }
+
+    dataset_record_id = "4e8ade31-7729-4891-a462-2dac66158512"
+    _test_register_datasets()
+
+    resource_definitions = [{
+        "record_id": "3c5b7a0e-8d0b-4f0e-9a51-6f4f1c1f2a7d",
+        "dataset_id": dataset_record_id,
+        "provenance_id": "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11",
+        "variable_ids": [],
+        "name": "country-sized file",
+        "resource_type": "netcdf",
+        "data_url": "www.data_url_3.com",
+        "metadata": {
+            "spatial_coverage": {
+                "type": "BoundingBox",
+                "value": {"xmin": -20, "ymin": 30, "xmax": 20, "ymax": 60}
+            }
+        },
+        "layout": {}
+    }]
+
+    event = {
+        "path": "/datasets/register_resources",
+        "headers": headers,
+        "httpMethod": "POST",
+        "body": ujson.dumps({"resources": resource_definitions})
+    }
+    print(test_api(event=event, context={}))
+
+    # Tile of zoom 7 containing (0, 45), well inside the resource: its grid cells are of zoom 5 at most
+    z = 7
+    x = int((0 + 180) / 360 * (1 << z))
+    y = int((1 - math.log(math.tan(math.radians(45)) + 1 / math.cos(math.radians(45))) / math.pi) / 2 * (1 << z))
+
+    resp = requests.get(f"http://localhost:7000/tiles/{z}/{x}/{y}", params={"dataset_id": dataset_record_id})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    # A tile without features is empty
+    assert len(resp.content) > 0
+
+    try:
+        import mapbox_vector_tile
+    except ImportError:
+        print("mapbox_vector_tile is not installed; not decoding the tile")
+        return
+
+    features = mapbox_vector_tile.decode(resp.content)["resource_cells"]["features"]
+    print(features)
+    # Counted in the point of the whole tile
+    assert any(feature["properties"]["cell"] == quadkey(z, x, y) and feature["properties"]["resource_count"] >= 1
+               for feature in features)
+
+
+def _cached_keys(cache, keys):
+    return sorted(key for key in keys if cache.get(key)[0])
+
+
+def _test_result_cache_invalidation():
+    """Which cached results a catalog change drops: results about one dataset when that dataset changes, searches when
+    a dataset they returned changes or when the change can alter what matches, facets and histograms on any change"""
+    from dcat_service.change_feed import CatalogChange
+    from dcat_service.result_cache import ResultCache, _store
+
+    keys = ("dataset_info", "search", "other_search", "facets")
+
+    def cache_with_entries():
+        cache = ResultCache(100, 3600)
+        generation = cache.generation
+        _store(cache, "dataset_info", {"dataset_id": "d1"}, {"dataset": {"dataset_id": "d1"}}, generation)
+        _store(cache, "search", {"search_query": ["rain"]}, [{"dataset_id": "d1"}, {"dataset_id": "d2"}], generation)
+        _store(cache, "other_search", {"search_query": ["soil"]}, [{"dataset_id": "d3"}], generation)
+        _store(cache, "facets", {"search_query": ["rain"], "facets": True},
+               {"datasets": [{"dataset_id": "d3"}], "facets": {"provenance": []}}, generation)
+        assert _cached_keys(cache, keys) == sorted(keys)
+        return cache
+
+    # The content of d2 changed: the search that returned it, and the facets
+    cache = cache_with_entries()
+    cache.invalidate(CatalogChange("1", frozenset(["d2"]), membership=False))
+    assert _cached_keys(cache, keys) == ["dataset_info", "other_search"], _cached_keys(cache, keys)
+
+    # The content of d1 changed: its own entry too
+    cache = cache_with_entries()
+    cache.invalidate(CatalogChange("2", frozenset(["d1"]), membership=False))
+    assert _cached_keys(cache, keys) == ["other_search"], _cached_keys(cache, keys)
+
+    # A new dataset may match any search, but not change what is known of d1
+    cache = cache_with_entries()
+    cache.invalidate(CatalogChange("3", frozenset(["d4"]), membership=True))
+    assert _cached_keys(cache, keys) == ["dataset_info"], _cached_keys(cache, keys)
+
+    # A sync may change every dataset
+    cache = cache_with_entries()
+    cache.invalidate(CatalogChange("4", None, membership=True))
+    assert _cached_keys(cache, keys) == [], _cached_keys(cache, keys)
+
+
+def _test_result_cache_generation():
+    """A result computed while a change came in may predate it, and is not stored"""
+    from dcat_service.change_feed import CatalogChange
+    from dcat_service.result_cache import ResultCache, _store
+
+    cache = ResultCache(100, 3600)
+    generation = cache.generation
+    cache.invalidate(CatalogChange("1", frozenset(["d9"]), membership=False))
+    _store(cache, "search", {"search_query": ["rain"]}, [{"dataset_id": "d1"}], generation)
+    assert cache.get("search") == (False, None)
+
+    generation = cache.generation
+    cache.clear()
+    _store(cache, "search", {"search_query": ["rain"]}, [{"dataset_id": "d1"}], generation)
+    assert cache.get("search") == (False, None)
+
+    _store(cache, "search", {"search_query": ["rain"]}, [{"dataset_id": "d1"}], cache.generation)
+    assert cache.get("search") == (True, [{"dataset_id": "d1"}])
+
+
+def _test_change_feed_overlap():
+    """Changes are read again for the overlap window after the newest one seen, and published once: a change whose
+    transaction committed after a newer one was read is still published, one published locally is not again"""
+    import contextlib
+    from datetime import datetime, timedelta
+    import dcat_service
+    from dcat_service import change_feed
+
+    overlap = 5.0
+    now = datetime(2021, 1, 19, 12, 0, 0)
+    polls = [
+        [("c1", now, {"dataset_ids": ["d1"], "membership": False})],
+        [("c1", now, {"dataset_ids": ["d1"], "membership": False}),
+         ("c2", now - timedelta(seconds=1), {"dataset_ids": ["d2"], "membership": True}),
+         ("c3", now + timedelta(seconds=1), {"dataset_ids": None})],
+        [("c3", now + timedelta(seconds=1), {"dataset_ids": None})]
+    ]
+    since = []
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def fetchall(self):
+            return self.rows
+
+    class Session:
+        def execute(self, statement, params):
+            since.append(params["since"])
+            return Result(polls.pop(0))
+
+    @contextlib.contextmanager
+    def session_scope(read_only=False):
+        yield Session()
+
+    published = []
+    reader = change_feed._ChangeFeedReader()
+    change_feed.subscribe(published.append)
+    dcat_service.session_scope = session_scope
+    try:
+        reader._poll(overlap)
+        # c3 was committed by this process
+        reader.mark_seen("c3")
+        reader._poll(overlap)
+        reader._poll(overlap)
+    finally:
+        del dcat_service.session_scope
+        change_feed._subscribers.remove(published.append)
+
+    assert [change.change_id for change in published] == ["c1", "c2"], published
+    assert published[0].dataset_ids == frozenset(["d1"]) and not published[0].membership
+    assert since == [None, now - timedelta(seconds=overlap), now + timedelta(seconds=1 - overlap)], since
+
+
+def _test_record_change_drops_cached_results():
+    """A change recorded in a transaction reaches the cache of this process when the transaction commits"""
+    from dcat_service import session_scope, change_feed
+    from dcat_service.result_cache import ResultCache, _store
+
+    dataset_id = "4e8ade31-7729-4891-a462-2dac66158512"
+    cache = ResultCache(100, 3600)
+    change_feed.subscribe(cache.invalidate)
+    try:
+        generation = cache.generation
+        _store(cache, "dataset_info", {"dataset_id": dataset_id}, {"dataset": {"dataset_id": dataset_id}}, generation)
+        _store(cache, "other_dataset_info", {"dataset_id": "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11"}, {}, generation)
+
+        with session_scope() as session:
+            change_feed.record_change(session, dataset_ids=[dataset_id], membership=False)
+            # Not before the commit
+            assert cache.get("dataset_info")[0]
+
+        assert _cached_keys(cache, ("dataset_info", "other_dataset_info")) == ["other_dataset_info"]
+    finally:
+        change_feed._subscribers.remove(cache.invalidate)
+
+
+def _search_document(dataset_id, lexemes, provenance_id="p1", has_source=True):
+    """Row of the search index load query; lexemes: lexeme -> (positions, labels)"""
+    return {
+        "id": dataset_id,
+        "provenance_id": provenance_id,
+        "has_source": has_source,
+        "lexemes": list(lexemes),
+        "positions": [",".join(str(position) for position in positions) for positions, _ in lexemes.values()],
+        "weights": [labels for _, labels in lexemes.values()]
+    }
+
+
+def _search_index(*rows):
+    from dcat_service.search_index import SearchIndex
+
+    index = SearchIndex()
+    for row in rows:
+        index._add(row)
+    return index
+
+
+def _test_search_index_rank():
+    """Datasets matching every keyword, by score, then with a source first, then by id, as PostgreSQL orders them"""
+    index = _search_index(
+        _search_document("d1", {"rain": ([1], "A"), "fall": ([5], "D")}),
+        _search_document("d2", {"rain": ([3], "D"), "soil": ([1], "A")}),
+        _search_document("d3", {"soil": ([1], "A")}),
+        _search_document("d4", {"rain": ([1], "D"), "fall": ([2], "D")}, provenance_id="p2"),
+        _search_document("d5", {"rain": ([1], "D"), "fall": ([3], "D")}, has_source=False))
+    rain, fall, soil = ((0, "rain"),), ((0, "fall"),), ((0, "soil"),)
+
+    ranked = index.rank([rain])
+    assert [dataset_id for _, _, dataset_id in ranked] == ["d1", "d4", "d5", "d2"], ranked
+    assert [score for score, _, _ in ranked] == sorted((score for score, _, _ in ranked), reverse=True)
+    # d4 and d5 score the same; d4 has a source
+    assert ranked[1][0] == ranked[2][0] and ranked[1][1] == 1 and ranked[2][1] == 0
+
+    assert [key[2] for key in index.rank([rain, soil])] == ["d2"]
+    assert [key[2] for key in index.rank([rain], provenance_id="p2")] == ["d4"]
+    assert [key[2] for key in index.rank([rain], count=2)] == ["d1", "d4"]
+    assert index.rank([((0, "snow"),)]) == []
+    assert index.rank([rain, ((0, "snow"),)]) == []
+
+    # Keywords of stop words only are left out
+    assert index.rank([rain, ()]) == ranked
+    assert index.rank([()]) == []
+
+    # "rain fall" is a phrase, "rain of fall" one with a stop word between
+    assert [key[2] for key in index.rank([((0, "rain"), (1, "fall"))])] == ["d4"]
+    assert [key[2] for key in index.rank([((0, "rain"), (2, "fall"))])] == ["d5"]
+    assert sorted(key[2] for key in index.rank([rain, fall])) == ["d1", "d4", "d5"]
+
+
+def _test_search_index_after():
+    """Pages after the key of the last result of the previous page follow on without duplicates or gaps"""
+    # Scores repeat, and their ties are broken by source and id
+    index = _search_index(*[
+        _search_document("d%02d" % number, {
+            "rain": ([1], "ABCD"[number % 4]),
+            "fall": (range(2, 3 + number % 3), "D" * (1 + number % 3))
+        }, has_source=number % 2 == 0)
+        for number in range(25)])
+    keyword = [((0, "rain"),)]
+
+    ranked = index.rank(keyword, count=None)
+    assert len(ranked) == 25
+
+    paged, after = [], None
+    while True:
+        page = index.rank(keyword, after=after, count=7)
+        if len(page) == 0:
+            break
+        paged.extend(page)
+        after = page[-1]
+
+    assert paged == ranked, paged
+
+
+def _test_search_index_slots():
+    """Removed datasets leave their slot to the next one added, and nothing of theirs in the postings"""
+    index = _search_index(
+        _search_document("d1", {"rain": ([1], "A")}),
+        _search_document("d2", {"soil": ([1], "A"), "moisture": ([2], "B")}),
+        _search_document("d3", {"rain": ([1], "D")}))
+    slot = index._slots["d2"]
+
+    index._remove("d2")
+    assert len(index) == 2 and "d2" not in index._slots
+    assert "soil" not in index._postings and "moisture" not in index._postings
+    assert index._total_length == 11.0
+    # Removing it again does nothing
+    index._remove("d2")
+    assert index._free_slots == [slot]
+
+    index._add(_search_document("d4", {"rain": ([1], "B")}))
+    assert index._slots["d4"] == slot and index._free_slots == [] and len(index._documents) == 3
+    assert index._postings["rain"] == {index._slots["d1"]: 10.0, index._slots["d3"]: 1.0, slot: 4.0}
+
+    # Adding a dataset again replaces it
+    index._add(_search_document("d1", {"snow": ([1], "A")}))
+    assert len(index) == 3 and len(index._documents) == 3
+    assert index._slots["d1"] not in index._postings["rain"]
+    assert index._total_length == 15.0
+    assert [key[2] for key in index.rank([((0, "rain"),)])] == ["d4", "d3"]
+
+    # A dataset whose search document is not computed yet is kept, but matches nothing
+    index._add({"id": "d5", "provenance_id": None, "has_source": False, "lexemes": None, "positions": None,
+                "weights": None})
+    assert len(index) == 4 and index.rank([((0, "snow"),)])[0][2] == "d1"
+
+
+def _test_search_index_refresh():
+    """The whole catalog is loaded on the first search and on changes of it, the changed datasets otherwise"""
+    import contextlib
+    import dcat_service
+    from dcat_service.change_feed import CatalogChange
+    from dcat_service.search_index import SearchIndex
+
+    catalog = {
+        "d1": _search_document("d1", {"rain": ([1], "A")}),
+        "d2": _search_document("d2", {"rain": ([1], "D")})
+    }
+    queries = []
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def fetchall(self):
+            return self.rows
+
+    class Session:
+        def execute(self, statement, params=None):
+            queries.append((str(statement), params))
+            if params is None:
+                return Result(list(catalog.values()))
+            return Result([catalog[dataset_id] for dataset_id in params["dataset_ids"] if dataset_id in catalog])
+
+    @contextlib.contextmanager
+    def session_scope(read_only=False):
+        yield Session()
+
+    index = SearchIndex()
+    dcat_service.session_scope = session_scope
+    try:
+        index.refresh()
+        assert len(queries) == 1 and queries[0][1] is None and "ANY" not in queries[0][0]
+        assert sorted(index._slots) == ["d1", "d2"]
+
+        # Nothing changed
+        index.refresh()
+        assert len(queries) == 1
+
+        # d2 deleted, d3 added
+        del catalog["d2"]
+        catalog["d3"] = _search_document("d3", {"rain": ([1], "B")})
+        index.invalidate(CatalogChange("c1", frozenset(["d2"]), membership=True))
+        index.invalidate(CatalogChange("c2", frozenset(["d3"]), membership=True))
+        index.refresh()
+        assert len(queries) == 2 and "ANY" in queries[1][0] and queries[1][1] == {"dataset_ids": ["d2", "d3"]}
+        assert sorted(index._slots) == ["d1", "d3"]
+        assert [key[2] for key in index.rank([((0, "rain"),)])] == ["d1", "d3"]
+
+        # The whole catalog changed
+        catalog["d1"] = _search_document("d1", {"soil": ([1], "A")})
+        index.invalidate(CatalogChange("c3", None, membership=True))
+        index.invalidate(CatalogChange("c4", frozenset(["d3"]), membership=False))
+        index.refresh()
+        assert len(queries) == 3 and queries[2][1] is None
+        assert sorted(index._slots) == ["d1", "d3"] and "soil" in index._postings
+        assert len(index._documents) == 2 and index._free_slots == []
+
+        # A failed load is repeated on the next search
+        failing = Session.execute
+        Session.execute = lambda self, statement, params=None: 1 / 0
+        index.invalidate(CatalogChange("c5", frozenset(["d1"]), membership=False))
+        try:
+            index.refresh()
+            assert False, "the load failed"
+        except ZeroDivisionError:
+            pass
+        Session.execute = failing
+        index.refresh()
+        assert len(queries) == 4 and queries[3][1] == {"dataset_ids": ["d1"]}
+    finally:
+        del dcat_service.session_scope
+
+
+def _test_page_cursor_round_trip():
+    """A cursor carries the key of the last row of a page to the next request with the same filters, and no other"""
+    from dcat_service.misc.cursor import Page
+    from dcat_service.misc.exception import BadRequestException
+
+    def page(query_definition, cursor=None):
+        return Page.from_query_definition("search_datasets_v2", {**query_definition, "cursor": cursor}, 500, 3,
+                                          presentation_fields=("facets", "facet_limit"))
+
+    query = {"search_query": ["rain"], "provenance_id": "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11", "limit": 2}
+    first = page(query)
+    assert first.after is None and first.requested and first.limit == 2
+
+    first.ranking = "memory"
+    cursor = first.next_cursor([(0.5, 1, "d1"), (0.25, 0, "d2")], lambda row: row)
+    second = page(query, cursor)
+    assert second.after == [0.25, 0, "d2"] and second.ranking == "memory"
+    # Presentation fields are not filters
+    assert page({**query, "facets": True, "limit": 5}, cursor).after == [0.25, 0, "d2"]
+    # A short page is the last one
+    assert second.next_cursor([(0.125, 1, "d3")], lambda row: row) is None
+
+    for query_definition, cursor, message in [
+        ({**query, "search_query": ["snow"]}, cursor, "Cursor was issued for a different query"),
+        ({**query, "temporal_coverage": {"start_time": "2000-01-01T00:00:00"}}, cursor,
+         "Cursor was issued for a different query"),
+        (query, cursor[:-4], "Invalid cursor"),
+        (query, "not a cursor", "Invalid cursor"),
+        (query, Page("search_datasets_v2", first.fingerprint, 2, None, True).encode(["d2"]), "Invalid cursor"),
+        ({**query, "limit": 0}, None, "'limit' must be positive")
+    ]:
+        try:
+            page(query_definition, cursor)
+            assert False, f"{query_definition} with {cursor} was accepted"
+        except BadRequestException as e:
+            assert message in str(e), str(e)
+
+
+def _page_through(path: str, body: dict, limit: int) -> list:
+    """Datasets of every page of a request, following its cursors"""
+    headers = {'X-Api-Key': 'mint-data-catalog:2bc0308c-ed42-4d05-b1ab-9f0a9f5caac7:30124599-a1d3-48af-a5e1-798446f83662'}
+    datasets, cursor = [], None
+    while True:
+        event = {
+            'path': path,
+            'headers': headers,
+            'httpMethod': 'POST',
+            'body': ujson.dumps({**body, "limit": limit, "cursor": cursor})
+        }
+        res = test_api(event=event, context={})
+        assert res.get("error") is None, res
+        assert len(res["datasets"]) <= limit
+
+        datasets.extend(res["datasets"])
+        cursor = res["next_cursor"]
+        if cursor is None:
+            return datasets
+
+
+def _assert_pages_match(path: str, body: dict, limit: int):
+    """Paging through a request returns what a single page returns, without duplicates or gaps"""
+    everything = _page_through(path, body, 100000)
+    paged = _page_through(path, body, limit)
+
+    paged_ids = [dataset["dataset_id"] for dataset in paged]
+    assert len(paged_ids) == len(set(paged_ids)), f"duplicates in {paged_ids}"
+    assert paged_ids == [dataset["dataset_id"] for dataset in everything]
+    assert len(paged_ids) > limit, "page through more than one page"
+
+
+def _assert_bad_request(path: str, body: dict, message: str):
+    event = {
+        'path': path,
+        'headers': {'X-Api-Key': 'mint-data-catalog:2bc0308c-ed42-4d05-b1ab-9f0a9f5caac7:30124599-a1d3-48af-a5e1-798446f83662'},
+        'httpMethod': 'POST',
+        'body': ujson.dumps(body)
+    }
+    res = test_api(event=event, context={})
+    assert message in res.get("error", ""), res
+
+
+def _first_cursor(path: str, body: dict) -> str:
+    event = {
+        'path': path,
+        'headers': {'X-Api-Key': 'mint-data-catalog:2bc0308c-ed42-4d05-b1ab-9f0a9f5caac7:30124599-a1d3-48af-a5e1-798446f83662'},
+        'httpMethod': 'POST',
+        'body': ujson.dumps({**body, "cursor": None})
+    }
+    cursor = test_api(event=event, context={})["next_cursor"]
+    assert cursor is not None, "the first page is not the last one"
+    return cursor
+
+
+def _test_find_datasets_cursor():
+    path = '/find_datasets'
+    query = {"dataset_names__in": ["*"]}
+
+    _assert_pages_match(path, query, 3)
+
+    cursor = _first_cursor(path, {**query, "limit": 3})
+    _assert_bad_request(path, {**query, "limit": 3, "cursor": cursor, "offset": 3},
+                        "'offset' cannot be combined with 'cursor'")
+    _assert_bad_request(path, {"dataset_names__in": ["fldas"], "limit": 3, "cursor": cursor},
+                        "Cursor was issued for a different query")
+
+
+def _test_search_v2_cursor():
+    path = '/datasets/search_v2'
+
+    # Ranked by keywords, and in dataset order without them
+    _assert_pages_match(path, {"search_query": ["data"]}, 5)
+    _assert_pages_match(path, {"temporal_coverage": {"start_time": "2000-01-01T00:00:00",
+                                                     "end_time": "2010-12-31T23:59:59"}}, 5)
+
+    cursor = _first_cursor(path, {"search_query": ["data"], "limit": 5})
+    _assert_bad_request(path, {"search_query": ["fldas"], "limit": 5, "cursor": cursor},
+                        "Cursor was issued for a different query")
+
+
+def _test_query_geometry_validation():
+    from dcat_service.misc.exception import BadRequestException
+    from dcat_service.query_geometry import query_geometry
+
+    for value, message in [
+        ("POLYGON((0 0, 1 0, 1 1, 0 0))", "must be a GeoJSON object or [x_min, y_min, x_max, y_max]"),
+        ({"type": "Circle", "coordinates": [0, 0]}, "unsupported type Circle"),
+        ({"type": "Point", "coordinates": [181, 0]}, "position out of longitude/latitude range"),
+        ({"type": "Point", "coordinates": ["0", "0"]}, "positions must be arrays of [longitude, latitude]"),
+        ({"type": "LineString", "coordinates": [[0, 0], [0, 0]]}, "lines must have at least two distinct positions"),
+        ({"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 0], [0, 0]]]},
+         "polygon rings must have at least three distinct positions"),
+        ({"type": "Polygon", "coordinates": []}, "Polygon coordinates must be a non-empty array"),
+        ({"type": "FeatureCollection", "features": []}, "FeatureCollection must not be empty"),
+        ({"type": "Feature", "geometry": {"type": "Point", "coordinates": [0, -91]}},
+         "position out of longitude/latitude range"),
+        ([0, 0, 1], "bounding boxes must be [x_min, y_min, x_max, y_max]"),
+        ([0, 0, 1, True], "bounding boxes must be [x_min, y_min, x_max, y_max]"),
+        ([-10, 0, 10, 95], "position out of longitude/latitude range"),
+        ([10, 0, -10, 5], "bounding box minimums must not exceed its maximums")
+    ]:
+        # Twice: invalid geometries are not cached
+        for _ in range(2):
+            try:
+                query_geometry(value)
+                assert False, f"{value} was accepted"
+            except BadRequestException as e:
+                assert message in str(e) and "'spatial_coverage'" in str(e), str(e)
+
+    bbox = query_geometry([-10.5, -5, 10, 5.25])
+    assert bbox.bbox == (-10.5, -5, 10, 5.25) and bbox.vertices == 5
+    assert ujson.loads(bbox.geojson) == {"type": "Polygon", "coordinates": [
+        [[-10.5, -5], [10, -5], [10, 5.25], [-10.5, 5.25], [-10.5, -5]]]}
+
+    # Rings are closed, repeated vertices and altitudes dropped, Features and collections unwrapped
+    polygon = query_geometry({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {
+            "type": "Polygon", "coordinates": [[[0, 0, 100], [0, 0, 100], [2, 0, 100], [2, 2, 100], [0, 2, 100]]]}},
+        {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [-1, 3]}}
+    ]}, field="dataset_spatial_coverage")
+    assert ujson.loads(polygon.geojson) == {"type": "GeometryCollection", "geometries": [
+        {"type": "Polygon", "coordinates": [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]},
+        {"type": "Point", "coordinates": [-1, 3]}]}
+    assert polygon.bbox == (-1, 0, 2, 3) and polygon.vertices == 6
+
+
+def _test_query_geometry_simplification():
+    from dcat_service.query_geometry import _normalize, _simplify
+
+    line = [(0.0, 0.0), (1.0, 0.00005), (2.0, 0.0), (3.0, 0.01), (4.0, 0.0)]
+    # The vertex closer than the tolerance to the line through its neighbours goes, the farther one stays
+    assert _simplify(line, 0.0001, False) == [(0.0, 0.0), (2.0, 0.0), (3.0, 0.01), (4.0, 0.0)]
+    assert _simplify(line, 0.1, False) == [(0.0, 0.0), (4.0, 0.0)]
+    assert _simplify(line, 0, False) == line
+
+    # Rings keep at least four positions, or stay as sent
+    ring = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.0, 0.0)]
+    assert _simplify(ring, 0.0001, True) == ring
+    assert _simplify(ring, 10, True) == ring
+    assert _simplify(ring[:3], 10, False) == [(0.0, 0.0), (1.0, 1.0)]
+
+    square = {"type": "Polygon", "coordinates": [
+        [[0, 0], [0.5, 0.00001], [1, 0], [1, 0.5], [1, 1], [0, 1], [0, 0]],
+        [[0.25, 0.25], [0.5, 0.25], [0.5, 0.5], [0.25, 0.25]]]}
+    assert _normalize(square, "spatial_coverage", 0.0001)["coordinates"] == [
+        [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)],
+        [(0.25, 0.25), (0.5, 0.25), (0.5, 0.5), (0.25, 0.25)]]
+    assert len(_normalize(square, "spatial_coverage", 0)["coordinates"][0]) == 7
+
+
+def _test_query_geometry_cache():
+    from dcat_service.query_geometry import GEOMETRY_CACHE_LOOKUPS, query_geometry
+
+    def lookups(outcome):
+        return GEOMETRY_CACHE_LOOKUPS._values.get((outcome,), 0.0)
+
+    hits, misses = lookups("hit"), lookups("miss")
+    polygon = {"type": "Polygon", "coordinates": [[[-118.5, 33.5], [-117.5, 33.5], [-117.5, 34.5], [-118.5, 33.5]]]}
+
+    parsed = query_geometry(polygon)
+    assert (lookups("hit"), lookups("miss")) == (hits, misses + 1)
+
+    # The same value, whatever the order of its keys
+    assert query_geometry({"coordinates": polygon["coordinates"], "type": "Polygon"}) is parsed
+    assert query_geometry(polygon) is parsed
+    assert (lookups("hit"), lookups("miss")) == (hits + 2, misses + 1)
+
+    assert query_geometry([-118.5, 33.5, -117.5, 34.5]) is not parsed
+    assert (lookups("hit"), lookups("miss")) == (hits + 2, misses + 2)
+
+
 if __name__ == "__main__":
     _test_register_provenance()
     _test_register_standard_variables()
@@ -1030,3 +1632,22 @@ if __name__ == "__main__":
     # _test_cache_resources()
 
     # _test_get_dataset_temporal_coverage()
+    # _test_tiles_resource_cells()
+
+    # _test_result_cache_invalidation()
+    # _test_result_cache_generation()
+    # _test_change_feed_overlap()
+    # _test_record_change_drops_cached_results()
+
+    # _test_search_index_rank()
+    # _test_search_index_after()
+    # _test_search_index_slots()
+    # _test_search_index_refresh()
+
+    # _test_page_cursor_round_trip()
+    # _test_find_datasets_cursor()
+    # _test_search_v2_cursor()
+
+    # _test_query_geometry_validation()
+    # _test_query_geometry_simplification()
+    # _test_query_geometry_cache()
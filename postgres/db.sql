@@ -14,6 +14,7 @@ create extension if not exists postgis;
 create extension if not exists fuzzystrmatch;
 create extension if not exists postgis_tiger_geocoder;
 create extension if not exists postgis_topology;
+create extension if not exists pg_trgm;
 
 -- verify schema ownerships (alternative to psql's "\dn" command )
 select 
@@ -47,13 +48,13 @@ CREATE TABLE "public"."datasets" (
     "updated_at" timestamp NOT NULL DEFAULT now(),
     "id" uuid NOT NULL,
     "provenance_id" uuid,
-    "tsv" tsvector,
     "spatial_coverage" geometry,
     "temporal_coverage" tsrange,
     "temporal_coverage_start" timestamp,
     "temporal_coverage_end" timestamp,
     "variables_list" text,
-    "standard_variables_list" text
+    "standard_variables_list" text,
+    "has_source" boolean NOT NULL DEFAULT false
 );
 
 DROP TABLE IF EXISTS "public"."provenance";
@@ -138,7 +139,8 @@ CREATE TABLE "public"."temporal_coverage_index" (
     "indexed_type" varchar NOT NULL,
     "start_time" timestamp NOT NULL,
     "end_time" timestamp NOT NULL,
-    "indexed_id" uuid
+    "indexed_id" uuid,
+    "temporal_coverage" tsrange
 );
 
 DROP TABLE IF EXISTS "public"."variables";
@@ -161,6 +163,37 @@ CREATE TABLE "public"."variables_standard_variables" (
     "standard_variable_id" uuid
 );
 
+DROP TABLE IF EXISTS "public"."dataset_search_documents";
+-- Table Definition
+CREATE TABLE "public"."dataset_search_documents" (
+    "dataset_id" uuid NOT NULL,
+    "variables_text" text NOT NULL DEFAULT '',
+    "standard_variables_text" text NOT NULL DEFAULT '',
+    "tsv" tsvector,
+    "stale" boolean NOT NULL DEFAULT true,
+    "updated_at" timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY ("dataset_id")
+);
+
+DROP TABLE IF EXISTS "public"."events";
+-- Table Definition
+CREATE TABLE "public"."events" (
+    "id" uuid NOT NULL,
+    "timestamp" timestamp NOT NULL DEFAULT now(),
+    "event_type" varchar NOT NULL,
+    "event_value" jsonb,
+    PRIMARY KEY ("id")
+);
+
+DROP TABLE IF EXISTS "public"."spatial_grid_cells";
+-- Table Definition
+CREATE TABLE "public"."spatial_grid_cells" (
+    "indexed_type" varchar NOT NULL,
+    "indexed_id" uuid NOT NULL,
+    "cell" text NOT NULL,
+    PRIMARY KEY ("indexed_type", "indexed_id", "cell")
+);
+
 -- ALTER TABLE "public"."datasets" ADD FOREIGN KEY ("provenance_id") REFERENCES "public"."provenance"("id");
 -- ALTER TABLE "public"."resources" ADD FOREIGN KEY ("provenance_id") REFERENCES "public"."provenance"("id");
 -- ALTER TABLE "public"."resources" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id");
@@ -169,6 +202,7 @@ CREATE TABLE "public"."variables_standard_variables" (
 -- ALTER TABLE "public"."variables" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id");
 -- ALTER TABLE "public"."variables_standard_variables" ADD FOREIGN KEY ("variable_id") REFERENCES "public"."variables"("id");
 -- ALTER TABLE "public"."variables_standard_variables" ADD FOREIGN KEY ("standard_variable_id") REFERENCES "public"."standard_variables"("id");
+ALTER TABLE "public"."dataset_search_documents" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id") ON DELETE CASCADE;
 
 
 
@@ -185,6 +219,10 @@ CREATE UNIQUE INDEX provenance_id_key ON public.provenance USING btree (id);
 DROP INDEX IF EXISTS ix_datasets_name;
 CREATE INDEX ix_datasets_name ON public.datasets USING btree (name);
 
+-- ix_datasets_name_trgm
+DROP INDEX IF EXISTS ix_datasets_name_trgm;
+CREATE INDEX ix_datasets_name_trgm ON public.datasets USING gin (name gin_trgm_ops);
+
 -- ix_datasets_created_at
 DROP INDEX IF EXISTS ix_datasets_created_at;
 CREATE INDEX ix_datasets_created_at ON public.datasets USING btree (created_at);
@@ -201,25 +239,34 @@ CREATE INDEX datasets_tc_end_idx ON public.datasets USING btree (temporal_covera
 DROP INDEX IF EXISTS datasets_spatial_gix;
 CREATE INDEX datasets_spatial_gix ON public.datasets USING gist (spatial_coverage);
 
+-- datasets_temporal_coverage_gix
+DROP INDEX IF EXISTS datasets_temporal_coverage_gix;
+CREATE INDEX datasets_temporal_coverage_gix ON public.datasets USING gist (temporal_coverage);
+
+-- datasets_spatial_temporal_gix: filters on both the region and the period of datasets
+DROP INDEX IF EXISTS datasets_spatial_temporal_gix;
+CREATE INDEX datasets_spatial_temporal_gix ON public.datasets USING gist (spatial_coverage, temporal_coverage);
+
 -- datasets_id_key
 DROP INDEX IF EXISTS datasets_id_key;
 CREATE UNIQUE INDEX datasets_id_key ON public.datasets USING btree (id);
 
--- 'tsv_idx'
-DROP INDEX IF EXISTS tsv_idx;
-CREATE INDEX tsv_idx ON public.datasets USING gin (tsv);
-
 -- DROP trigger
 DROP TRIGGER IF EXISTS if_dist_exists ON public.datasets;
 
+-- Range of a temporal coverage, open-ended on the side of an unknown bound; NULL when both bounds are unknown or
+-- they are inverted
+CREATE OR REPLACE FUNCTION temporal_coverage_range(start_time timestamp, end_time timestamp) RETURNS tsrange AS $$
+  SELECT CASE WHEN start_time IS NULL AND end_time IS NULL THEN NULL
+              WHEN start_time > end_time THEN NULL
+              ELSE tsrange(start_time, end_time, '[]') END;
+$$ LANGUAGE sql IMMUTABLE;
+
 CREATE OR REPLACE FUNCTION datasets_tsv_trigger() RETURNS trigger AS $$
 begin
-  new.tsv :=
-     setweight(to_tsvector('pg_catalog.english', coalesce(new.name,'')), 'A') ||
-       setweight(to_tsvector('pg_catalog.english', coalesce(new.json_metadata->>'tags', '')), 'B') ||
-       setweight(to_tsvector('pg_catalog.english', coalesce(new.variables_list, '')), 'D') ||
-       setweight(to_tsvector('pg_catalog.english', coalesce(new.standard_variables_list, '')), 'C') ||
-     setweight(to_tsvector('pg_catalog.english', coalesce(new.description,'')), 'D');
+  -- ranks datasets with a source first among equally relevant ones, without reading json_metadata
+  new.has_source := new.json_metadata ? 'source';
+  new.temporal_coverage := temporal_coverage_range(new.temporal_coverage_start, new.temporal_coverage_end);
   return new;
 end
 $$ LANGUAGE plpgsql;
@@ -281,6 +328,10 @@ CREATE UNIQUE INDEX standard_variables_id_key ON public.standard_variables USING
 DROP INDEX IF EXISTS ix_standard_variables_name;
 CREATE INDEX ix_standard_variables_name ON public.standard_variables USING btree (name);
 
+-- ix_standard_variables_name_trgm
+DROP INDEX IF EXISTS ix_standard_variables_name_trgm;
+CREATE INDEX ix_standard_variables_name_trgm ON public.standard_variables USING gin (name gin_trgm_ops);
+
 -- ix_standard_variables_created_at
 DROP INDEX IF EXISTS ix_standard_variables_created_at;
 CREATE INDEX ix_standard_variables_created_at ON public.standard_variables USING btree (created_at);
@@ -288,6 +339,154 @@ CREATE INDEX ix_standard_variables_created_at ON public.standard_variables USING
 
 
 
+-- DATASET_SEARCH_DOCUMENTS
+-- Full-text document of every dataset: its name, tags and description with the names of its variables and standard
+-- variables. Triggers on the tables feeding a document mark it stale, and it is rebuilt when the transaction commits.
+-- dataset_search_documents_tsv_idx
+DROP INDEX IF EXISTS dataset_search_documents_tsv_idx;
+CREATE INDEX dataset_search_documents_tsv_idx ON public.dataset_search_documents USING gin (tsv);
+
+CREATE OR REPLACE FUNCTION dataset_search_document_tsv(name text, tags text, variables_text text,
+                                                       standard_variables_text text, description text)
+    RETURNS tsvector AS $$
+  SELECT
+     setweight(to_tsvector('pg_catalog.english', coalesce(name, '')), 'A') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(tags, '')), 'B') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(variables_text, '')), 'D') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(standard_variables_text, '')), 'C') ||
+     setweight(to_tsvector('pg_catalog.english', coalesce(description, '')), 'D');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Mark the document of a dataset stale; it is rebuilt once, when the transaction commits
+CREATE OR REPLACE FUNCTION mark_dataset_search_document(target uuid) RETURNS void AS $$
+begin
+  IF target IS NULL THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO dataset_search_documents (dataset_id, stale) VALUES (target, true)
+  ON CONFLICT (dataset_id) DO UPDATE SET stale = true WHERE NOT dataset_search_documents.stale;
+end
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_dataset_search_document() RETURNS trigger AS $$
+declare
+  document_variables text;
+  document_standard_variables text;
+begin
+  -- Every change of the transaction queued a refresh; the first one rebuilds the document
+  IF NOT EXISTS (SELECT 1 FROM dataset_search_documents WHERE dataset_id = new.dataset_id AND stale) THEN
+    RETURN NULL;
+  END IF;
+
+  SELECT string_agg(variables.name, ',' ORDER BY variables.name) INTO document_variables
+  FROM variables
+  WHERE variables.dataset_id = new.dataset_id;
+
+  SELECT string_agg(standard_variables.name, ',' ORDER BY standard_variables.name) INTO document_standard_variables
+  FROM variables
+  JOIN variables_standard_variables ON variables_standard_variables.variable_id = variables.id
+  JOIN standard_variables ON standard_variables.id = variables_standard_variables.standard_variable_id
+  WHERE variables.dataset_id = new.dataset_id;
+
+  UPDATE dataset_search_documents
+  SET variables_text = coalesce(document_variables, ''),
+      standard_variables_text = coalesce(document_standard_variables, ''),
+      tsv = dataset_search_document_tsv(datasets.name, datasets.json_metadata->>'tags', document_variables,
+                                        document_standard_variables, datasets.description),
+      stale = false,
+      updated_at = now()
+  FROM datasets
+  WHERE dataset_search_documents.dataset_id = new.dataset_id AND datasets.id = new.dataset_id;
+
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dataset_search_documents_refresh ON public.dataset_search_documents;
+CREATE CONSTRAINT TRIGGER dataset_search_documents_refresh AFTER INSERT OR UPDATE
+    ON dataset_search_documents DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW WHEN (new.stale) EXECUTE PROCEDURE refresh_dataset_search_document();
+
+CREATE OR REPLACE FUNCTION datasets_search_document_trigger() RETURNS trigger AS $$
+begin
+  PERFORM mark_dataset_search_document(new.id);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS datasets_search_document_insert ON public.datasets;
+CREATE TRIGGER datasets_search_document_insert AFTER INSERT
+    ON datasets FOR EACH ROW EXECUTE PROCEDURE datasets_search_document_trigger();
+
+-- Syncs rewrite json_metadata of every dataset; only a change of the indexed fields dirties a document
+DROP TRIGGER IF EXISTS datasets_search_document_update ON public.datasets;
+CREATE TRIGGER datasets_search_document_update AFTER UPDATE OF name, description, json_metadata
+    ON datasets FOR EACH ROW
+    WHEN (old.name IS DISTINCT FROM new.name OR old.description IS DISTINCT FROM new.description
+          OR old.json_metadata->'tags' IS DISTINCT FROM new.json_metadata->'tags')
+    EXECUTE PROCEDURE datasets_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM mark_dataset_search_document(old.dataset_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM mark_dataset_search_document(new.dataset_id);
+  END IF;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS variables_search_document ON public.variables;
+CREATE TRIGGER variables_search_document AFTER INSERT OR DELETE OR UPDATE OF name, dataset_id
+    ON variables FOR EACH ROW EXECUTE PROCEDURE variables_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION variables_standard_variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM mark_dataset_search_document((SELECT dataset_id FROM variables WHERE id = old.variable_id));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM mark_dataset_search_document((SELECT dataset_id FROM variables WHERE id = new.variable_id));
+  END IF;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS variables_standard_variables_search_document ON public.variables_standard_variables;
+CREATE TRIGGER variables_standard_variables_search_document AFTER INSERT OR DELETE OR UPDATE
+    ON variables_standard_variables FOR EACH ROW EXECUTE PROCEDURE variables_standard_variables_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION standard_variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  PERFORM mark_dataset_search_document(linked.dataset_id)
+  FROM (
+    SELECT DISTINCT variables.dataset_id
+    FROM variables_standard_variables
+    JOIN variables ON variables.id = variables_standard_variables.variable_id
+    WHERE variables_standard_variables.standard_variable_id = new.id
+  ) AS linked;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS standard_variables_search_document ON public.standard_variables;
+CREATE TRIGGER standard_variables_search_document AFTER UPDATE OF name
+    ON standard_variables FOR EACH ROW WHEN (old.name IS DISTINCT FROM new.name)
+    EXECUTE PROCEDURE standard_variables_search_document_trigger();
+
+
+
+
+-- EVENTS
+-- ix_events_event_type_timestamp: the catalog change feed reads recent events of one type
+DROP INDEX IF EXISTS ix_events_event_type_timestamp;
+CREATE INDEX ix_events_event_type_timestamp ON public.events USING btree (event_type, timestamp);
+
+
+
 -- TEMPORAL_COVERAGE_INDEX
 -- temporal_coverage_index_indexed_type_indexed_id_key
 DROP INDEX IF EXISTS temporal_coverage_index_indexed_type_indexed_id_key;
@@ -301,6 +500,20 @@ CREATE INDEX ix_temporal_coverage_index_start_time ON public.temporal_coverage_i
 DROP INDEX IF EXISTS ix_temporal_coverage_index_end_time;
 CREATE INDEX ix_temporal_coverage_index_end_time ON public.temporal_coverage_index USING btree (end_time);
 
+-- ix_temporal_coverage_index_temporal_coverage
+DROP INDEX IF EXISTS ix_temporal_coverage_index_temporal_coverage;
+CREATE INDEX ix_temporal_coverage_index_temporal_coverage ON public.temporal_coverage_index USING gist (temporal_coverage);
+
+CREATE OR REPLACE FUNCTION temporal_coverage_index_range_trigger() RETURNS trigger AS $$
+begin
+  new.temporal_coverage := temporal_coverage_range(new.start_time, new.end_time);
+  return new;
+end
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER temporal_coverage_index_range BEFORE INSERT OR UPDATE OF start_time, end_time
+    ON temporal_coverage_index FOR EACH ROW EXECUTE PROCEDURE temporal_coverage_index_range_trigger();
+
 
 
 -- SPATIAL_COVERAGE_INDEX
@@ -316,6 +529,157 @@ CREATE UNIQUE INDEX idx_spatial_coverage_index_spatial_coverage_indexed_id ON pu
 DROP INDEX IF EXISTS idx_spatial_coverage_index_spatial_coverage;
 CREATE INDEX idx_spatial_coverage_index_spatial_coverage ON public.spatial_coverage_index USING gist (spatial_coverage);
 
+
+
+-- SPATIAL_GRID_CELLS: quadkeys of the web map tiles covering datasets and spatial_coverage_index entries
+-- ix_spatial_grid_cells_cell: cells of a tile are a range of its quadkey prefix
+DROP INDEX IF EXISTS ix_spatial_grid_cells_cell;
+CREATE INDEX ix_spatial_grid_cells_cell ON public.spatial_grid_cells USING btree (cell text_pattern_ops, indexed_type);
+
+-- Quadkey of tile (x, y) of zoom level z
+CREATE OR REPLACE FUNCTION grid_cell_quadkey(x integer, y integer, z integer) RETURNS text AS $$
+  -- bitwise operators share one precedence and associate left to right
+  SELECT coalesce(string_agg((((x >> (z - i)) & 1) | (((y >> (z - i)) & 1) << 1))::text, '' ORDER BY i), '')
+  FROM generate_series(1, z) AS i;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Web Mercator (SRID 3857) envelope of the tile of a quadkey
+CREATE OR REPLACE FUNCTION grid_cell_envelope(cell text) RETURNS geometry AS $$
+  SELECT ST_TileEnvelope(length(cell),
+                         coalesce(sum((substr(cell, i, 1)::integer & 1) << (length(cell) - i)), 0)::integer,
+                         coalesce(sum((substr(cell, i, 1)::integer >> 1) << (length(cell) - i)), 0)::integer)
+  FROM generate_series(1, length(cell)) AS i;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Quadkeys of the tiles covering a geometry (SRID 4326): tiles the geometry covers are kept whole, tiles it only
+-- crosses are split until max_level, or until splitting them would exceed max_cells. Points get their tile of
+-- max_level. Latitudes beyond the web map (+/-85.05 degrees) are left out.
+CREATE OR REPLACE FUNCTION spatial_grid_cover(geom geometry, max_level integer DEFAULT 16, max_cells integer DEFAULT 32)
+    RETURNS SETOF text AS $$
+declare
+  half_world constant double precision := 20037508.342789244;
+  world constant geometry := ST_MakeEnvelope(-180, -85.0511287798, 180, 85.0511287798, 4326);
+  shape geometry;
+  cells text[] := ARRAY[''];
+  partial text[];
+  cell text;
+  child text;
+  envelope geometry;
+  covered integer := 0;
+  level integer := 0;
+  tiles integer;
+begin
+  IF geom IS NULL OR ST_IsEmpty(geom) THEN
+    RETURN;
+  END IF;
+
+  IF GeometryType(geom) = 'POINT' THEN
+    IF abs(ST_Y(geom)) > 85.0511287798 THEN
+      RETURN;
+    END IF;
+    shape := ST_Transform(ST_SetSRID(geom, 4326), 3857);
+    tiles := 1 << max_level;
+    RETURN NEXT grid_cell_quadkey(
+      greatest(least(floor((ST_X(shape) + half_world) / (2 * half_world) * tiles)::integer, tiles - 1), 0),
+      greatest(least(floor((half_world - ST_Y(shape)) / (2 * half_world) * tiles)::integer, tiles - 1), 0),
+      max_level);
+    RETURN;
+  END IF;
+
+  BEGIN
+    shape := ST_Intersection(ST_SetSRID(geom, 4326), world);
+  EXCEPTION WHEN others THEN
+    -- an invalid geometry is covered by its bounding box rather than failing the write that indexes it
+    shape := ST_Intersection(ST_Envelope(ST_SetSRID(geom, 4326)), world);
+  END;
+  IF ST_IsEmpty(shape) THEN
+    RETURN;
+  END IF;
+  -- ST_Covers does not take geometry collections
+  shape := ST_CollectionHomogenize(shape);
+  IF GeometryType(shape) = 'GEOMETRYCOLLECTION' THEN
+    shape := ST_Envelope(shape);
+  END IF;
+  shape := ST_Transform(shape, 3857);
+
+  WHILE level < max_level AND covered + 4 * array_length(cells, 1) <= max_cells LOOP
+    partial := ARRAY[]::text[];
+    FOREACH cell IN ARRAY cells LOOP
+      FOREACH child IN ARRAY ARRAY[cell || '0', cell || '1', cell || '2', cell || '3'] LOOP
+        envelope := grid_cell_envelope(child);
+        IF ST_Covers(shape, envelope) THEN
+          covered := covered + 1;
+          RETURN NEXT child;
+        ELSIF ST_Intersects(shape, envelope) THEN
+          partial := partial || child;
+        END IF;
+      END LOOP;
+    END LOOP;
+
+    cells := partial;
+    level := level + 1;
+    IF array_length(cells, 1) IS NULL THEN
+      RETURN;
+    END IF;
+  END LOOP;
+
+  RETURN QUERY SELECT unnest(cells);
+end
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_spatial_grid_cells(target_type varchar, target uuid, coverage geometry)
+    RETURNS void AS $$
+  DELETE FROM public.spatial_grid_cells WHERE indexed_type = target_type AND indexed_id = target;
+  INSERT INTO public.spatial_grid_cells (indexed_type, indexed_id, cell)
+  SELECT DISTINCT target_type, target, cell FROM spatial_grid_cover(coverage) AS cell;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION spatial_coverage_index_grid_cells_trigger() RETURNS trigger AS $$
+begin
+  -- OLD and NEW are only read in the operations that assign them
+  IF tg_op = 'DELETE' THEN
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = old.indexed_type AND indexed_id = old.indexed_id;
+    RETURN NULL;
+  END IF;
+  IF tg_op = 'UPDATE' THEN
+    IF old.indexed_type = new.indexed_type AND old.indexed_id = new.indexed_id
+        AND old.spatial_coverage IS NOT DISTINCT FROM new.spatial_coverage THEN
+      RETURN NULL;
+    END IF;
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = old.indexed_type AND indexed_id = old.indexed_id;
+  END IF;
+  PERFORM refresh_spatial_grid_cells(new.indexed_type, new.indexed_id, new.spatial_coverage);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS spatial_coverage_index_grid_cells ON public.spatial_coverage_index;
+CREATE TRIGGER spatial_coverage_index_grid_cells AFTER INSERT OR DELETE OR UPDATE OF indexed_type, indexed_id, spatial_coverage
+    ON public.spatial_coverage_index FOR EACH ROW EXECUTE PROCEDURE spatial_coverage_index_grid_cells_trigger();
+
+CREATE OR REPLACE FUNCTION datasets_grid_cells_trigger() RETURNS trigger AS $$
+begin
+  IF tg_op = 'DELETE' THEN
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = 'DATASET' AND indexed_id = old.id;
+    RETURN NULL;
+  END IF;
+  -- syncs rewrite the coverage of every dataset; unchanged ones keep their cells
+  IF tg_op = 'UPDATE' THEN
+    IF old.spatial_coverage IS NOT DISTINCT FROM new.spatial_coverage THEN
+      RETURN NULL;
+    END IF;
+  END IF;
+  PERFORM refresh_spatial_grid_cells('DATASET', new.id, new.spatial_coverage);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS datasets_grid_cells ON public.datasets;
+CREATE TRIGGER datasets_grid_cells AFTER INSERT OR DELETE OR UPDATE OF spatial_coverage
+    ON public.datasets FOR EACH ROW EXECUTE PROCEDURE datasets_grid_cells_trigger();
+
+
+
 ALTER TABLE "public"."datasets" ADD FOREIGN KEY ("provenance_id") REFERENCES "public"."provenance"("id");
 ALTER TABLE "public"."resources" ADD FOREIGN KEY ("provenance_id") REFERENCES "public"."provenance"("id");
 ALTER TABLE "public"."resources" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id");
@@ -324,3 +688,4 @@ ALTER TABLE "public"."resources_variables" ADD FOREIGN KEY ("variable_id") REFER
 ALTER TABLE "public"."variables" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id");
 ALTER TABLE "public"."variables_standard_variables" ADD FOREIGN KEY ("variable_id") REFERENCES "public"."variables"("id");
 ALTER TABLE "public"."variables_standard_variables" ADD FOREIGN KEY ("standard_variable_id") REFERENCES "public"."standard_variables"("id");
+ALTER TABLE "public"."dataset_search_documents" ADD FOREIGN KEY ("dataset_id") REFERENCES "public"."datasets"("id") ON DELETE CASCADE;
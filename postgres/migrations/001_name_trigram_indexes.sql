@@ -0,0 +1,19 @@
+-- Trigram indexes serving the name filters of /find_datasets, /datasets/find and /standard_variables/find
+-- (dataset_names__in, standard_variable_names__in, name__in), which match names with ILIKE '%...%' before the
+-- word-boundary regex recheck.
+--
+-- Built CONCURRENTLY so a running catalog keeps accepting registrations; run outside a transaction:
+--     docker exec dcat_postgresql psql -U POSTGRES_USER -d POSTGRES_DB -f /migrations/001_name_trigram_indexes.sql
+
+create extension if not exists pg_trgm;
+
+-- ix_datasets_name_trgm
+DROP INDEX CONCURRENTLY IF EXISTS ix_datasets_name_trgm;
+CREATE INDEX CONCURRENTLY ix_datasets_name_trgm ON public.datasets USING gin (name gin_trgm_ops);
+
+-- ix_standard_variables_name_trgm
+DROP INDEX CONCURRENTLY IF EXISTS ix_standard_variables_name_trgm;
+CREATE INDEX CONCURRENTLY ix_standard_variables_name_trgm ON public.standard_variables USING gin (name gin_trgm_ops);
+
+ANALYZE public.datasets;
+ANALYZE public.standard_variables;
@@ -0,0 +1,13 @@
+-- Events table holding the catalog change feed: controllers that modify the catalog record a 'catalog_change' event
+-- in the same transaction, and every API process reads recent ones to invalidate its result cache.
+
+CREATE TABLE IF NOT EXISTS "public"."events" (
+    "id" uuid NOT NULL,
+    "timestamp" timestamp NOT NULL DEFAULT now(),
+    "event_type" varchar NOT NULL,
+    "event_value" jsonb,
+    PRIMARY KEY ("id")
+);
+
+-- ix_events_event_type_timestamp
+CREATE INDEX IF NOT EXISTS ix_events_event_type_timestamp ON public.events USING btree (event_type, timestamp);
@@ -0,0 +1,21 @@
+-- Precomputed 'source' flag of datasets: keyword searches rank datasets with a source first among equally relevant
+-- ones, and read it from this column rather than probing json_metadata of every match.
+
+ALTER TABLE public.datasets ADD COLUMN IF NOT EXISTS "has_source" boolean NOT NULL DEFAULT false;
+
+CREATE OR REPLACE FUNCTION datasets_tsv_trigger() RETURNS trigger AS $$
+begin
+  new.tsv :=
+     setweight(to_tsvector('pg_catalog.english', coalesce(new.name,'')), 'A') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(new.json_metadata->>'tags', '')), 'B') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(new.variables_list, '')), 'D') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(new.standard_variables_list, '')), 'C') ||
+     setweight(to_tsvector('pg_catalog.english', coalesce(new.description,'')), 'D');
+  -- ranks datasets with a source first among equally relevant ones, without reading json_metadata
+  new.has_source := new.json_metadata ? 'source';
+  return new;
+end
+$$ LANGUAGE plpgsql;
+
+-- Only datasets with a source differ from the default; the update runs the trigger, which sets the flag
+UPDATE public.datasets SET has_source = true WHERE json_metadata ? 'source' AND NOT has_source;
@@ -0,0 +1,188 @@
+-- Full-text documents of datasets, maintained incrementally. Searches used datasets.tsv, which only picked up
+-- variable and standard variable names when a sync rewrote every dataset row; documents are now marked stale by
+-- triggers on datasets, variables, variables_standard_variables and standard_variables, and rebuilt when the
+-- transaction making the change commits.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS "public"."dataset_search_documents" (
+    "dataset_id" uuid NOT NULL REFERENCES "public"."datasets"("id") ON DELETE CASCADE,
+    "variables_text" text NOT NULL DEFAULT '',
+    "standard_variables_text" text NOT NULL DEFAULT '',
+    "tsv" tsvector,
+    "stale" boolean NOT NULL DEFAULT true,
+    "updated_at" timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY ("dataset_id")
+);
+
+CREATE OR REPLACE FUNCTION dataset_search_document_tsv(name text, tags text, variables_text text,
+                                                       standard_variables_text text, description text)
+    RETURNS tsvector AS $$
+  SELECT
+     setweight(to_tsvector('pg_catalog.english', coalesce(name, '')), 'A') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(tags, '')), 'B') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(variables_text, '')), 'D') ||
+       setweight(to_tsvector('pg_catalog.english', coalesce(standard_variables_text, '')), 'C') ||
+     setweight(to_tsvector('pg_catalog.english', coalesce(description, '')), 'D');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Mark the document of a dataset stale; it is rebuilt once, when the transaction commits
+CREATE OR REPLACE FUNCTION mark_dataset_search_document(target uuid) RETURNS void AS $$
+begin
+  IF target IS NULL THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO dataset_search_documents (dataset_id, stale) VALUES (target, true)
+  ON CONFLICT (dataset_id) DO UPDATE SET stale = true WHERE NOT dataset_search_documents.stale;
+end
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_dataset_search_document() RETURNS trigger AS $$
+declare
+  document_variables text;
+  document_standard_variables text;
+begin
+  -- Every change of the transaction queued a refresh; the first one rebuilds the document
+  IF NOT EXISTS (SELECT 1 FROM dataset_search_documents WHERE dataset_id = new.dataset_id AND stale) THEN
+    RETURN NULL;
+  END IF;
+
+  SELECT string_agg(variables.name, ',' ORDER BY variables.name) INTO document_variables
+  FROM variables
+  WHERE variables.dataset_id = new.dataset_id;
+
+  SELECT string_agg(standard_variables.name, ',' ORDER BY standard_variables.name) INTO document_standard_variables
+  FROM variables
+  JOIN variables_standard_variables ON variables_standard_variables.variable_id = variables.id
+  JOIN standard_variables ON standard_variables.id = variables_standard_variables.standard_variable_id
+  WHERE variables.dataset_id = new.dataset_id;
+
+  UPDATE dataset_search_documents
+  SET variables_text = coalesce(document_variables, ''),
+      standard_variables_text = coalesce(document_standard_variables, ''),
+      tsv = dataset_search_document_tsv(datasets.name, datasets.json_metadata->>'tags', document_variables,
+                                        document_standard_variables, datasets.description),
+      stale = false,
+      updated_at = now()
+  FROM datasets
+  WHERE dataset_search_documents.dataset_id = new.dataset_id AND datasets.id = new.dataset_id;
+
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dataset_search_documents_refresh ON public.dataset_search_documents;
+CREATE CONSTRAINT TRIGGER dataset_search_documents_refresh AFTER INSERT OR UPDATE
+    ON dataset_search_documents DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW WHEN (new.stale) EXECUTE PROCEDURE refresh_dataset_search_document();
+
+CREATE OR REPLACE FUNCTION datasets_search_document_trigger() RETURNS trigger AS $$
+begin
+  PERFORM mark_dataset_search_document(new.id);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS datasets_search_document_insert ON public.datasets;
+CREATE TRIGGER datasets_search_document_insert AFTER INSERT
+    ON datasets FOR EACH ROW EXECUTE PROCEDURE datasets_search_document_trigger();
+
+-- Syncs rewrite json_metadata of every dataset; only a change of the indexed fields dirties a document
+DROP TRIGGER IF EXISTS datasets_search_document_update ON public.datasets;
+CREATE TRIGGER datasets_search_document_update AFTER UPDATE OF name, description, json_metadata
+    ON datasets FOR EACH ROW
+    WHEN (old.name IS DISTINCT FROM new.name OR old.description IS DISTINCT FROM new.description
+          OR old.json_metadata->'tags' IS DISTINCT FROM new.json_metadata->'tags')
+    EXECUTE PROCEDURE datasets_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM mark_dataset_search_document(old.dataset_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM mark_dataset_search_document(new.dataset_id);
+  END IF;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS variables_search_document ON public.variables;
+CREATE TRIGGER variables_search_document AFTER INSERT OR DELETE OR UPDATE OF name, dataset_id
+    ON variables FOR EACH ROW EXECUTE PROCEDURE variables_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION variables_standard_variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM mark_dataset_search_document((SELECT dataset_id FROM variables WHERE id = old.variable_id));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM mark_dataset_search_document((SELECT dataset_id FROM variables WHERE id = new.variable_id));
+  END IF;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS variables_standard_variables_search_document ON public.variables_standard_variables;
+CREATE TRIGGER variables_standard_variables_search_document AFTER INSERT OR DELETE OR UPDATE
+    ON variables_standard_variables FOR EACH ROW EXECUTE PROCEDURE variables_standard_variables_search_document_trigger();
+
+CREATE OR REPLACE FUNCTION standard_variables_search_document_trigger() RETURNS trigger AS $$
+begin
+  PERFORM mark_dataset_search_document(linked.dataset_id)
+  FROM (
+    SELECT DISTINCT variables.dataset_id
+    FROM variables_standard_variables
+    JOIN variables ON variables.id = variables_standard_variables.variable_id
+    WHERE variables_standard_variables.standard_variable_id = new.id
+  ) AS linked;
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS standard_variables_search_document ON public.standard_variables;
+CREATE TRIGGER standard_variables_search_document AFTER UPDATE OF name
+    ON standard_variables FOR EACH ROW WHEN (old.name IS DISTINCT FROM new.name)
+    EXECUTE PROCEDURE standard_variables_search_document_trigger();
+
+-- Documents of the existing datasets, built in one pass; changes committed meanwhile already have theirs
+INSERT INTO dataset_search_documents (dataset_id, variables_text, standard_variables_text, tsv, stale)
+SELECT datasets.id,
+       coalesce(dataset_variables.names, ''),
+       coalesce(dataset_standard_variables.names, ''),
+       dataset_search_document_tsv(datasets.name, datasets.json_metadata->>'tags', dataset_variables.names,
+                                   dataset_standard_variables.names, datasets.description),
+       false
+FROM datasets
+LEFT JOIN (
+    SELECT variables.dataset_id, string_agg(variables.name, ',' ORDER BY variables.name) AS names
+    FROM variables
+    GROUP BY variables.dataset_id
+) AS dataset_variables ON dataset_variables.dataset_id = datasets.id
+LEFT JOIN (
+    SELECT variables.dataset_id, string_agg(standard_variables.name, ',' ORDER BY standard_variables.name) AS names
+    FROM variables
+    JOIN variables_standard_variables ON variables_standard_variables.variable_id = variables.id
+    JOIN standard_variables ON standard_variables.id = variables_standard_variables.standard_variable_id
+    GROUP BY variables.dataset_id
+) AS dataset_standard_variables ON dataset_standard_variables.dataset_id = datasets.id
+ON CONFLICT (dataset_id) DO NOTHING;
+
+-- dataset_search_documents_tsv_idx
+CREATE INDEX IF NOT EXISTS dataset_search_documents_tsv_idx ON public.dataset_search_documents USING gin (tsv);
+
+-- datasets.tsv is no longer read, and its variable names, from variables_list and standard_variables_list, are no longer
+-- kept up to date: drop it rather than compute it on every datasets write, syncs included
+CREATE OR REPLACE FUNCTION datasets_tsv_trigger() RETURNS trigger AS $$
+begin
+  -- ranks datasets with a source first among equally relevant ones, without reading json_metadata
+  new.has_source := new.json_metadata ? 'source';
+  return new;
+end
+$$ LANGUAGE plpgsql;
+
+DROP INDEX IF EXISTS tsv_idx;
+ALTER TABLE public.datasets DROP COLUMN IF EXISTS "tsv";
+
+COMMIT;
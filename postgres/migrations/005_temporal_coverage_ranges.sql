@@ -0,0 +1,75 @@
+-- Range-typed temporal coverage of datasets and of the temporal index of resources, kept by triggers from their start
+-- and end columns on registration, update and sync. Temporal filters are range overlap and containment tests on GiST
+-- indexes; datasets also get a GiST index over their spatial and temporal coverage, so "overlaps this period and this
+-- region" is answered by a single index scan.
+
+BEGIN;
+
+-- Open-ended on the side of an unknown bound: a coverage with only a start is ongoing, and one with only an end has no
+-- known beginning. NULL when both bounds are unknown, or when they are inverted: such a coverage matches no temporal
+-- filter. Comparisons of the start and end columns never matched an unknown bound, so filters on the side of one now
+-- match where they did not; the migration reports how many coverages are affected.
+CREATE OR REPLACE FUNCTION temporal_coverage_range(start_time timestamp, end_time timestamp) RETURNS tsrange AS $$
+  SELECT CASE WHEN start_time IS NULL AND end_time IS NULL THEN NULL
+              WHEN start_time > end_time THEN NULL
+              ELSE tsrange(start_time, end_time, '[]') END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION datasets_tsv_trigger() RETURNS trigger AS $$
+begin
+  -- ranks datasets with a source first among equally relevant ones, without reading json_metadata
+  new.has_source := new.json_metadata ? 'source';
+  new.temporal_coverage := temporal_coverage_range(new.temporal_coverage_start, new.temporal_coverage_end);
+  return new;
+end
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE public.temporal_coverage_index ADD COLUMN IF NOT EXISTS "temporal_coverage" tsrange;
+
+CREATE OR REPLACE FUNCTION temporal_coverage_index_range_trigger() RETURNS trigger AS $$
+begin
+  new.temporal_coverage := temporal_coverage_range(new.start_time, new.end_time);
+  return new;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS temporal_coverage_index_range ON public.temporal_coverage_index;
+CREATE TRIGGER temporal_coverage_index_range BEFORE INSERT OR UPDATE OF start_time, end_time
+    ON public.temporal_coverage_index FOR EACH ROW EXECUTE PROCEDURE temporal_coverage_index_range_trigger();
+
+-- Coverages whose meaning for temporal filters changes with the range
+DO $$
+declare
+  open_ended integer;
+  inverted integer;
+begin
+  SELECT count(*) FILTER (WHERE (temporal_coverage_start IS NULL) <> (temporal_coverage_end IS NULL)),
+         count(*) FILTER (WHERE temporal_coverage_start > temporal_coverage_end)
+  INTO open_ended, inverted FROM public.datasets;
+  RAISE NOTICE 'datasets: % open-ended temporal coverages, % inverted (matched by no temporal filter)',
+      open_ended, inverted;
+
+  SELECT count(*) FILTER (WHERE (start_time IS NULL) <> (end_time IS NULL)),
+         count(*) FILTER (WHERE start_time > end_time)
+  INTO open_ended, inverted FROM public.temporal_coverage_index;
+  RAISE NOTICE 'temporal_coverage_index: % open-ended temporal coverages, % inverted (matched by no temporal filter)',
+      open_ended, inverted;
+end
+$$;
+
+-- Backfill
+UPDATE public.datasets
+SET temporal_coverage = temporal_coverage_range(temporal_coverage_start, temporal_coverage_end)
+WHERE temporal_coverage IS DISTINCT FROM temporal_coverage_range(temporal_coverage_start, temporal_coverage_end);
+
+UPDATE public.temporal_coverage_index
+SET temporal_coverage = temporal_coverage_range(start_time, end_time)
+WHERE temporal_coverage IS DISTINCT FROM temporal_coverage_range(start_time, end_time);
+
+CREATE INDEX IF NOT EXISTS datasets_temporal_coverage_gix ON public.datasets USING gist (temporal_coverage);
+CREATE INDEX IF NOT EXISTS datasets_spatial_temporal_gix ON public.datasets
+    USING gist (spatial_coverage, temporal_coverage);
+CREATE INDEX IF NOT EXISTS ix_temporal_coverage_index_temporal_coverage ON public.temporal_coverage_index
+    USING gist (temporal_coverage);
+
+COMMIT;
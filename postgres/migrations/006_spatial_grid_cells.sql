@@ -0,0 +1,174 @@
+-- Discrete spatial index: the coverage of every dataset and spatial_coverage_index entry (resources) mapped to the
+-- quadkeys of the web map tiles that cover it. A quadkey names a tile of zoom level n with n digits 0-3, each one
+-- choosing a quarter of its parent tile, so the tiles inside a tile share its quadkey as prefix and the tiles
+-- containing it are its prefixes. Cells are kept by triggers on registration, update, sync and deletion, and answer
+-- cell lookups and counts per tile without geometry math.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS "public"."spatial_grid_cells" (
+    -- DATASET, or the indexed_type of the spatial_coverage_index entry (RESOURCE)
+    "indexed_type" varchar NOT NULL,
+    "indexed_id" uuid NOT NULL,
+    "cell" text NOT NULL,
+    PRIMARY KEY ("indexed_type", "indexed_id", "cell")
+);
+
+-- Quadkey of tile (x, y) of zoom level z
+CREATE OR REPLACE FUNCTION grid_cell_quadkey(x integer, y integer, z integer) RETURNS text AS $$
+  -- bitwise operators share one precedence and associate left to right
+  SELECT coalesce(string_agg((((x >> (z - i)) & 1) | (((y >> (z - i)) & 1) << 1))::text, '' ORDER BY i), '')
+  FROM generate_series(1, z) AS i;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Web Mercator (SRID 3857) envelope of the tile of a quadkey
+CREATE OR REPLACE FUNCTION grid_cell_envelope(cell text) RETURNS geometry AS $$
+  SELECT ST_TileEnvelope(length(cell),
+                         coalesce(sum((substr(cell, i, 1)::integer & 1) << (length(cell) - i)), 0)::integer,
+                         coalesce(sum((substr(cell, i, 1)::integer >> 1) << (length(cell) - i)), 0)::integer)
+  FROM generate_series(1, length(cell)) AS i;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Quadkeys of the tiles covering a geometry (SRID 4326): tiles the geometry covers are kept whole, tiles it only
+-- crosses are split until max_level, or until splitting them would exceed max_cells. Points get their tile of
+-- max_level. Latitudes beyond the web map (+/-85.05 degrees) are left out.
+CREATE OR REPLACE FUNCTION spatial_grid_cover(geom geometry, max_level integer DEFAULT 16, max_cells integer DEFAULT 32)
+    RETURNS SETOF text AS $$
+declare
+  half_world constant double precision := 20037508.342789244;
+  world constant geometry := ST_MakeEnvelope(-180, -85.0511287798, 180, 85.0511287798, 4326);
+  shape geometry;
+  cells text[] := ARRAY[''];
+  partial text[];
+  cell text;
+  child text;
+  envelope geometry;
+  covered integer := 0;
+  level integer := 0;
+  tiles integer;
+begin
+  IF geom IS NULL OR ST_IsEmpty(geom) THEN
+    RETURN;
+  END IF;
+
+  IF GeometryType(geom) = 'POINT' THEN
+    IF abs(ST_Y(geom)) > 85.0511287798 THEN
+      RETURN;
+    END IF;
+    shape := ST_Transform(ST_SetSRID(geom, 4326), 3857);
+    tiles := 1 << max_level;
+    RETURN NEXT grid_cell_quadkey(
+      greatest(least(floor((ST_X(shape) + half_world) / (2 * half_world) * tiles)::integer, tiles - 1), 0),
+      greatest(least(floor((half_world - ST_Y(shape)) / (2 * half_world) * tiles)::integer, tiles - 1), 0),
+      max_level);
+    RETURN;
+  END IF;
+
+  BEGIN
+    shape := ST_Intersection(ST_SetSRID(geom, 4326), world);
+  EXCEPTION WHEN others THEN
+    -- an invalid geometry is covered by its bounding box rather than failing the write that indexes it
+    shape := ST_Intersection(ST_Envelope(ST_SetSRID(geom, 4326)), world);
+  END;
+  IF ST_IsEmpty(shape) THEN
+    RETURN;
+  END IF;
+  -- ST_Covers does not take geometry collections
+  shape := ST_CollectionHomogenize(shape);
+  IF GeometryType(shape) = 'GEOMETRYCOLLECTION' THEN
+    shape := ST_Envelope(shape);
+  END IF;
+  shape := ST_Transform(shape, 3857);
+
+  WHILE level < max_level AND covered + 4 * array_length(cells, 1) <= max_cells LOOP
+    partial := ARRAY[]::text[];
+    FOREACH cell IN ARRAY cells LOOP
+      FOREACH child IN ARRAY ARRAY[cell || '0', cell || '1', cell || '2', cell || '3'] LOOP
+        envelope := grid_cell_envelope(child);
+        IF ST_Covers(shape, envelope) THEN
+          covered := covered + 1;
+          RETURN NEXT child;
+        ELSIF ST_Intersects(shape, envelope) THEN
+          partial := partial || child;
+        END IF;
+      END LOOP;
+    END LOOP;
+
+    cells := partial;
+    level := level + 1;
+    IF array_length(cells, 1) IS NULL THEN
+      RETURN;
+    END IF;
+  END LOOP;
+
+  RETURN QUERY SELECT unnest(cells);
+end
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_spatial_grid_cells(target_type varchar, target uuid, coverage geometry)
+    RETURNS void AS $$
+  DELETE FROM public.spatial_grid_cells WHERE indexed_type = target_type AND indexed_id = target;
+  INSERT INTO public.spatial_grid_cells (indexed_type, indexed_id, cell)
+  SELECT DISTINCT target_type, target, cell FROM spatial_grid_cover(coverage) AS cell;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION spatial_coverage_index_grid_cells_trigger() RETURNS trigger AS $$
+begin
+  -- OLD and NEW are only read in the operations that assign them
+  IF tg_op = 'DELETE' THEN
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = old.indexed_type AND indexed_id = old.indexed_id;
+    RETURN NULL;
+  END IF;
+  IF tg_op = 'UPDATE' THEN
+    IF old.indexed_type = new.indexed_type AND old.indexed_id = new.indexed_id
+        AND old.spatial_coverage IS NOT DISTINCT FROM new.spatial_coverage THEN
+      RETURN NULL;
+    END IF;
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = old.indexed_type AND indexed_id = old.indexed_id;
+  END IF;
+  PERFORM refresh_spatial_grid_cells(new.indexed_type, new.indexed_id, new.spatial_coverage);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS spatial_coverage_index_grid_cells ON public.spatial_coverage_index;
+CREATE TRIGGER spatial_coverage_index_grid_cells AFTER INSERT OR DELETE OR UPDATE OF indexed_type, indexed_id, spatial_coverage
+    ON public.spatial_coverage_index FOR EACH ROW EXECUTE PROCEDURE spatial_coverage_index_grid_cells_trigger();
+
+CREATE OR REPLACE FUNCTION datasets_grid_cells_trigger() RETURNS trigger AS $$
+begin
+  IF tg_op = 'DELETE' THEN
+    DELETE FROM public.spatial_grid_cells WHERE indexed_type = 'DATASET' AND indexed_id = old.id;
+    RETURN NULL;
+  END IF;
+  -- syncs rewrite the coverage of every dataset; unchanged ones keep their cells
+  IF tg_op = 'UPDATE' THEN
+    IF old.spatial_coverage IS NOT DISTINCT FROM new.spatial_coverage THEN
+      RETURN NULL;
+    END IF;
+  END IF;
+  PERFORM refresh_spatial_grid_cells('DATASET', new.id, new.spatial_coverage);
+  RETURN NULL;
+end
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS datasets_grid_cells ON public.datasets;
+CREATE TRIGGER datasets_grid_cells AFTER INSERT OR DELETE OR UPDATE OF spatial_coverage
+    ON public.datasets FOR EACH ROW EXECUTE PROCEDURE datasets_grid_cells_trigger();
+
+-- Backfill
+INSERT INTO public.spatial_grid_cells (indexed_type, indexed_id, cell)
+SELECT DISTINCT 'DATASET', datasets.id, cell
+FROM public.datasets, spatial_grid_cover(datasets.spatial_coverage) AS cell
+ON CONFLICT DO NOTHING;
+
+INSERT INTO public.spatial_grid_cells (indexed_type, indexed_id, cell)
+SELECT DISTINCT spatial_coverage_index.indexed_type, spatial_coverage_index.indexed_id, cell
+FROM public.spatial_coverage_index, spatial_grid_cover(spatial_coverage_index.spatial_coverage) AS cell
+ON CONFLICT DO NOTHING;
+
+-- ix_spatial_grid_cells_cell: cells of a tile are a range of its quadkey prefix
+CREATE INDEX IF NOT EXISTS ix_spatial_grid_cells_cell ON public.spatial_grid_cells
+    USING btree (cell text_pattern_ops, indexed_type);
+
+COMMIT;